@@ -1,75 +1,317 @@
+import email.utils
+import logging
+import random
+import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
 from config import Config
 
-class APIForwarder:
-    """Forward signals to the Mathematricks API"""
+logger = logging.getLogger(__name__)
+
+
+class ForwarderBase:
+    """
+    Retry, backoff and response handling of the signal forwarders
+
+    Makes no requests itself: APIForwarder (requests) and the async engine's
+    AsyncAPIForwarder (aiohttp) only add the transport, so both engines
+    validate, retry and report sends the same way.
+    """
 
-    def __init__(self):
+    # Status codes worth retrying (rate limiting and server errors)
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    # Fields every payload must carry
+    REQUIRED_FIELDS = ['strategy_name', 'signal_sent_EPOCH', 'signalID', 'passphrase', 'signal']
+
+    def __init__(self, stats=None):
+        """
+        Args:
+            stats: Optional PipelineStats receiving per-attempt latency and retry counts
+        """
         self.api_url = Config.MATHEMATRICKS_API_URL
+        self.timeout = (Config.API_CONNECT_TIMEOUT, Config.API_READ_TIMEOUT)
+        self.max_retries = Config.API_MAX_RETRIES
+        self.stats = stats
+
+    def max_send_time(self):
+        """
+        Upper bound on how long send_signal can take, including retries
+
+        Returns:
+            float: Seconds
+        """
+        attempts = self.max_retries + 1
+        return attempts * sum(self.timeout) + self.max_retries * Config.API_BACKOFF_MAX
+
+    def _check_payload(self, payload):
+        """
+        Validate a payload before the first attempt
+
+        Returns:
+            dict: Error response, or None if the payload can be sent
+        """
+        missing_fields = [field for field in self.REQUIRED_FIELDS if field not in payload]
+
+        if missing_fields:
+            return {
+                'error': f"Missing required fields: {', '.join(missing_fields)}",
+                'retryable': False
+            }
+
+        return None
+
+    def _retry_delay(self, payload, attempt, success, retry_after):
+        """
+        Decide whether to make another attempt
+
+        Args:
+            payload: Signal payload
+            attempt: Zero-based number of the attempt that just finished
+            success: Whether it succeeded
+            retry_after: retry_after returned by _attempt
+
+        Returns:
+            float: Seconds to wait before the next attempt, or None to stop
+        """
+        if success or retry_after is None or attempt == self.max_retries:
+            return None
+
+        self._increment('forward_retries')
+        delay = self._backoff_delay(attempt, retry_after)
+        logger.info("Retrying signal %s in %.2fs (attempt %d/%d)",
+                    payload['signalID'], delay, attempt + 2, self.max_retries + 1)
+        return delay
+
+    def _request_failed(self, record, start, attempts, error_msg, retry):
+        """
+        Outcome of an attempt that got no response
+
+        Args:
+            record: Attempt record
+            start: perf_counter() value when the attempt started
+            attempts: List the attempt record is appended to
+            error_msg: Error description
+            retry: Whether the error is worth retrying (timeouts, connection errors)
+
+        Returns:
+            tuple: Same as _attempt
+        """
+        logger.warning("Error sending signal: %s", error_msg)
+        self._finish_attempt(record, start, attempts, error=error_msg)
+        return False, {'error': error_msg, 'retryable': retry}, 0 if retry else None
+
+    def _response_outcome(self, payload, record, start, attempts, status_code, text, retry_after):
+        """
+        Outcome of an attempt that got a response
+
+        Args:
+            payload: Signal payload
+            record: Attempt record
+            start: perf_counter() value when the attempt started
+            attempts: List the attempt record is appended to
+            status_code: HTTP status code
+            text: Response body
+            retry_after: Retry-After header value, if any
+
+        Returns:
+            tuple: Same as _attempt
+        """
+        self._finish_attempt(record, start, attempts, status_code=status_code)
+
+        if status_code == 200:
+            logger.debug("Signal %s sent successfully", payload['signalID'])
+            return True, {
+                'status': 'success',
+                'signal_id': payload['signalID'],
+                'response': text
+            }, None
+
+        error_msg = f"API returned status code {status_code}: {text}"
+        logger.warning("Error sending signal: %s", error_msg)
+        result = {
+            'error': error_msg,
+            'status_code': status_code,
+            'retryable': status_code in self.RETRY_STATUS_CODES
+        }
+
+        if not result['retryable']:
+            return False, result, None
+
+        return False, result, self._parse_retry_after(retry_after)
+
+    def _finish_attempt(self, record, start, attempts, **fields):
+        """Record latency and outcome of an attempt"""
+        latency = time.perf_counter() - start
+        record['latency_ms'] = round(latency * 1000, 3)
+        record.update(fields)
+        attempts.append(record)
+
+        if self.stats is not None:
+            self.stats.record('forward_attempt', latency)
+            self.stats.increment('forward_attempts')
+            if fields.get('status_code') != 200:
+                self.stats.increment('forward_attempt_failures')
+
+    def _backoff_delay(self, attempt, retry_after):
+        """
+        Compute the delay before the next attempt
 
-    def send_signal(self, payload):
+        Args:
+            attempt: Zero-based number of the attempt that just failed
+            retry_after: Server-requested delay in seconds (0 if none)
+
+        Returns:
+            float: Seconds to sleep
+        """
+        if retry_after:
+            return min(retry_after, Config.API_BACKOFF_MAX)
+
+        # Exponential backoff with full jitter
+        ceiling = min(Config.API_BACKOFF_MAX, Config.API_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    @staticmethod
+    def _parse_retry_after(value):
+        """
+        Parse a Retry-After header (delta seconds or HTTP date)
+
+        Returns:
+            float: Delay in seconds, or 0 if absent or unparseable
+        """
+        if not value:
+            return 0
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0
+
+    def _increment(self, name):
+        """Increment a stats counter if stats are attached"""
+        if self.stats is not None:
+            self.stats.increment(name)
+
+
+class APIForwarder(ForwarderBase):
+    """Forward signals to the Mathematricks API"""
+
+    # Endpoint hosts whose connection pools are kept open at once
+    ENDPOINT_POOLS = 10
+
+    def __init__(self, stats=None):
+        """
+        Args:
+            stats: Optional PipelineStats receiving per-attempt latency and retry counts
+        """
+        super().__init__(stats)
+        self.session = self._create_session()
+
+    def _create_session(self):
+        """
+        Create a pooled keep-alive session so signals reuse TCP/TLS connections
+
+        Returns:
+            requests.Session: Configured session
+        """
+        session = requests.Session()
+
+        # Retries are handled in send_signal so that Retry-After and jitter apply;
+        # one connection pool is kept per endpoint host routing rules send to
+        adapter = HTTPAdapter(
+            pool_connections=self.ENDPOINT_POOLS,
+            pool_maxsize=Config.API_POOL_SIZE,
+            max_retries=0
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        })
+
+        return session
+
+    def send_signal(self, payload, api_url=None):
         """
         Send signal to Mathematricks API
 
+        Timeouts, connection errors, 5xx and 429 responses are retried up to
+        Config.API_MAX_RETRIES times with exponential backoff and jitter; a
+        Retry-After header on 429/503 overrides the computed delay.
+
         Args:
             payload: Formatted signal payload
+            api_url: Endpoint chosen by a routing rule (default: Config.MATHEMATRICKS_API_URL)
 
         Returns:
-            tuple: (success: bool, response: dict)
+            tuple: (success: bool, response: dict) - the response includes an
+                'attempts' list with the status and latency of every attempt;
+                on failure its 'retryable' is False if sending the payload
+                again cannot succeed (invalid payload, non-429 4xx response)
         """
         try:
-            # Validate payload
-            required_fields = ['strategy_name', 'signal_sent_EPOCH', 'signalID', 'passphrase', 'signal']
-            missing_fields = [field for field in required_fields if field not in payload]
-
-            if missing_fields:
-                return False, {
-                    'error': f"Missing required fields: {', '.join(missing_fields)}"
-                }
-
-            # Send POST request
-            headers = {
-                'Content-Type': 'application/json'
-            }
+            error = self._check_payload(payload)
+            if error:
+                return False, error
 
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            attempts = []
 
-            # Check response
-            if response.status_code == 200:
-                print(f"Signal {payload['signalID']} sent successfully")
-                return True, {
-                    'status': 'success',
-                    'signal_id': payload['signalID'],
-                    'response': response.text
-                }
-            else:
-                error_msg = f"API returned status code {response.status_code}: {response.text}"
-                print(f"Error sending signal: {error_msg}")
-                return False, {
-                    'error': error_msg,
-                    'status_code': response.status_code
-                }
+            for attempt in range(self.max_retries + 1):
+                success, result, retry_after = self._attempt(payload, attempt, attempts, api_url or self.api_url)
 
-        except requests.exceptions.Timeout:
-            error_msg = "Request timed out"
-            print(f"Error sending signal: {error_msg}")
-            return False, {'error': error_msg}
+                delay = self._retry_delay(payload, attempt, success, retry_after)
+                if delay is None:
+                    break
+                time.sleep(delay)
 
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Request failed: {str(e)}"
-            print(f"Error sending signal: {error_msg}")
-            return False, {'error': error_msg}
+            result['attempts'] = attempts
+            return success, result
 
         except Exception as e:
             error_msg = f"Unexpected error: {str(e)}"
-            print(f"Error sending signal: {error_msg}")
-            return False, {'error': error_msg}
+            logger.exception("Error sending signal: %s", error_msg)
+            return False, {'error': error_msg, 'retryable': True}
+
+    def _attempt(self, payload, attempt, attempts, api_url):
+        """
+        Make one POST attempt
+
+        Args:
+            payload: Signal payload
+            attempt: Zero-based attempt number
+            attempts: List the attempt record is appended to
+            api_url: Endpoint to post to
+
+        Returns:
+            tuple: (success, result dict, retry_after) where retry_after is None
+                when the failure should not be retried, 0 for the default
+                backoff, or the server's Retry-After delay in seconds
+        """
+        start = time.perf_counter()
+        record = {'attempt': attempt + 1}
+
+        try:
+            response = self.session.post(
+                api_url,
+                json=payload,
+                timeout=self.timeout
+            )
+        except requests.exceptions.Timeout:
+            return self._request_failed(record, start, attempts, "Request timed out", retry=True)
+        except requests.exceptions.ConnectionError as e:
+            return self._request_failed(record, start, attempts, f"Request failed: {str(e)}", retry=True)
+        except requests.exceptions.RequestException as e:
+            return self._request_failed(record, start, attempts, f"Request failed: {str(e)}", retry=False)
+
+        return self._response_outcome(payload, record, start, attempts, response.status_code,
+                                      response.text, response.headers.get('Retry-After'))
 
     def send_test_signal(self):
         """
@@ -78,8 +320,6 @@ class APIForwarder:
         Returns:
             tuple: (success: bool, response: dict)
         """
-        import time
-
         test_payload = {
             "strategy_name": Config.STRATEGY_NAME,
             "signal_sent_EPOCH": int(time.time()),
@@ -93,6 +333,8 @@ class APIForwarder:
             }
         }
 
-        print(f"Sending test signal to {self.api_url}")
-        print(f"Payload: {json.dumps(test_payload, indent=2)}")
+        logger.info("Sending test signal to %s", self.api_url)
+        if logger.isEnabledFor(logging.DEBUG):
+            # The passphrase field is redacted by the log formatter
+            logger.debug("Test payload", extra={'payload': test_payload})
         return self.send_signal(test_payload)
@@ -0,0 +1,870 @@
+import asyncio
+import base64
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from gmail_auth import CredentialsManager, GmailAuthenticator
+from email_processor import EmailProcessor, MessageFetchError, ParsedMessage, BoundedIdSet
+from signal_extractor import SignalExtractor
+from api_forwarder import APIForwarder, ForwarderBase
+from dedupe_store import DedupeStore
+from forward_ledger import ForwardLedger
+from history_cursor import HistoryCursor
+from signal_spool import SignalSpool, SpoolDrainer
+from work_queue import PipelineStats
+from watch_renewer import WatchRenewer
+from mailbox_registry import MailboxRegistry
+from routing_rules import RoutingRules
+from attachment_signals import AttachmentSignalReader
+from metrics import CONTENT_TYPE, render_metrics
+from structured_logging import dropped_records, log_context, setup_logging
+from config import Config
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:  # aiohttp is only needed for the async engine
+    aiohttp = None
+    web = None
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGmailError(Exception):
+    """Gmail API request answered with an error status"""
+
+    def __init__(self, status, message):
+        super().__init__(f"Gmail API returned {status}: {message}")
+        self.status = status
+
+
+class AsyncGmailClient:
+    """Gmail REST calls of the pipeline made with aiohttp"""
+
+    def __init__(self, session, gmail_auth, base_url=None):
+        """
+        Args:
+            session: aiohttp.ClientSession
+            gmail_auth: CredentialsManager providing OAuth credentials
+            base_url: Gmail API root (default: Config.GMAIL_API_URL)
+        """
+        self.session = session
+        self.gmail_auth = gmail_auth
+        self.base_url = (base_url or Config.GMAIL_API_URL).rstrip('/')
+        self.latest_history_id = None
+
+    async def _headers(self):
+        """Authorization header, refreshing the credentials off the event loop if needed"""
+        creds = self.gmail_auth.creds
+        if creds is None or not creds.valid:
+            creds = await asyncio.to_thread(self.gmail_auth.credentials)
+        return {'Authorization': f"Bearer {creds.token}"}
+
+    async def _get(self, path, params=None):
+        """
+        GET a Gmail API resource
+
+        Args:
+            path: Path below /gmail/v1/users/me
+            params: Query parameters (list of pairs for repeated keys)
+
+        Returns:
+            dict: Decoded JSON response
+
+        Raises:
+            AsyncGmailError: On a non-200 response
+        """
+        async with self.session.get(
+            f"{self.base_url}/gmail/v1/users/me{path}",
+            params=params,
+            headers=await self._headers()
+        ) as response:
+            if response.status != 200:
+                raise AsyncGmailError(response.status, await response.text())
+            return await response.json()
+
+    async def get_message(self, message_id, format='full', metadata_headers=None):
+        """
+        Fetch one message
+
+        Returns:
+            dict: Gmail message, or None if the message no longer exists
+
+        Raises:
+            MessageFetchError: Any other error; fetching again later may succeed
+        """
+        params = [('format', format)]
+        for header in metadata_headers or []:
+            params.append(('metadataHeaders', header))
+
+        try:
+            return await self._get(f"/messages/{message_id}", params)
+        except AsyncGmailError as error:
+            if error.status == 404:
+                logger.info("Message %s no longer exists", message_id)
+                return None
+            raise MessageFetchError(f"Error fetching message {message_id}: {error}") from error
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            raise MessageFetchError(f"Error fetching message {message_id}: {error}") from error
+
+    async def get_attachment(self, message_id, attachment_id):
+        """
+        Fetch the data of an attachment
+
+        Returns:
+            str: base64url encoded data, or None on error
+        """
+        try:
+            attachment = await self._get(f"/messages/{message_id}/attachments/{attachment_id}")
+            return attachment.get('data')
+        except (AsyncGmailError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+            logger.warning("Error fetching attachment %s of message %s: %s", attachment_id, message_id, error)
+            return None
+
+    async def iter_history(self, start_history_id, label_id=None, page_size=None):
+        """
+        Yield the IDs of messages added since a history ID, one page at a time
+
+        Mirrors EmailProcessor.iter_history, including the resync when the
+        history ID has expired. When exhausted, self.latest_history_id holds
+        the history ID the yielded messages are complete up to.
+
+        Yields:
+            list: Message IDs of one page
+        """
+        label_id = label_id or Config.HISTORY_LABEL_ID
+        page_size = page_size or Config.HISTORY_PAGE_SIZE
+        seen = BoundedIdSet(Config.HISTORY_DEDUPE_WINDOW)
+        page_token = None
+
+        self.latest_history_id = int(start_history_id)
+
+        while True:
+            params = [
+                ('startHistoryId', str(start_history_id)),
+                ('historyTypes', 'messageAdded'),
+                ('maxResults', str(page_size))
+            ]
+            if label_id:
+                params.append(('labelId', label_id))
+            if page_token:
+                params.append(('pageToken', page_token))
+
+            try:
+                history = await self._get('/history', params)
+            except AsyncGmailError as error:
+                if error.status == 404 and page_token is None:
+                    logger.warning("History ID %s has expired, resyncing recent messages", start_history_id)
+                    async for page in self._iter_resync(label_id, page_size, seen):
+                        yield page
+                    return
+                raise
+
+            yield [
+                message_info['message']['id']
+                for history_record in history.get('history', [])
+                for message_info in history_record.get('messagesAdded', [])
+                if seen.add(message_info['message']['id'])
+            ]
+
+            page_token = history.get('nextPageToken')
+            if not page_token:
+                self.latest_history_id = max(
+                    self.latest_history_id,
+                    int(history.get('historyId', 0))
+                )
+                return
+
+    async def _iter_resync(self, label_id, page_size, seen):
+        """Yield pages of recent message IDs after history expired"""
+        profile = await self._get('/profile')
+        resync_history_id = int(profile['historyId'])
+        page_token = None
+
+        while True:
+            params = [
+                ('q', f"newer_than:{Config.HISTORY_RESYNC_DAYS}d"),
+                ('maxResults', str(page_size))
+            ]
+            if label_id:
+                params.append(('labelIds', label_id))
+            if page_token:
+                params.append(('pageToken', page_token))
+
+            response = await self._get('/messages', params)
+
+            yield [
+                message_info['id']
+                for message_info in response.get('messages', [])
+                if seen.add(message_info['id'])
+            ]
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                self.latest_history_id = resync_history_id
+                return
+
+
+class AsyncAPIForwarder(ForwarderBase):
+    """Signal forwarder sending on an aiohttp session"""
+
+    def __init__(self, session, stats=None):
+        """
+        Args:
+            session: aiohttp.ClientSession used for every POST
+            stats: Optional PipelineStats receiving per-attempt latency and retry counts
+        """
+        super().__init__(stats)
+        self.session = session
+
+    async def send_signal(self, payload, api_url=None):
+        """
+        Send signal to Mathematricks API without blocking the event loop
+
+        Same arguments, retry policy and return value as APIForwarder.send_signal.
+        """
+        try:
+            error = self._check_payload(payload)
+            if error:
+                return False, error
+
+            attempts = []
+
+            for attempt in range(self.max_retries + 1):
+                success, result, retry_after = await self._attempt(payload, attempt, attempts, api_url or self.api_url)
+
+                delay = self._retry_delay(payload, attempt, success, retry_after)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+
+            result['attempts'] = attempts
+            return success, result
+
+        except Exception as e:
+            error_msg = f"Unexpected error: {str(e)}"
+            logger.exception("Error sending signal: %s", error_msg)
+            return False, {'error': error_msg, 'retryable': True}
+
+    async def _attempt(self, payload, attempt, attempts, api_url):
+        """Make one POST attempt (see APIForwarder._attempt)"""
+        start = time.perf_counter()
+        record = {'attempt': attempt + 1}
+        timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+
+        try:
+            async with self.session.post(api_url, json=payload, timeout=timeout) as response:
+                status_code = response.status
+                text = await response.text()
+                retry_after = response.headers.get('Retry-After')
+        except asyncio.TimeoutError:
+            return self._request_failed(record, start, attempts, "Request timed out", retry=True)
+        except aiohttp.ClientConnectionError as e:
+            return self._request_failed(record, start, attempts, f"Request failed: {str(e)}", retry=True)
+        except aiohttp.ClientError as e:
+            return self._request_failed(record, start, attempts, f"Request failed: {str(e)}", retry=False)
+
+        return self._response_outcome(payload, record, start, attempts, status_code, text, retry_after)
+
+
+class AsyncSignalEngine:
+    """
+    Notification -> signal pipeline running in one asyncio event loop
+
+    History pages, message fetches and forwards are all non-blocking:
+    messages of a page are fetched and forwarded concurrently (at most
+    Config.ASYNC_CONCURRENCY Gmail requests in flight) while the next page
+    is requested. Detection and extraction reuse EmailProcessor and
+    SignalExtractor, and the cursor, dedupe store and spool are the same
+    SQLite-backed stores the threaded pipeline uses. Their fsyncing writes
+    run on worker threads (asyncio.to_thread), never on the event loop.
+
+    Signals of one history window are forwarded concurrently, so their
+    order is not preserved. Bodies Gmail stores as attachments are not
+    downloaded (FETCH_ATTACHMENT_BODIES only applies to the threaded engine).
+    It serves a single mailbox: a MailboxRegistry listing several accounts
+    is rejected (the threads engine serves those).
+    """
+
+    # Seconds between attempts to take the history cursor from another process
+    CURSOR_RETRY_INTERVAL = 0.05
+
+    def __init__(self, gmail_auth=None, db_path=None, concurrency=None, registry=None):
+        """
+        Args:
+            gmail_auth: CredentialsManager (default: one reading the mailbox's token file)
+            db_path: State database path (default: Config.STATE_DB_PATH)
+            concurrency: Gmail requests in flight (default: Config.ASYNC_CONCURRENCY)
+            registry: MailboxRegistry of the one served mailbox
+                (default: MailboxRegistry.from_config())
+
+        Raises:
+            RuntimeError: If aiohttp is not installed or the registry lists
+                more than one mailbox
+        """
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed; run `pip install aiohttp` or use the threads engine")
+
+        self.stats = PipelineStats()
+        self.registry = registry or MailboxRegistry.from_config()
+        if len(self.registry) > 1:
+            raise RuntimeError(f"The async engine serves a single mailbox but {len(self.registry)} are configured "
+                               f"(MAILBOXES_FILE); use the threads engine")
+        self.mailbox = self.registry.default
+        self.gmail_auth = gmail_auth or CredentialsManager(GmailAuthenticator(self.mailbox.token_file))
+        self.signal_extractor = SignalExtractor().for_mailbox(self.mailbox)
+        self.email_processor = EmailProcessor(None, signal_identifier=self.mailbox.signal_identifier)
+        self.concurrency = concurrency or Config.ASYNC_CONCURRENCY
+
+        self.history_cursor = HistoryCursor(self.mailbox.cursor_name, db_path)
+        self.routing_rules = RoutingRules()
+        self.attachment_reader = AttachmentSignalReader() if Config.ATTACHMENT_SIGNALS_ENABLED else None
+        self.dedupe_store = DedupeStore(db_path)
+        self.signal_spool = SignalSpool(db_path)
+
+        # Redelivery stays on its own thread with the blocking forwarder
+        self.spool_drainer = SpoolDrainer(self.signal_spool, APIForwarder(stats=self.stats), stats=self.stats)
+
+        # Claims, spools and marks direct sends; its calls run on worker threads
+        self.forward_ledger = ForwardLedger(self.dedupe_store, self.signal_spool, self.spool_drainer,
+                                            self.spool_drainer.api_forwarder.max_send_time(), stats=self.stats)
+
+        # Watch renewal is rare and runs on its own thread with the sync client
+        self.watch_renewer = WatchRenewer(self.gmail_auth, db_path=db_path, stats=self.stats,
+                                          mailbox=self.mailbox.email)
+
+        # Created in start(), inside the event loop
+        self.session = None
+        self.gmail = None
+        self.api_forwarder = None
+        self._queue = None
+        self._consumer = None
+        self._fetch_slots = None
+        self._cursor_lock = None
+
+        # Fetch failures in the history window being processed, and the
+        # messages fully handled, skipped when a window is read again
+        self._fetch_failures = 0
+        self._handled = BoundedIdSet(Config.HISTORY_DEDUPE_WINDOW)
+
+        # Scheduled re-read of an incomplete history window
+        self._retry_handle = None
+
+    async def start(self):
+        """Open the HTTP session, start the notification consumer and catch up"""
+        connector = aiohttp.TCPConnector(limit=self.concurrency + Config.API_POOL_SIZE)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self.gmail = AsyncGmailClient(self.session, self.gmail_auth)
+        self.api_forwarder = AsyncAPIForwarder(self.session, stats=self.stats)
+        self._queue = asyncio.Queue(Config.WORK_QUEUE_MAX_SIZE)
+        self._fetch_slots = asyncio.Semaphore(self.concurrency)
+        self._cursor_lock = asyncio.Lock()
+        self._consumer = asyncio.create_task(self._consume())
+        self.gmail_auth.start()
+        self.spool_drainer.start()
+        if Config.WATCH_RENEW_ENABLED and Config.PUBSUB_TOPIC_NAME:
+            self.watch_renewer.start()
+
+        start_history_id = await asyncio.to_thread(self.history_cursor.get)
+        if start_history_id is None:
+            logger.info("No stored history cursor; waiting for the first notification")
+        else:
+            logger.info("Resuming from stored history ID: %s", start_history_id)
+            self.submit({'resume': True, 'emailAddress': self.mailbox.email})
+
+    async def close(self):
+        """Stop the consumer, the token refresh, spool drainer and watch renewal threads, and close the HTTP session"""
+        if self._retry_handle:
+            self._retry_handle.cancel()
+        if self._consumer:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+        self.gmail_auth.stop()
+        self.spool_drainer.stop()
+        self.watch_renewer.stop()
+        if self.session:
+            await self.session.close()
+
+    def submit(self, notification):
+        """
+        Queue a notification for processing
+
+        Returns:
+            bool: True if queued, False if the queue is full
+        """
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.stats.increment('queue_rejected')
+            return False
+
+        self.stats.increment('queue_submitted')
+        return True
+
+    async def join(self):
+        """Wait until every queued notification has been processed"""
+        await self._queue.join()
+
+    def status(self):
+        """
+        Get queue depth and pipeline statistics
+
+        Returns:
+            dict: Same shape as WorkQueue.status()
+        """
+        status = self.stats.snapshot()
+        status['queue'] = {
+            'depth': self._queue.qsize() if self._queue else 0,
+            'engine': 'async',
+            'concurrency': self.concurrency
+        }
+        return status
+
+    async def _consume(self):
+        """Process queued notifications one history window at a time"""
+        while True:
+            notification = await self._queue.get()
+
+            try:
+                await self.process_notification(notification)
+                self.stats.increment('queue_processed')
+            except Exception as e:
+                self.stats.increment('queue_failed')
+                logger.exception("Error handling %s: %s", notification, e)
+            finally:
+                self._queue.task_done()
+
+    async def process_notification(self, notification):
+        """
+        Process a push notification (see SignalPipeline.process_notification)
+
+        Args:
+            notification: Decoded Gmail notification, or {'resume': True}
+        """
+        if self.registry.get(notification.get('emailAddress')) is not self.mailbox:
+            logger.warning("No mailbox configured for %s, ignoring notification", notification.get('emailAddress'))
+            self.stats.increment('notifications_unknown_mailbox')
+            return
+
+        history_id = notification.get('historyId')
+
+        with log_context(pubsub_message_id=notification.get('pubsub_message_id'), history_id=history_id):
+            await self._process_window(notification)
+
+    async def _process_window(self, notification):
+        """Process the history window after the stored cursor, up to a notification's history ID"""
+        history_id = notification.get('historyId')
+
+        async with self._cursor_lock:
+            async with self._hold_cursor() as start_history_id:
+                if start_history_id is None:
+                    if history_id:
+                        logger.info("Initialized with history ID: %s", history_id)
+                        await asyncio.to_thread(self.history_cursor.advance, history_id)
+                    return
+
+                if history_id and int(history_id) <= start_history_id:
+                    logger.debug("History ID %s already processed", history_id)
+                    return
+
+                self._fetch_failures = 0
+                try:
+                    latest_history_id = await self.process_history(start_history_id)
+                except Exception:
+                    self._retry_window(notification)
+                    raise
+
+                if self._fetch_failures:
+                    # Keep the cursor and read the window again after a backoff
+                    logger.warning("%d messages could not be fetched; history cursor stays at %s to read them again",
+                                   self._fetch_failures, start_history_id)
+                    self._retry_window(notification)
+                    return
+
+                if history_id:
+                    latest_history_id = max(latest_history_id, int(history_id))
+
+                if await asyncio.to_thread(self.history_cursor.advance, latest_history_id):
+                    logger.info("History cursor advanced to %s", latest_history_id)
+
+    def _retry_window(self, notification):
+        """Queue another catch-up of an incomplete history window after a backoff (see SignalPipeline._retry_window)"""
+        attempt = notification.get('history_retry', 0) + 1
+        if attempt > Config.HISTORY_RETRY_ATTEMPTS:
+            logger.error("History window still incomplete after %d retries; waiting for the next notification",
+                         Config.HISTORY_RETRY_ATTEMPTS)
+            self.stats.increment('history_retries_exhausted')
+            return
+
+        if self._retry_handle is not None:
+            return
+
+        delay = min(Config.HISTORY_RETRY_MAX, Config.HISTORY_RETRY_BASE * (2 ** (attempt - 1)))
+        logger.info("Reading the history window again in %.1fs (retry %d/%d)",
+                    delay, attempt, Config.HISTORY_RETRY_ATTEMPTS)
+        self.stats.increment('history_windows_retried')
+
+        retry = {'resume': True, 'emailAddress': self.mailbox.email, 'history_retry': attempt}
+        self._retry_handle = asyncio.get_running_loop().call_later(delay, self._submit_retry, retry)
+
+    def _submit_retry(self, notification):
+        """Queue a scheduled re-read of a history window"""
+        self._retry_handle = None
+        self.submit(notification)
+
+    @asynccontextmanager
+    async def _hold_cursor(self):
+        """
+        Hold the history cursor's catch-up rights (see HistoryCursor.hold)
+        without blocking the event loop while another process holds them
+
+        Yields:
+            int: Current cursor value
+        """
+        while not self.history_cursor.acquire(blocking=False):
+            await asyncio.sleep(self.CURSOR_RETRY_INTERVAL)
+
+        try:
+            yield await asyncio.to_thread(self.history_cursor.get)
+        finally:
+            self.history_cursor.release()
+
+    async def process_history(self, start_history_id):
+        """
+        Process every message added since a history ID
+
+        The next history page is requested while the previous page's
+        messages are being processed; at most two pages are in flight.
+
+        Returns:
+            int: History ID the processed messages are complete up to
+        """
+        batch = None
+
+        try:
+            async for page in self.gmail.iter_history(start_history_id):
+                self.stats.increment('history_pages')
+                if not page:
+                    continue
+
+                self.stats.increment('history_messages', len(page))
+                previous, batch = batch, asyncio.create_task(self.process_message_batch(page))
+
+                if previous:
+                    await previous
+        except BaseException as error:
+            # Never leave the page being processed running on its own: let it
+            # finish, or stop it too if this task is being cancelled
+            if batch is not None and not batch.done():
+                if isinstance(error, asyncio.CancelledError):
+                    batch.cancel()
+                await asyncio.gather(batch, return_exceptions=True)
+            raise
+
+        if batch:
+            await batch
+
+        return self.gmail.latest_history_id
+
+    async def process_message_batch(self, message_ids):
+        """Process a page of added messages concurrently"""
+        message_ids = [
+            message_id for message_id in message_ids
+            if message_id not in self._handled
+        ]
+        new_ids = await asyncio.to_thread(self._not_forwarded, message_ids)
+        if len(new_ids) < len(message_ids):
+            logger.warning("Dropping %d messages whose signals were already forwarded",
+                           len(message_ids) - len(new_ids))
+            self.stats.increment('signals_duplicate', len(message_ids) - len(new_ids))
+        message_ids = new_ids
+
+        results = await asyncio.gather(*(self.process_message(message_id) for message_id in message_ids))
+
+        for message_id, fetched in zip(message_ids, results):
+            if fetched:
+                self._handled.add(message_id)
+            else:
+                self._fetch_failures += 1
+
+    def _not_forwarded(self, message_ids):
+        """Filter out the messages the dedupe store has recorded as forwarded"""
+        return [message_id for message_id in message_ids if not self.dedupe_store.is_forwarded(message_id)]
+
+    async def process_message(self, message_id):
+        """
+        Fetch, detect, extract and forward one message
+
+        Args:
+            message_id: Gmail message ID
+
+        Returns:
+            bool: False if the message, or one of its signal attachments,
+                could not be fetched and should be read again later
+        """
+        with log_context(message_id=message_id):
+            try:
+                async with self._fetch_slots:
+                    if Config.PREFILTER_ENABLED and not await self._prefilter(message_id):
+                        return True
+
+                    try:
+                        with self.stats.time('fetch'):
+                            message = await self.gmail.get_message(message_id)
+                    except MessageFetchError as e:
+                        logger.warning("Could not fetch message: %s", e)
+                        self.stats.increment('fetch_failed')
+                        return False
+
+                if not message:
+                    logger.info("Message no longer exists, skipping")
+                    return True
+
+                self.stats.increment('messages_fetched')
+                parsed = ParsedMessage(message)
+
+                with self.stats.time('detect'):
+                    is_signal = self.email_processor.is_signal_email(parsed)
+
+                if not is_signal:
+                    logger.debug("Not a signal email")
+                    return True
+
+                hits = parsed.identifier_hits(self.email_processor.identifier_matcher)
+                logger.info("Signal email detected: %s", parsed.subject,
+                            extra={'identifiers': [identifier for identifier, _ in hits]})
+                self.stats.increment('signal_emails')
+
+                if self.attachment_reader is not None:
+                    attachments = self.attachment_reader.signal_attachments(parsed)
+                    if attachments:
+                        return await self._forward_attachments(parsed, attachments)
+
+                with self.stats.time('extract'):
+                    source, payload = self.signal_extractor.extract_message(parsed)
+                self.stats.increment(f"signals_extracted_{source}")
+
+                if not payload:
+                    logger.warning("Could not extract signal")
+                    return True
+
+                logger.info("Extracted %s signal", source, extra={'signal_id': payload['signalID']})
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Signal data", extra={'signal_id': payload['signalID'], 'signal': payload['signal']})
+
+                await self._forward(payload, parsed, message_id)
+
+            except Exception as e:
+                logger.exception("Error processing message: %s", e)
+
+            return True
+
+    async def _forward_attachments(self, parsed, attachments):
+        """
+        Forward the rows of a message's signal attachments as basket signals
+
+        Batches are forwarded one at a time as they are read, and the message
+        is only recorded as forwarded once every attachment was read to the
+        end (see SignalPipeline._forward_attachments).
+
+        Args:
+            parsed: ParsedMessage
+            attachments: (part, format) tuples from AttachmentSignalReader.signal_attachments
+
+        Returns:
+            bool: False if an attachment could not be downloaded
+        """
+        complete = True
+        fetched = True
+
+        for index, (part, data_format) in enumerate(attachments):
+            filename = part.get('filename')
+            body = part.get('body', {})
+
+            async with self._fetch_slots:
+                with self.stats.time('attachment_fetch'):
+                    data = body.get('data') or await self.gmail.get_attachment(parsed.id, body['attachmentId'])
+
+            if data is None:
+                self.stats.increment('fetch_failed')
+                complete = fetched = False
+                continue
+
+            self.stats.increment('attachments_read')
+            try:
+                for signal_id, signal_data in self.attachment_reader.signals(data, part, data_format, parsed.id, index):
+                    payload = self.signal_extractor.format_for_api(signal_data, signal_id)
+                    logger.info("Extracted basket of %d orders from %s", len(signal_data['orders']), filename,
+                                extra={'signal_id': signal_id})
+                    self.stats.increment('signals_extracted_attachment')
+                    await self._forward(payload, parsed, signal_id)
+            except ValueError as e:
+                logger.error("Could not read signals from attachment %s: %s", filename, e)
+                self.stats.increment('attachment_errors')
+                complete = False
+
+        if complete:
+            await asyncio.to_thread(self.dedupe_store.claim, parsed.id)
+
+        return fetched
+
+    async def _forward(self, payload, parsed, claim_id):
+        """
+        Route, claim, spool and send one signal payload
+
+        Args:
+            payload: Formatted signal payload
+            parsed: ParsedMessage the signal came from
+            claim_id: Dedupe key recorded as forwarded (the message ID, or
+                the signal ID of an attachment batch)
+        """
+        with self.stats.time('route'):
+            rule = self.routing_rules.apply(payload, parsed, self.mailbox.email)
+        api_url = rule.api_url if rule else None
+        if rule is not None:
+            logger.info("Routed by %s to %s", rule.name, payload['strategy_name'],
+                        extra={'signal_id': payload['signalID']})
+            self.stats.increment('signals_routed')
+
+        spool_id = await asyncio.to_thread(self.forward_ledger.claim, payload, claim_id, api_url)
+        if spool_id is None:
+            return
+
+        success, response = False, {'error': 'Send interrupted', 'retryable': True}
+        try:
+            with self.stats.time('forward'):
+                success, response = await self.api_forwarder.send_signal(payload, api_url=api_url)
+        finally:
+            # Also on cancellation, so the entry does not stay in flight
+            await asyncio.to_thread(self.forward_ledger.finish, spool_id, payload, success, response)
+
+        if success and parsed.internal_date:
+            self.stats.record('email_to_forward', time.time() - parsed.internal_date)
+
+    async def _prefilter(self, message_id):
+        """
+        Check a message's metadata before downloading it in full
+
+        Returns:
+            bool: True if the full message should be fetched
+        """
+        try:
+            with self.stats.time('prefilter'):
+                metadata = await self.gmail.get_message(
+                    message_id,
+                    format='metadata',
+                    metadata_headers=EmailProcessor.PREFILTER_HEADERS
+                )
+        except MessageFetchError as e:
+            # Leave the decision to the full fetch
+            logger.warning("%s", e)
+            metadata = None
+
+        self.stats.increment('prefilter_checked')
+
+        if metadata is None or self.email_processor.could_be_signal(metadata):
+            return True
+
+        self.stats.increment('prefilter_full_fetches_saved')
+        self.stats.increment('prefilter_bytes_saved', metadata.get('sizeEstimate', 0))
+        return False
+
+
+def create_async_app(engine=None):
+    """
+    Create the aiohttp webhook app served by the async engine
+
+    Exposes the same /webhook, /health, /stats and /metrics endpoints as webhook.py.
+
+    Args:
+        engine: AsyncSignalEngine (default: a new one)
+
+    Returns:
+        aiohttp.web.Application: Application that starts and stops the engine
+    """
+    setup_logging()
+
+    engine = engine or AsyncSignalEngine()
+    app = web.Application()
+    app['engine'] = engine
+
+    async def handle_webhook(request):
+        try:
+            envelope = await request.json()
+        except ValueError:
+            envelope = None
+
+        if not envelope:
+            return web.json_response({'error': 'No Pub/Sub message received'}, status=400)
+
+        if 'message' not in envelope:
+            return web.json_response({'error': 'Invalid Pub/Sub message format'}, status=400)
+
+        try:
+            pubsub_message = envelope['message']
+            if 'data' in pubsub_message:
+                notification = json.loads(base64.b64decode(pubsub_message['data']).decode('utf-8'))
+            else:
+                notification = {}
+        except Exception as e:
+            logger.exception("Error processing webhook: %s", e)
+            return web.json_response({'error': str(e)}, status=500)
+
+        notification['pubsub_message_id'] = pubsub_message.get('messageId')
+        engine.stats.increment('notifications_received')
+
+        with log_context(pubsub_message_id=notification['pubsub_message_id'],
+                         history_id=notification.get('historyId')):
+            logger.info("Received notification for %s", notification.get('emailAddress'))
+
+            if not notification.get('historyId'):
+                return web.json_response({'status': 'ignored'})
+
+            if not engine.submit(notification):
+                logger.warning("Work queue full, rejecting notification")
+                return web.json_response({'error': 'Work queue full'}, status=503)
+
+        return web.json_response({'status': 'queued', 'queue_depth': engine.status()['queue']['depth']})
+
+    async def handle_health(request):
+        watch = await asyncio.to_thread(engine.watch_renewer.status)
+        return web.json_response({
+            'status': 'healthy' if watch['healthy'] and not watch['expired'] else 'degraded',
+            'service': 'Gmail Signal Integration',
+            'watch': watch
+        })
+
+    async def handle_stats(request):
+        return web.json_response(engine.status())
+
+    async def handle_metrics(request):
+        gauges = {
+            'queue_depth': (engine._queue.qsize() if engine._queue else 0, 'Notifications waiting for the consumer'),
+            'watch_renewal_healthy': (engine.watch_renewer.healthy, '0 while Gmail watch renewal is failing'),
+            'log_records_dropped': (dropped_records(), 'Log records dropped because the log queue was full')
+        }
+        return web.Response(body=render_metrics(engine.stats, gauges), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start_engine(app):
+        await engine.start()
+
+    async def close_engine(app):
+        await engine.close()
+
+    app.router.add_post('/webhook', handle_webhook)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/stats', handle_stats)
+    app.router.add_get('/metrics', handle_metrics)
+    app.on_startup.append(start_engine)
+    app.on_cleanup.append(close_engine)
+    return app
+
+
+def run_async_server():
+    """Start the webhook with the async engine"""
+    if web is None:
+        raise RuntimeError("aiohttp is not installed; run `pip install aiohttp` or use the threads engine")
+
+    logger.info("Starting async webhook server on %s:%s", Config.FLASK_HOST, Config.FLASK_PORT)
+    web.run_app(create_async_app(), host=Config.FLASK_HOST, port=Config.FLASK_PORT, print=None)
@@ -0,0 +1,402 @@
+"""
+Signals from CSV and JSON attachments (order baskets)
+
+With Config.ATTACHMENT_SIGNALS_ENABLED, a signal email carrying a CSV or
+JSON attachment of an allowed type is forwarded as the attachment's rows
+instead of one signal from its text. Every row is one order; rows are
+sent in batches of ATTACHMENT_BATCH_SIZE, each batch one payload:
+
+    {"type": "basket", "attachment": "orders.csv", "batch": 0, "final": true,
+     "orders": [{"ticker": "AAPL", "action": "BUY", "quantity": "100"}, ...]}
+
+Attachments are fetched with users.messages.attachments.get only when
+their declared size is within ATTACHMENT_MAX_BYTES. The base64 data is
+decoded in chunks and parsed incrementally, so besides the fetched data
+only the current batch of rows is held in memory:
+
+- CSV: the first row is the header (names lower-cased); rows are read one
+  at a time with the csv module
+- JSON: a top-level array is read one element at a time, as are JSON Lines
+  or concatenated objects; an object holding a "signals", "orders" or
+  "basket" list stands for the items of that list, which are read one at a
+  time too when the object is over MAX_VALUE_CHARS
+"""
+
+import base64
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentSignalReader:
+    """Pick signal attachments of a message and stream their rows"""
+
+    # Attachment MIME types and the format they are parsed as
+    FORMATS = {
+        'text/csv': 'csv',
+        'application/csv': 'csv',
+        'text/comma-separated-values': 'csv',
+        'application/json': 'json',
+        'application/x-ndjson': 'json',
+        'application/jsonl': 'json',
+    }
+
+    # MIME type of attachments mail clients send as application/octet-stream
+    EXTENSIONS = {
+        '.csv': 'text/csv',
+        '.json': 'application/json',
+        '.jsonl': 'application/x-ndjson',
+        '.ndjson': 'application/x-ndjson',
+    }
+
+    # Keys of a JSON object that wraps the list of orders
+    WRAPPER_KEYS = ('signals', 'orders', 'basket')
+
+    # base64 characters decoded at a time (a multiple of 4)
+    CHUNK_CHARS = 65536
+
+    # Largest CSV line or single JSON value (one order; a wrapper object up to
+    # this size) read into memory
+    MAX_VALUE_CHARS = 1 << 20
+
+    def __init__(self, mime_types=None, max_bytes=None, max_rows=None, batch_size=None):
+        """
+        Args:
+            mime_types: Allowed attachment MIME types (default: Config.ATTACHMENT_SIGNAL_TYPES)
+            max_bytes: Largest attachment fetched (default: Config.ATTACHMENT_MAX_BYTES)
+            max_rows: Rows read per attachment; the rest is ignored (default: Config.ATTACHMENT_MAX_ROWS)
+            batch_size: Rows per forwarded payload (default: Config.ATTACHMENT_BATCH_SIZE)
+        """
+        mime_types = mime_types or Config.ATTACHMENT_SIGNAL_TYPES
+        self.mime_types = {mime_type for mime_type in mime_types if mime_type in self.FORMATS}
+        self.max_bytes = max_bytes or Config.ATTACHMENT_MAX_BYTES
+        self.max_rows = max_rows or Config.ATTACHMENT_MAX_ROWS
+        self.batch_size = max(1, batch_size or Config.ATTACHMENT_BATCH_SIZE)
+
+    def signal_attachments(self, parsed_message):
+        """
+        Attachments of a message that signals are read from
+
+        Args:
+            parsed_message: ParsedMessage
+
+        Returns:
+            list: (part, format) tuples for allowed attachments within the size limit
+        """
+        selected = []
+
+        for part in parsed_message.attachments:
+            mime_type = self.mime_type(part)
+            if mime_type not in self.mime_types:
+                continue
+
+            size = part.get('body', {}).get('size', 0)
+            if size > self.max_bytes:
+                logger.warning("Skipping attachment %s: %d bytes is over the %d byte limit",
+                               part.get('filename'), size, self.max_bytes)
+                continue
+
+            selected.append((part, self.FORMATS[mime_type]))
+
+        return selected
+
+    def mime_type(self, part):
+        """MIME type of an attachment, inferred from its file name when it is generic"""
+        mime_type = part.get('mimeType', '').lower()
+        if mime_type in self.FORMATS:
+            return mime_type
+        return self.EXTENSIONS.get(os.path.splitext(part.get('filename', ''))[1].lower(), mime_type)
+
+    def signals(self, data, part, data_format, message_id, index=0):
+        """
+        Read an attachment's rows as batched basket signals
+
+        Args:
+            data: base64url attachment data
+            part: Attachment part of the message
+            data_format: 'csv' or 'json'
+            message_id: Gmail message ID
+            index: Position of the attachment among the message's signal attachments
+
+        Yields:
+            tuple: (signal ID, signal data) per batch; the signal ID is stable
+                across reprocessing so every batch is forwarded once
+
+        Raises:
+            ValueError: The attachment is not valid CSV/JSON (batches before
+                the error have already been yielded)
+        """
+        rows = self.csv_rows(self._text_chunks(data)) if data_format == 'csv' else \
+            self.json_rows(self._text_chunks(data))
+
+        filename = part.get('filename', '')
+        batch = []
+        number = 0
+        read = 0
+
+        try:
+            for row in rows:
+                if read == self.max_rows:
+                    logger.warning("Attachment %s has more than %d rows; the rest is ignored", filename, self.max_rows)
+                    break
+                read += 1
+
+                # Hold the full batch back until the next row shows whether it was the last
+                if len(batch) == self.batch_size:
+                    yield self._batch(message_id, index, filename, number, batch, final=False)
+                    batch = []
+                    number += 1
+                batch.append(row)
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV: {e}") from e
+
+        if batch:
+            yield self._batch(message_id, index, filename, number, batch, final=True)
+
+    @staticmethod
+    def _batch(message_id, index, filename, number, orders, final):
+        """Signal ID and signal data of one batch"""
+        return f"{message_id}-a{index}-b{number}", {
+            'type': 'basket',
+            'attachment': filename,
+            'batch': number,
+            'final': final,
+            'orders': orders,
+        }
+
+    def _text_chunks(self, data):
+        """Decode base64url data to text a chunk at a time"""
+        decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+
+        for start in range(0, len(data), self.CHUNK_CHARS):
+            chunk = data[start:start + self.CHUNK_CHARS]
+            yield decoder.decode(base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4)))
+
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            yield tail
+
+    def _lines(self, chunks):
+        """Split text chunks into lines, keeping line endings for quoted multi-line CSV fields"""
+        pending = ''
+
+        for chunk in chunks:
+            text = pending + chunk
+            # A \r at the end may be the first half of a \r\n split across chunks
+            cut = len(text) - 1 if text.endswith('\r') else len(text)
+            end = max(text.rfind('\n', 0, cut), text.rfind('\r', 0, cut)) + 1
+
+            pending = text[end:]
+            if len(pending) > self.MAX_VALUE_CHARS:
+                raise ValueError(f"CSV line in attachment is over {self.MAX_VALUE_CHARS} characters")
+            if end:
+                # newline='' splits on \r\n, \n and \r only, as the csv module expects
+                yield from io.StringIO(text[:end], newline='')
+
+        if pending:
+            yield from io.StringIO(pending, newline='')
+
+    def csv_rows(self, chunks):
+        """
+        Parse CSV text chunks row by row
+
+        Yields:
+            dict: Header name (lower-cased) to non-empty value
+        """
+        reader = csv.reader(self._lines(chunks))
+        header = None
+
+        for cells in reader:
+            if header is None:
+                header = [cell.strip().lower() for cell in cells]
+                continue
+
+            row = {
+                key: value.strip()
+                for key, value in zip(header, cells)
+                if key and value.strip()
+            }
+            if row:
+                yield row
+
+    def json_rows(self, chunks):
+        """
+        Parse JSON text chunks one top-level value at a time
+
+        Yields:
+            dict: Each order object
+        """
+        stream = _JSONStream(chunks, self.MAX_VALUE_CHARS)
+
+        if stream.peek() == '[':
+            values = (None for _ in stream.elements())
+        else:
+            values = iter(stream.peek, None)
+
+        for _ in values:
+            for item in self._json_items(stream):
+                if isinstance(item, dict):
+                    yield item
+
+    def _json_items(self, stream):
+        """Read the next value: the items of a wrapper object or a list, or the value itself"""
+        first = stream.peek()
+
+        try:
+            value = stream.value()
+        except _ValueTooLarge:
+            if first == '{':
+                yield from self._wrapper_items(stream)
+            elif first == '[':
+                for _ in stream.elements():
+                    yield stream.value()
+            else:
+                raise
+            return
+
+        if isinstance(value, dict):
+            wrapped = next((value[key] for key in self.WRAPPER_KEYS if isinstance(value.get(key), list)), None)
+            if wrapped is None:
+                yield value
+                return
+            value = wrapped
+
+        if isinstance(value, list):
+            yield from value
+
+    def _wrapper_items(self, stream):
+        """
+        Read an object too large to hold as a wrapper, one item of its list at a time
+
+        Raises:
+            ValueError: The object holds no wrapper list
+        """
+        wrapped = False
+        stream.take('{')
+
+        while True:
+            char = stream.peek()
+            if char == '}':
+                stream.take('}')
+                break
+            if char == ',':
+                stream.take(',')
+                continue
+
+            key = stream.value()
+            if not isinstance(key, str):
+                raise ValueError("Attachment is not valid JSON")
+            stream.take(':')
+
+            if not wrapped and key in self.WRAPPER_KEYS and stream.peek() == '[':
+                wrapped = True
+                for _ in stream.elements():
+                    yield stream.value()
+            else:
+                # Other members are only checked, within the limit each
+                stream.value()
+
+        if not wrapped:
+            raise _ValueTooLarge(stream.max_value_chars)
+
+
+class _ValueTooLarge(ValueError):
+    """A JSON value is over the size read into memory at once"""
+
+    def __init__(self, max_value_chars):
+        super().__init__(f"JSON value in attachment is over {max_value_chars} characters")
+
+
+class _JSONStream:
+    """JSON text chunks read a value or a structural character at a time"""
+
+    def __init__(self, chunks, max_value_chars):
+        """
+        Args:
+            chunks: Text chunks
+            max_value_chars: Largest value decoded at once
+        """
+        self.chunks = iter(chunks)
+        self.max_value_chars = max_value_chars
+        self.buffer = ''
+        self.position = 0
+        self._decoder = json.JSONDecoder()
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it (None at the end)"""
+        while True:
+            length = len(self.buffer)
+            while self.position < length and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+
+            if self.position < length:
+                return self.buffer[self.position]
+            if not self._read():
+                return None
+
+    def take(self, char):
+        """Consume an expected structural character"""
+        if self.peek() != char:
+            raise ValueError("Attachment is not valid JSON")
+        self.position += 1
+
+    def elements(self):
+        """Walk an array, yielding once per element for the caller to read it"""
+        self.take('[')
+
+        while True:
+            char = self.peek()
+            if char is None:
+                raise ValueError("JSON attachment ends inside an array")
+            if char == ']':
+                self.position += 1
+                return
+            if char == ',':
+                self.position += 1
+                continue
+            yield
+
+    def value(self):
+        """
+        Decode the next value
+
+        Raises:
+            _ValueTooLarge: The value is over max_value_chars; nothing was consumed
+            ValueError: The text is not valid JSON
+        """
+        self.peek()
+
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.position)
+                complete = end < len(self.buffer) or isinstance(value, (dict, list))
+            except json.JSONDecodeError:
+                value, complete = None, False
+
+            if not complete:
+                # The value may continue in the next chunk
+                if len(self.buffer) - self.position > self.max_value_chars:
+                    raise _ValueTooLarge(self.max_value_chars)
+                if self._read():
+                    continue
+                if value is None:
+                    raise ValueError("Attachment is not valid JSON")
+
+            self.position = end
+            return value
+
+    def _read(self):
+        """Append the next chunk, dropping consumed text; False at the end"""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
@@ -0,0 +1,1156 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the signal processing hot path
+
+Each benchmark compares the current implementation with the one it replaced
+on synthetic but realistic email content.
+
+Usage:
+  python benchmarks.py                 # run every benchmark
+  python benchmarks.py text-parser     # run one benchmark
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from email_processor import EmailProcessor
+from signal_extractor import JSONSignalScanner, SignalExtractor, TextSignalParser
+
+
+SIGNAL_TEXT = """SIGNAL
+Ticker: AAPL
+Action: BUY
+Price: $150.00
+Quantity: 100
+Stop Loss: $145.00
+Take Profit: $160.00
+"""
+
+
+def make_html_body(size=50000, signal_text=SIGNAL_TEXT):
+    """
+    Build a newsletter-style HTML body (the text/html fallback) of about `size` bytes
+
+    Args:
+        size: Approximate body size in bytes
+        signal_text: Signal fields placed near the end of the body
+
+    Returns:
+        str: HTML body
+    """
+    head = (
+        '<html><head><style type="text/css">'
+        'body { font-family: Arial, sans-serif; color: #333333; } '
+        '.button { background-color: #1a73e8; padding: 12px 24px; } '
+        '</style></head><body>'
+    )
+    row = (
+        '<tr><td class="cell" style="padding: 8px; border-bottom: 1px solid #eeeeee;">'
+        'Market commentary: indices drifted while volumes stayed light across sectors.'
+        '</td><td style="text-align: right;">&nbsp;12.34%</td></tr>\n'
+    )
+    tail = '<p>' + signal_text.replace('\n', '<br>\n') + '</p></body></html>'
+
+    rows = max(0, (size - len(head) - len(tail)) // len(row))
+    return head + '<table>' + row * rows + '</table>' + tail
+
+
+def legacy_extract_text_signal(content):
+    """Text signal extraction as it was before the single-pass parser"""
+    signal_data = {}
+
+    patterns = {
+        'ticker': r'(?:ticker|symbol|stock)[\s:]+([A-Z]{1,5})',
+        'action': r'(?:action|side|direction)[\s:]+(\w+)',
+        'price': r'(?:price|entry)[\s:]+\$?([\d.]+)',
+        'quantity': r'(?:quantity|qty|shares|size)[\s:]+(\d+)',
+        'stop_loss': r'(?:stop[\s-]?loss|sl)[\s:]+\$?([\d.]+)',
+        'take_profit': r'(?:take[\s-]?profit|tp|target)[\s:]+\$?([\d.]+)',
+        'type': r'(?:type|order[\s-]?type)[\s:]+(\w+)',
+    }
+
+    for field, pattern in patterns.items():
+        match = re.search(pattern, content, re.IGNORECASE)
+        if match:
+            signal_data[field] = match.group(1).strip()
+
+    return signal_data
+
+
+def legacy_extract_json_signal(content):
+    """JSON signal extraction as it was before the brace-matching scanner"""
+    for match in re.finditer(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', content, re.DOTALL):
+        try:
+            signal_data = json.loads(match.group())
+            if any(key in signal_data for key in ['ticker', 'symbol', 'action', 'trade', 'signal']):
+                return signal_data
+        except json.JSONDecodeError:
+            continue
+
+    return None
+
+
+def make_json_bodies(size):
+    """
+    Build pathological bodies for the JSON scanner, each about `size` bytes
+
+    Returns:
+        dict: Case name to body
+    """
+    signal = '{"ticker": "AAPL", "action": "BUY", "quantity": 100}'
+    css_rule = '.c { color: #333; margin: 0 auto; } '
+    return {
+        'CSS-heavy HTML + signal': css_rule * (size // len(css_rule)) + signal,
+        'unclosed braces': '{ a ' * (size // 4),
+        'deep nesting': '{' * (size // 2) + '}' * (size // 2),
+        'deeply nested keys': '{"a":' * (size // 5) + '1' + '}' * (size // 5),
+        'unclosed nested objects': '{"a":{x ' * (size // 8),
+        'many small objects': '{"k": 1} ' * (size // 9),
+        'signal nested 4 deep': ' x' * (size // 2) + '{"a": {"b": {"c": {"d": ' + signal + '}}}}',
+    }
+
+
+def encode_part(mime_type, text):
+    """Build a Gmail API message part with base64url body data"""
+    data = base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+    return {'mimeType': mime_type, 'body': {'data': data, 'size': len(text)}}
+
+
+def make_multipart_message(plain_size=200000, html_size=400000, quoted_parts=20):
+    """
+    Build a large multipart Gmail message: a forwarded thread with many quoted parts
+
+    Returns:
+        dict: Gmail API message (format='full')
+    """
+    line = 'On Mon, someone wrote: > quoted market commentary from earlier in the thread\n'
+    plain = line * (plain_size // len(line)) + SIGNAL_TEXT
+    quoted = [
+        encode_part('text/plain', line * (plain_size // len(line) // quoted_parts))
+        for _ in range(quoted_parts)
+    ]
+
+    return {
+        'id': 'bench-message',
+        'threadId': 'bench-thread',
+        'snippet': 'quoted market commentary',
+        'payload': {
+            'mimeType': 'multipart/mixed',
+            'headers': [
+                {'name': 'From', 'value': 'Signals <signals@example.com>'},
+                {'name': 'To', 'value': 'me@example.com'},
+                {'name': 'Subject', 'value': 'Fwd: Daily update'},
+                {'name': 'Date', 'value': 'Mon, 1 Jan 2024 09:30:00 +0000'},
+            ],
+            'parts': [
+                {
+                    'mimeType': 'multipart/alternative',
+                    'parts': [
+                        encode_part('text/plain', plain),
+                        encode_part('text/html', make_html_body(html_size)),
+                    ]
+                },
+                {'mimeType': 'message/rfc822', 'parts': quoted},
+                {'mimeType': 'application/pdf', 'filename': 'report.pdf',
+                 'body': {'attachmentId': 'att-1', 'size': 250000}},
+            ]
+        }
+    }
+
+
+def legacy_get_message_headers(message):
+    """Header extraction as it was before ParsedMessage"""
+    headers = {}
+    if 'payload' in message and 'headers' in message['payload']:
+        for header in message['payload']['headers']:
+            headers[header['name']] = header['value']
+    return headers
+
+
+def legacy_get_multipart_body(parts):
+    """Recursive multipart body assembly as it was before ParsedMessage"""
+    body = ""
+    for part in parts:
+        mime_type = part.get('mimeType', '')
+        if 'parts' in part:
+            body += legacy_get_multipart_body(part['parts'])
+        elif mime_type == 'text/plain' and 'data' in part.get('body', {}):
+            body += base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+        elif mime_type == 'text/html' and not body and 'data' in part.get('body', {}):
+            body += base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+    return body
+
+
+def legacy_get_message_body(message):
+    """Body extraction as it was before ParsedMessage"""
+    payload = message.get('payload', {})
+    if 'body' in payload and 'data' in payload['body']:
+        return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+    if 'parts' in payload:
+        return legacy_get_multipart_body(payload['parts'])
+    return ""
+
+
+def legacy_decode_message(message):
+    """Decoding done by process_message before ParsedMessage (subject+body content)"""
+    # is_signal_email decoded headers and body once...
+    headers = legacy_get_message_headers(message)
+    body = legacy_get_message_body(message)
+    if not (Config.SIGNAL_IDENTIFIER in headers.get('Subject', '') or Config.SIGNAL_IDENTIFIER in body):
+        return None
+
+    # ...then process_message decoded both again and extract_signal joined them
+    headers = legacy_get_message_headers(message)
+    body = legacy_get_message_body(message)
+    return f"{headers.get('Subject', '')}\n{body}"
+
+
+def parsed_decode_message(message, processor):
+    """Decoding done by process_message with ParsedMessage"""
+    parsed = processor.parse(message)
+    if not processor.is_signal_email(parsed):
+        return None
+    return parsed.content
+
+
+def legacy_process_message(message, extractor):
+    """Decode/detect/extract steps of process_message before ParsedMessage"""
+    headers = legacy_get_message_headers(message)
+    body = legacy_get_message_body(message)
+    if not (Config.SIGNAL_IDENTIFIER in headers.get('Subject', '') or Config.SIGNAL_IDENTIFIER in body):
+        return None
+
+    headers = legacy_get_message_headers(message)
+    body = legacy_get_message_body(message)
+    return extractor.extract_signal(body, headers.get('Subject', ''))
+
+
+def parsed_process_message(message, processor, extractor):
+    """Decode/detect/extract steps of process_message with ParsedMessage"""
+    parsed = processor.parse(message)
+    if not processor.is_signal_email(parsed):
+        return None
+    # The identifier check above stands in for the extractor's own
+    return extractor._classify_content(parsed.content, is_signal=True)[1]
+
+
+def time_call(func, *args, repeat=5, number=20, clock=time.perf_counter):
+    """
+    Time a call, returning the best average over several runs
+
+    Returns:
+        float: Seconds per call
+    """
+    best = float('inf')
+
+    for _ in range(repeat):
+        start = clock()
+        for _ in range(number):
+            func(*args)
+        best = min(best, (clock() - start) / number)
+
+    return best
+
+
+def report(name, baseline, current, note=''):
+    """Print a baseline vs current comparison"""
+    print(f"  {name:<42} before {baseline * 1e3:9.3f} ms   "
+          f"after {current * 1e3:9.3f} ms   speedup {baseline / current:6.1f}x   {note}".rstrip())
+
+
+def bench_text_parser():
+    """Single-pass text signal parser vs seven separate re.search calls"""
+    parser = TextSignalParser()
+    cases = {
+        '50KB HTML, signal at end': make_html_body(),
+        '50KB HTML, no signal fields': make_html_body(signal_text='SIGNAL'),
+        'plain text signal': SIGNAL_TEXT,
+    }
+
+    for name, content in cases.items():
+        assert parser.parse(content) == legacy_extract_text_signal(content)
+        report(name, time_call(legacy_extract_text_signal, content), time_call(parser.parse, content))
+
+
+def bench_json_scanner():
+    """Brace-matching JSON scanner vs nested-brace regex + json.loads per candidate"""
+    scanner = JSONSignalScanner(max_bytes=1 << 30)
+
+    # Ten times the input should take about ten times as long
+    for size in (10000, 100000):
+        for name, content in make_json_bodies(size).items():
+            found = (legacy_extract_json_signal(content) is not None, scanner.find(content) is not None)
+            report(f"{size // 1000}KB {name}",
+                   time_call(legacy_extract_json_signal, content, number=3),
+                   time_call(scanner.find, content, number=3),
+                   note=f"signal found before={found[0]} after={found[1]}")
+
+
+def bench_parsed_message():
+    """Per-message CPU of decode + detect + extract: ParsedMessage vs repeated decoding"""
+    processor = EmailProcessor(None)
+    extractor = SignalExtractor()
+    cases = {
+        '600KB multipart, 20 quoted': make_multipart_message(),
+        '60KB multipart, 5 quoted': make_multipart_message(20000, 40000, 5),
+    }
+
+    # Compare full decodes; the body size cap is measured by the body-walker benchmark
+    cap, Config.MAX_BODY_BYTES = Config.MAX_BODY_BYTES, 1 << 30
+
+    for name, message in cases.items():
+        assert legacy_decode_message(message) == parsed_decode_message(message, processor)
+        report(f"{name}: decode",
+               time_call(legacy_decode_message, message, number=5, clock=time.process_time),
+               time_call(parsed_decode_message, message, processor, number=5, clock=time.process_time))
+
+        assert legacy_process_message(message, extractor) == parsed_process_message(message, processor, extractor)
+        report(f"{name}: decode+extract",
+               time_call(legacy_process_message, message, extractor, number=5, clock=time.process_time),
+               time_call(parsed_process_message, message, processor, extractor, number=5, clock=time.process_time))
+
+    Config.MAX_BODY_BYTES = cap
+
+
+def bench_body_walker():
+    """Body decode cost with the MAX_BODY_BYTES cap vs decoding every part in full"""
+    processor = EmailProcessor(None)
+    cap = Config.MAX_BODY_BYTES
+    cases = {
+        '600KB multipart, 20 quoted': make_multipart_message(),
+        '6MB multipart, 200 quoted': make_multipart_message(2000000, 4000000, 200),
+    }
+
+    def capped_body(message, max_bytes):
+        Config.MAX_BODY_BYTES = max_bytes
+        return processor.parse(message).body
+
+    for name, message in cases.items():
+        parsed = processor.parse(message)
+        report(name,
+               time_call(capped_body, message, 1 << 30, number=3, clock=time.process_time),
+               time_call(capped_body, message, cap, number=3, clock=time.process_time),
+               note=f"{len(parsed.body)} chars kept, truncated={parsed.truncated}")
+
+    Config.MAX_BODY_BYTES = cap
+
+
+class FakeGmailAuth:
+    """CredentialsManager stand-in whose mailbox never has new messages"""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def get_service(self):
+        return self
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def list(self, **params):
+        self.params = params
+        return self
+
+    def execute(self):
+        return {'history': [], 'historyId': self.params['startHistoryId']}
+
+
+def serve_quietly(workers, threads, db_path, port):
+    """Run `main.py serve` with a fake Gmail mailbox, discarding its output"""
+    from signal_pipeline import SignalPipeline
+    from webhook import create_app
+    from wsgi_server import run_production_server
+
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+
+    Config.FLASK_HOST = '127.0.0.1'
+    Config.FLASK_PORT = port
+    run_production_server(
+        workers, threads,
+        app_factory=lambda: create_app(SignalPipeline(FakeGmailAuth(), db_path))
+    )
+
+
+def post_notifications(port, first_history_id, count):
+    """Post `count` Pub/Sub notifications over one keep-alive connection"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    accepted = 0
+
+    for history_id in range(first_history_id, first_history_id + count):
+        data = base64.b64encode(json.dumps(
+            {'emailAddress': 'me@example.com', 'historyId': history_id}
+        ).encode()).decode()
+        connection.request('POST', '/webhook', json.dumps({'message': {'data': data}}),
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        accepted += response.status == 200
+
+    connection.close()
+    return accepted
+
+
+def wait_for_server(port, timeout=30):
+    """Wait until the server answers /health"""
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise RuntimeError('server did not start')
+
+
+def bench_server_load(total=4000, clients=16, port=18090):
+    """Notifications/sec accepted by `main.py serve` for 1, 2 and 4 gunicorn workers"""
+    from history_cursor import HistoryCursor
+    from wsgi_server import BaseApplication
+
+    if BaseApplication is None:
+        print("  skipped: gunicorn is not installed")
+        return
+
+    print(f"  {total} notifications from {clients} keep-alive clients, {os.cpu_count()} CPUs")
+    per_client = total // clients
+
+    for workers in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'state.db')
+            HistoryCursor(db_path=db_path).advance(1)
+
+            server = multiprocessing.Process(
+                target=serve_quietly, args=(workers, Config.SERVER_THREADS, db_path, port)
+            )
+            server.start()
+
+            try:
+                wait_for_server(port)
+
+                with ProcessPoolExecutor(clients) as pool:
+                    start = time.perf_counter()
+                    accepted = sum(pool.map(
+                        post_notifications,
+                        [port] * clients,
+                        [2 + index * per_client for index in range(clients)],
+                        [per_client] * clients
+                    ))
+                    elapsed = time.perf_counter() - start
+
+                # Wait for the workers to move the cursor past the last notification
+                cursor = HistoryCursor(db_path=db_path)
+                last_history_id = 1 + clients * per_client
+                while cursor.get() < last_history_id:
+                    time.sleep(0.05)
+                processed = time.perf_counter() - start
+            finally:
+                server.terminate()
+                server.join()
+
+        print(f"  {workers} worker(s) x {Config.SERVER_THREADS} threads   "
+              f"{accepted / elapsed:8.0f} notifications/s accepted   "
+              f"{clients * per_client / processed:8.0f} notifications/s processed   "
+              f"({accepted}/{clients * per_client} accepted)")
+
+
+def make_mailbox(count=200, signal_every=2):
+    """
+    Build inbox messages of which every `signal_every`-th is a unique signal email
+
+    Returns:
+        list: Gmail API messages (format='full')
+    """
+    messages = []
+
+    for index in range(count):
+        is_signal = index % signal_every == 0
+        subject = f"SIGNAL {index}" if is_signal else f"Newsletter {index}"
+        text = SIGNAL_TEXT.replace('Quantity: 100', f"Quantity: {index + 1}") if is_signal else 'Market commentary'
+        part = encode_part('text/plain', text)
+        part['headers'] = [
+            {'name': 'From', 'value': 'Signals <signals@example.com>'},
+            {'name': 'Subject', 'value': subject},
+        ]
+        messages.append({
+            'id': f"msg{index:05d}",
+            'threadId': f"thread{index:05d}",
+            'internalDate': str(int(time.time() * 1000)),
+            'snippet': subject,
+            'sizeEstimate': 2000,
+            'payload': part
+        })
+
+    return messages
+
+
+def stub_credentials(gmail_server, directory):
+    """
+    CredentialsManager for a StubGmailServer, backed by a token.json in `directory`
+
+    Returns:
+        CredentialsManager: Manager handing out services that talk to the stub
+    """
+    from datetime import datetime, timedelta
+    from google.oauth2.credentials import Credentials
+    from gmail_auth import CredentialsManager, GmailAuthenticator
+
+    authenticator = GmailAuthenticator()
+    authenticator.token_file = os.path.join(directory, 'token.json')
+    authenticator.save_credentials(Credentials(
+        token='stub-token',
+        refresh_token='stub-refresh-token',
+        client_id='stub-client',
+        client_secret='stub-secret',
+        expiry=datetime.utcnow() + timedelta(hours=1)
+    ))
+
+    return CredentialsManager(authenticator, discovery_document=gmail_server.discovery_document())
+
+
+def run_threaded_catch_up(gmail_server, directory):
+    """Catch up on the stub mailbox with the threaded SignalPipeline"""
+    from signal_pipeline import SignalPipeline
+
+    pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+    pipeline.history_cursor.advance(1000)
+    pipeline.process_notification({'historyId': gmail_server.history_id})
+    return pipeline.stats.snapshot()['counters']
+
+
+def run_async_catch_up(gmail_server, directory):
+    """Catch up on the stub mailbox with the AsyncSignalEngine"""
+    from async_engine import AsyncSignalEngine
+
+    async def catch_up():
+        engine = AsyncSignalEngine(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+        engine.history_cursor.advance(1000)
+        await engine.start()
+        try:
+            await engine.process_notification({'historyId': gmail_server.history_id})
+        finally:
+            await engine.close()
+        return engine.stats.snapshot()['counters']
+
+    return asyncio.run(catch_up())
+
+
+def bench_async_engine(count=200, gmail_latency=0.01, api_latency=0.02):
+    """History catch-up against stub Gmail/Mathematricks servers: threaded vs async engine"""
+    from async_engine import aiohttp
+    from stub_servers import StubGmailServer, StubMathematricksServer
+
+    if aiohttp is None:
+        print("  skipped: aiohttp is not installed")
+        return
+
+    print(f"  {count} new messages, half signals; {gmail_latency * 1e3:.0f} ms per Gmail request, "
+          f"{api_latency * 1e3:.0f} ms per forward")
+    urls = Config.MATHEMATRICKS_API_URL, Config.GMAIL_API_URL
+    results = {}
+
+    for name, catch_up in (('threads', run_threaded_catch_up), ('async', run_async_catch_up)):
+        with StubGmailServer(make_mailbox(count), latency=gmail_latency) as gmail_server, \
+                StubMathematricksServer(latency=api_latency) as api_server, \
+                tempfile.TemporaryDirectory() as directory:
+            Config.MATHEMATRICKS_API_URL = api_server.url
+            Config.GMAIL_API_URL = gmail_server.url
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                counters = catch_up(gmail_server, directory)
+            elapsed = time.perf_counter() - start
+
+            signal_ids = [payload['signalID'] for payload in api_server.signals]
+            results[name] = elapsed
+            print(f"  {name:<8} {elapsed * 1e3:9.1f} ms   {count / elapsed:7.0f} messages/s   "
+                  f"forwarded={len(signal_ids)} duplicates={len(signal_ids) - len(set(signal_ids))} "
+                  f"gmail_requests={gmail_server.requests} failed={counters.get('signals_failed', 0)}")
+
+    Config.MATHEMATRICKS_API_URL, Config.GMAIL_API_URL = urls
+    print(f"  speedup {results['threads'] / results['async']:.1f}x")
+
+
+def bench_credentials(notifications=20, gmail_latency=0.005):
+    """Notification latency with a cold vs warm CredentialsManager, and service build cost"""
+    from googleapiclient.discovery import build, build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+    from google.oauth2.credentials import Credentials
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+
+    # Building a service: discovery parsed on every build vs parsed once and reused
+    manager_document = json.loads(get_static_doc('gmail', 'v1'))
+    credentials = Credentials(token='stub-token')
+    report('build Gmail service',
+           time_call(lambda: build('gmail', 'v1', credentials=credentials, static_discovery=True), number=5),
+           time_call(lambda: build_from_document(manager_document, credentials=credentials), number=5),
+           note='build(static_discovery) vs cached discovery document')
+
+    urls = Config.MATHEMATRICKS_API_URL
+    cold, warm = [], []
+
+    with StubGmailServer(latency=gmail_latency) as gmail_server, StubMathematricksServer() as api_server:
+        Config.MATHEMATRICKS_API_URL = api_server.url
+        mailbox = iter(make_mailbox(notifications * 2, signal_every=1))
+
+        for _ in range(notifications):
+            with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+                pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+                pipeline.history_cursor.advance(gmail_server.history_id)
+
+                # First notification: token.json is read and the service is built
+                history_id = gmail_server.add_message(next(mailbox))
+                start = time.perf_counter()
+                pipeline.process_notification({'historyId': history_id})
+                cold.append(time.perf_counter() - start)
+
+                # Second notification on the same thread reuses both
+                history_id = gmail_server.add_message(next(mailbox))
+                start = time.perf_counter()
+                pipeline.process_notification({'historyId': history_id})
+                warm.append(time.perf_counter() - start)
+
+        forwarded = len(api_server.signals)
+
+    Config.MATHEMATRICKS_API_URL = urls
+    cold.sort()
+    warm.sort()
+    report('notification latency (median)', cold[len(cold) // 2], warm[len(warm) // 2],
+           note=f"cold vs warm, {forwarded}/{notifications * 2} signals forwarded")
+
+
+def bench_poll_latency(signals=10, max_gap=2.0, gmail_latency=0.005):
+    """Mail-arrival-to-forward latency: push notifications vs adaptive polling"""
+    import random
+    import threading
+    from history_poller import HistoryPoller
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+    from work_queue import PipelineStats
+
+    print(f"  {signals} signal emails arriving 0-{max_gap:.0f}s apart; polling every 0.25-2s "
+          f"(push latency excludes Pub/Sub delivery)")
+    urls = Config.MATHEMATRICKS_API_URL
+    rng = random.Random(1)
+
+    for mode in ('push', 'poll'):
+        with StubGmailServer(latency=gmail_latency) as gmail_server, \
+                StubMathematricksServer() as api_server, \
+                tempfile.TemporaryDirectory() as directory, \
+                contextlib.redirect_stdout(io.StringIO()):
+            Config.MATHEMATRICKS_API_URL = api_server.url
+            pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+            pipeline.history_cursor.advance(gmail_server.history_id)
+            poller = HistoryPoller(pipeline, min_interval=0.25, max_interval=2.0)
+
+            if mode == 'poll':
+                poll_thread = threading.Thread(target=poller.run, daemon=True)
+                poll_thread.start()
+
+            arrived = {}
+            for message in make_mailbox(signals, signal_every=1):
+                time.sleep(rng.uniform(0, max_gap))
+                arrived[message['id']] = time.time()
+                history_id = gmail_server.add_message(message)
+                if mode == 'push':
+                    pipeline.process_notification({'historyId': history_id, 'received_at': time.perf_counter()})
+
+            deadline = time.time() + 10
+            while len(api_server.accepted_at) < signals and time.time() < deadline:
+                time.sleep(0.05)
+            poller.stop()
+
+        latencies = sorted(api_server.accepted_at[message_id] - arrived[message_id]
+                           for message_id in api_server.accepted_at)
+        print(f"  {mode:<5} forwarded {len(latencies)}/{signals}   "
+              f"p50 {PipelineStats._percentile(latencies, 50):8.1f} ms   "
+              f"p90 {PipelineStats._percentile(latencies, 90):8.1f} ms   "
+              f"max {latencies[-1] * 1e3:8.1f} ms   polls={poller.polls}")
+
+    Config.MATHEMATRICKS_API_URL = urls
+
+
+def bench_metrics(events=20000, threads=4):
+    """Instrumentation cost per event (1 and 4 threads) and /metrics render time after a catch-up"""
+    import threading
+    from metrics import render_metrics
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+    from work_queue import PipelineStats
+
+    def instrument(stats, count):
+        for _ in range(count):
+            stats.increment('messages_fetched')
+            stats.record('fetch', 0.012)
+
+    for thread_count in (1, threads):
+        stats = PipelineStats()
+        workers = [threading.Thread(target=instrument, args=(stats, events // thread_count))
+                   for _ in range(thread_count)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        assert stats.counters()['messages_fetched'] == events // thread_count * thread_count
+        print(f"  increment + record, {thread_count} thread(s): {elapsed / events * 1e9:8.0f} ns per event")
+
+    urls = Config.MATHEMATRICKS_API_URL
+    with StubGmailServer(make_mailbox(200)) as gmail_server, \
+            StubMathematricksServer() as api_server, \
+            tempfile.TemporaryDirectory() as directory, \
+            contextlib.redirect_stdout(io.StringIO()):
+        Config.MATHEMATRICKS_API_URL = api_server.url
+        pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+        pipeline.history_cursor.advance(1000)
+        pipeline.process_notification({'historyId': gmail_server.history_id})
+    Config.MATHEMATRICKS_API_URL = urls
+
+    text = render_metrics(pipeline.stats)
+    assert 'gmail_signal_signals_forwarded_total 100' in text
+    assert 'gmail_signal_signals_extracted_text_total 100' in text
+    assert 'gmail_signal_email_to_forward_seconds_count 100' in text
+    render = time_call(render_metrics, pipeline.stats, number=200)
+    snapshot = time_call(pipeline.stats.snapshot, number=200)
+    print(f"  render /metrics ({len(text.splitlines())} lines): {render * 1e6:8.1f} us   "
+          f"(/stats snapshot: {snapshot * 1e6:8.1f} us)")
+
+
+def bench_end_to_end(count=300, rate=100.0):
+    """Webhook replay against stub Gmail/Mathematricks: clean run vs 5% Gmail and 10% API errors"""
+    from e2e_bench import format_summary, run_end_to_end
+
+    for name, errors in (('clean', {}), ('flaky', {'gmail_error_rate': 0.05, 'api_error_rate': 0.1})):
+        result = run_end_to_end(count=count, rate=rate, **errors)
+        print(f"  {name}:")
+        for line in format_summary(result).splitlines():
+            print(f"    {line}")
+
+
+def bench_mailboxes(burst=200, idle=200, gmail_latency=0.002, api_latency=0.005):
+    """Quiet mailbox's forward latency behind a noisy one's burst, with and without per-mailbox worker limits"""
+    import threading
+    from mailbox_registry import Mailbox, MailboxRegistry
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+
+    urls = Config.MATHEMATRICKS_API_URL
+    print(f"  {burst} notifications for noisy@ then 1 for quiet@; {Config.WORKER_COUNT} shared workers")
+
+    for label, max_workers in (('no limit', Config.WORKER_COUNT), ('limit 1', 1)):
+        with StubGmailServer(latency=gmail_latency, email_address='noisy@example.com') as noisy_server, \
+                StubGmailServer(latency=gmail_latency, email_address='quiet@example.com') as quiet_server, \
+                StubMathematricksServer(latency=api_latency) as api_server, \
+                tempfile.TemporaryDirectory() as directory:
+            Config.MATHEMATRICKS_API_URL = api_server.url
+            servers = {'noisy@example.com': noisy_server, 'quiet@example.com': quiet_server}
+            registry = MailboxRegistry([
+                Mailbox('noisy@example.com', max_workers=max_workers),
+                Mailbox('quiet@example.com', strategy_name='Quiet_Desk', max_workers=max_workers),
+            ])
+
+            def auth_factory(mailbox):
+                account_directory = os.path.join(directory, mailbox.email)
+                os.makedirs(account_directory)
+                return stub_credentials(servers[mailbox.email], account_directory)
+
+            pipeline = SignalPipeline(db_path=os.path.join(directory, 'state.db'), registry=registry,
+                                      auth_factory=auth_factory)
+            for mailbox in registry:
+                pipeline.mailbox_state(mailbox).history_cursor.advance(servers[mailbox.email].history_id)
+
+            for message in make_mailbox(burst, signal_every=1):
+                history_id = noisy_server.add_message(message)
+                pipeline.submit({'emailAddress': 'noisy@example.com', 'historyId': history_id})
+
+            quiet_message = make_mailbox(1, signal_every=1)[0]
+            quiet_message['id'] = 'quiet00000'
+            start = time.perf_counter()
+            history_id = quiet_server.add_message(quiet_message)
+            pipeline.submit({'emailAddress': 'quiet@example.com', 'historyId': history_id})
+
+            while 'quiet00000' not in api_server.accepted_at:
+                time.sleep(0.001)
+            quiet_latency = time.perf_counter() - start
+            pipeline.work_queue.join()
+            noisy_done = time.perf_counter() - start
+            pipeline.stop()
+
+        counters = pipeline.stats.counters()
+        print(f"  {label:<9} quiet signal forwarded after {quiet_latency * 1e3:8.1f} ms   "
+              f"noisy burst drained after {noisy_done * 1e3:8.1f} ms   "
+              f"forwarded {counters.get('signals_forwarded', 0)}/{burst + 1}   "
+              f"parked {counters.get('notifications_parked', 0)}")
+
+    Config.MATHEMATRICKS_API_URL = urls
+
+    # Idle mailboxes cost a cursor and watch record each, but no credentials, services or threads
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MailboxRegistry([
+            Mailbox(f"desk{index}@example.com", token_file=os.path.join(directory, f"desk{index}.json"))
+            for index in range(idle)
+        ])
+        pipeline = SignalPipeline(db_path=os.path.join(directory, 'state.db'), registry=registry)
+        threads = threading.active_count()
+        start = time.perf_counter()
+        for mailbox in registry:
+            pipeline.route(mailbox.email)
+        elapsed = time.perf_counter() - start
+        route = time_call(pipeline.route, 'desk7@example.com', number=10000)
+        print(f"  {idle} idle mailboxes: set up in {elapsed * 1e3:.1f} ms, "
+              f"{threading.active_count() - threads} extra threads, routing {route * 1e9:.0f} ns per notification")
+
+
+def make_routing_rules(count):
+    """Rules spread over sender, domain, ticker and subject conditions, like a busy desk's file"""
+    rules = []
+    for index in range(count):
+        kind = index % 4
+        rule = {'name': f"rule {index}", 'strategy_name': f"Strategy_{index}"}
+        if kind == 0:
+            rule['sender'] = f"alerts{index}@desk{index % 50}.com"
+        elif kind == 1:
+            rule['sender'] = f"@desk{index}.net"
+            rule['ticker'] = ['AAPL', 'MSFT']
+        elif kind == 2:
+            rule['ticker'] = f"T{index}"
+        else:
+            rule['sender'] = f"bot{index}@example.com"
+            rule['subject'] = rf"^\[{index}\]"
+        rules.append(rule)
+    return rules
+
+
+def linear_route(rules, sender, subject, ticker, mailbox):
+    """Check every rule in order (what RuleSet.match replaced)"""
+    from email.utils import parseaddr
+
+    sender = parseaddr(sender)[1].lower()
+    domain = '@' + sender.rpartition('@')[2]
+    for rule in rules:
+        if rule.matches(sender, domain, subject, ticker.upper(), mailbox):
+            return rule
+    return None
+
+
+def bench_routing(count=1000):
+    """Indexed routing rule lookup vs checking every rule in order, plus hot reload cost"""
+    from routing_rules import RoutingRules, RuleSet
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'rules.json')
+        with open(path, 'w') as f:
+            json.dump({'rules': make_routing_rules(count)}, f)
+
+        routing = RoutingRules(path, reload_interval=0)
+        rules = routing.rules
+        cases = {
+            'sender rule near the end': ('Desk <alerts996@desk46.com>', 'Signal', 'AAPL'),
+            'ticker rule near the end': ('someone@elsewhere.com', 'Signal', 'T998'),
+            'no rule matches': ('someone@elsewhere.com', 'Signal', 'AAPL'),
+        }
+
+        for name, (sender, subject, ticker) in cases.items():
+            expected = linear_route(rules.rules, sender, subject, ticker, None)
+            assert rules.match(sender, subject, ticker) is expected
+            report(f"{count} rules, {name}",
+                   time_call(linear_route, rules.rules, sender, subject, ticker, None, number=200),
+                   time_call(rules.match, sender, subject, ticker, number=200),
+                   note=f"-> {expected.name if expected else 'default'}")
+
+        reload = time_call(RuleSet.from_file, path, repeat=3, number=3)
+        print(f"  reload of {count} rules: {reload * 1e3:.1f} ms (paid by one request; concurrent requests keep the old rules)")
+
+
+def sequential_identifier_hits(identifiers, content):
+    """One `in` check per identifier, done by the detector and again by the extractor"""
+    for _ in range(2):
+        hits = [identifier for identifier in identifiers if identifier in content]
+    return hits
+
+
+def bench_identifiers():
+    """Aho-Corasick identifier matching vs one `in` check per identifier (detector + extractor)"""
+    from identifier_matcher import IdentifierMatcher
+
+    content = make_html_body()
+    for count in (1, 12, 32, 128):
+        # Per-desk tags that share prefixes, as identifier lists tend to
+        tags = [f"DESK-{index:03d}" for index in range(count - 1)]
+        for name, identifiers in (('hit', ['SIGNAL'] + tags), ('miss', ['NOSIGNAL'] + tags)):
+            matcher = IdentifierMatcher(identifiers)
+
+            def matcher_hits():
+                # The detector's hits are cached on the ParsedMessage for the extractor
+                return [identifier for identifier, _ in matcher.find(content)]
+
+            assert matcher_hits() == sequential_identifier_hits(identifiers, content)
+            engine = 'str.find' if count <= IdentifierMatcher.DIRECT_SEARCH_LIMIT else 'automaton'
+            report(f"{count:>3} identifiers, 50KB HTML, {name}",
+                   time_call(sequential_identifier_hits, identifiers, content),
+                   time_call(matcher_hits),
+                   note=engine)
+
+    # One str.find per identifier vs the automaton around DIRECT_SEARCH_LIMIT
+    for count in (8, 12, 16):
+        identifiers = ['SIGNAL'] + [f"DESK-{index:03d}" for index in range(count - 1)]
+        direct, automaton = IdentifierMatcher(identifiers), IdentifierMatcher(identifiers)
+        direct._direct, automaton._direct = True, False
+        report(f"{count:>3} identifiers, str.find vs automaton",
+               time_call(direct.find, content), time_call(automaton.find, content))
+
+
+# HTML-only signal emails as providers send them: (name, HTML body, expected fields)
+HTML_SIGNAL_CORPUS = [
+    ('<br> separated lines',
+     '<p>SIGNAL<br>Ticker: AAPL<br>Action: BUY<br>Price: $150.00</p>',
+     {'ticker': 'AAPL', 'action': 'BUY', 'price': '150.00'}),
+    ('key/value table',
+     '<p>SIGNAL</p><table><tr><td class="k">Ticker</td><td class="v">AAPL</td></tr>'
+     '<tr><td class="k">Action</td><td class="v">BUY</td></tr>'
+     '<tr><td class="k">Price</td><td class="v">$150.00</td></tr></table>',
+     {'ticker': 'AAPL', 'action': 'BUY', 'price': '150.00'}),
+    ('header row table',
+     '<h2>SIGNAL</h2><table><thead><tr><th>Symbol</th><th>Side</th><th>Qty</th><th>Entry</th></tr></thead>'
+     '<tbody><tr><td>MSFT</td><td>SELL</td><td>40</td><td>410.25</td></tr></tbody></table>',
+     {'ticker': 'MSFT', 'action': 'SELL', 'quantity': '40', 'price': '410.25'}),
+    ('styled spans',
+     '<div>SIGNAL</div><div><span style="font-weight:bold">Ticker:</span>&nbsp;<span style="color:#1a73e8">TSLA</span></div>'
+     '<div><span style="font-weight:bold">Action:</span>&nbsp;<span>SELL</span></div>',
+     {'ticker': 'TSLA', 'action': 'SELL'}),
+    ('entity-encoded values',
+     '<p>SIGNAL&nbsp;&#8212; Ticker:&nbsp;NVDA</p><p>Action:&nbsp;BUY</p><p>Stop&nbsp;Loss:&nbsp;&#36;880.00</p>',
+     {'ticker': 'NVDA', 'action': 'BUY', 'stop_loss': '880.00'}),
+    ('nested layout cells',
+     '<table><tr><td><table><tr><td><div>SIGNAL</div></td></tr>'
+     '<tr><td><div>Ticker</div></td><td><div><strong>AMZN</strong></div></td></tr>'
+     '<tr><td><div>Action</div></td><td><div><strong>BUY</strong></div></td></tr></table></td></tr></table>',
+     {'ticker': 'AMZN', 'action': 'BUY'}),
+    ('JSON after CSS',
+     '<style>.card { padding: 8px; } .hdr { color: #333; }</style><p>SIGNAL</p>'
+     '<pre>{&quot;ticker&quot;: &quot;GOOG&quot;, &quot;action&quot;: &quot;SELL&quot;}</pre>',
+     {'ticker': 'GOOG', 'action': 'SELL'}),
+    ('newsletter, signal at end', make_html_body(),
+     {'ticker': 'AAPL', 'action': 'BUY', 'price': '150.00', 'quantity': '100'}),
+]
+
+
+def html_signal_hit(extractor, html, expected, convert):
+    """Extract from an HTML-only message and check every expected field came out"""
+    from email_processor import ParsedMessage
+
+    message = {'id': 'html', 'payload': {
+        'mimeType': 'multipart/alternative',
+        'headers': [{'name': 'Subject', 'value': 'Alert'}],
+        'parts': [encode_part('text/html', html)],
+    }}
+    setting, Config.CONVERT_HTML_BODIES = Config.CONVERT_HTML_BODIES, convert
+    try:
+        source, payload = extractor.extract_message(ParsedMessage(message))
+    finally:
+        Config.CONVERT_HTML_BODIES = setting
+
+    if source not in ('json', 'text'):
+        return False
+    signal = {key.lower(): str(value) for key, value in payload['signal'].items()}
+    if 'symbol' in signal:
+        signal.setdefault('ticker', signal['symbol'])
+    return all(signal.get(field) == value for field, value in expected.items())
+
+
+def bench_html_text(sizes=(50000, 500000)):
+    """Signal extraction from HTML-only emails: converted to text vs raw HTML"""
+    from html_text import html_to_text
+
+    extractor = SignalExtractor()
+
+    for size in sizes:
+        html = make_html_body(size)
+        convert = time_call(html_to_text, html, 1 << 30, repeat=3, number=3)
+        text = html_to_text(html, 1 << 30)[0]
+        report(f"{size // 1000}KB newsletter: extract",
+               time_call(extractor.extract_signal, html, repeat=3, number=3),
+               time_call(lambda: extractor.extract_signal(html_to_text(html, 1 << 30)[0]), repeat=3, number=3),
+               note=f"convert {len(html) / convert / 1e6:.1f} MB/s, text {len(text) * 100 // len(html)}% of HTML")
+
+    # The MAX_BODY_BYTES text cap stops the parse early on huge bodies
+    html = make_html_body(2000000)
+    report("2MB newsletter: convert, 256KB text cap vs none",
+           time_call(html_to_text, html, 1 << 30, repeat=3, number=1),
+           time_call(html_to_text, html, 262144, repeat=3, number=1))
+
+    hits = {False: 0, True: 0}
+    for name, html, expected in HTML_SIGNAL_CORPUS:
+        before = html_signal_hit(extractor, html, expected, convert=False)
+        after = html_signal_hit(extractor, html, expected, convert=True)
+        hits[False] += before
+        hits[True] += after
+        print(f"  {name:<42} raw HTML {'hit ' if before else 'miss'}   converted {'hit' if after else 'miss'}")
+
+    total = len(HTML_SIGNAL_CORPUS)
+    print(f"  hit rate: raw HTML {hits[False]}/{total}, converted {hits[True]}/{total}")
+
+
+def make_basket_csv(rows):
+    """CSV order basket with `rows` orders"""
+    lines = ['Ticker,Action,Quantity,Price,Order Type,Account']
+    for index in range(rows):
+        lines.append(f"T{index % 5000:04d},{'BUY' if index % 2 else 'SELL'},{index % 900 + 100},"
+                     f"{100 + index % 500}.25,LIMIT,ACC-{index % 40:02d}")
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def make_basket_json(rows):
+    """JSON array order basket with `rows` orders"""
+    orders = [
+        {'ticker': f"T{index % 5000:04d}", 'action': 'BUY' if index % 2 else 'SELL',
+         'quantity': index % 900 + 100, 'price': 100 + index % 500 + 0.25, 'order_type': 'LIMIT'}
+        for index in range(rows)
+    ]
+    return json.dumps(orders).encode('utf-8')
+
+
+def legacy_read_basket(data, data_format):
+    """Decode the whole attachment and parse every row into one list"""
+    import csv
+
+    text = base64.urlsafe_b64decode(data).decode('utf-8')
+    if data_format == 'csv':
+        return [{key.lower(): value for key, value in row.items()} for row in csv.DictReader(io.StringIO(text))]
+    return json.loads(text)
+
+
+def streamed_read_basket(reader, data, data_format):
+    """Read the attachment batch by batch, dropping each batch once handled"""
+    rows = 0
+    for _, signal in reader.signals(data, {'filename': f"basket.{data_format}"}, data_format, 'bench'):
+        rows += len(signal['orders'])
+    return rows
+
+
+def peak_memory(func, *args):
+    """Peak Python memory allocated while func runs, in bytes"""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_attachments(rows=100000, forwarded_rows=5000):
+    """Order basket attachments: streamed batches vs decoding and parsing the whole file at once"""
+    from attachment_signals import AttachmentSignalReader
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+
+    reader = AttachmentSignalReader(mime_types=['text/csv', 'application/json'], max_bytes=1 << 30,
+                                    max_rows=1 << 30, batch_size=500)
+
+    for data_format, raw in (('csv', make_basket_csv(rows)), ('json', make_basket_json(rows))):
+        data = base64.urlsafe_b64encode(raw).decode('ascii')
+        assert streamed_read_basket(reader, data, data_format) == len(legacy_read_basket(data, data_format)) == rows
+        memory = (peak_memory(legacy_read_basket, data, data_format),
+                  peak_memory(streamed_read_basket, reader, data, data_format))
+        report(f"{len(raw) / 1e6:.1f}MB {data_format.upper()}, {rows} rows",
+               time_call(legacy_read_basket, data, data_format, repeat=3, number=1),
+               time_call(streamed_read_basket, reader, data, data_format, repeat=3, number=1),
+               note=f"peak memory {memory[0] / 1e6:.1f}MB -> {memory[1] / 1e6:.1f}MB")
+
+    # One basket email through the pipeline against the stubs
+    raw = make_basket_csv(forwarded_rows)
+    message = {
+        'id': 'basket00001',
+        'snippet': 'SIGNAL basket',
+        'payload': {
+            'mimeType': 'multipart/mixed',
+            'headers': [{'name': 'From', 'value': 'desk@example.com'}, {'name': 'Subject', 'value': 'SIGNAL basket'}],
+            'parts': [
+                encode_part('text/plain', 'SIGNAL: basket attached'),
+                {'mimeType': 'application/octet-stream', 'filename': 'basket.csv',
+                 'body': {'attachmentId': 'att-basket', 'size': len(raw)}},
+            ]
+        }
+    }
+    settings = Config.ATTACHMENT_SIGNALS_ENABLED, Config.MATHEMATRICKS_API_URL
+    with StubGmailServer() as gmail_server, StubMathematricksServer() as api_server, \
+            tempfile.TemporaryDirectory() as directory:
+        Config.ATTACHMENT_SIGNALS_ENABLED, Config.MATHEMATRICKS_API_URL = True, api_server.url
+        try:
+            pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+            pipeline.history_cursor.advance(gmail_server.history_id)
+            history_id = gmail_server.add_message(message, {'att-basket': raw})
+            start = time.perf_counter()
+            pipeline.process_notification({'historyId': history_id})
+            elapsed = time.perf_counter() - start
+            pipeline.stop()
+        finally:
+            Config.ATTACHMENT_SIGNALS_ENABLED, Config.MATHEMATRICKS_API_URL = settings
+
+    orders = sum(len(payload['signal']['orders']) for payload in api_server.signals)
+    print(f"  pipeline: {forwarded_rows}-row CSV basket forwarded as {len(api_server.signals)} payloads "
+          f"({orders} orders) in {elapsed * 1e3:.0f} ms")
+
+
+BENCHMARKS = {
+    'text-parser': bench_text_parser,
+    'json-scanner': bench_json_scanner,
+    'parsed-message': bench_parsed_message,
+    'body-walker': bench_body_walker,
+    'server-load': bench_server_load,
+    'async-engine': bench_async_engine,
+    'credentials': bench_credentials,
+    'poll-latency': bench_poll_latency,
+    'metrics': bench_metrics,
+    'end-to-end': bench_end_to_end,
+    'mailboxes': bench_mailboxes,
+    'routing': bench_routing,
+    'identifiers': bench_identifiers,
+    'html-text': bench_html_text,
+    'attachments': bench_attachments,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Signal processing micro-benchmarks')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})")
+
+    for name in args.names or BENCHMARKS:
+        print(f"{name}: {BENCHMARKS[name].__doc__}")
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
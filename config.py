@@ -13,23 +13,161 @@ class Config:
     GMAIL_REFRESH_TOKEN = os.getenv('GMAIL_REFRESH_TOKEN')
     GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+    # Seconds before expiry the access token is refreshed in the background
+    TOKEN_REFRESH_MARGIN = int(os.getenv('TOKEN_REFRESH_MARGIN', 300))
+
+    # Gmail REST API root used by the async engine
+    GMAIL_API_URL = os.getenv('GMAIL_API_URL', 'https://gmail.googleapis.com')
+
+    # Number of messages fetched per Gmail batch request (Gmail allows up to 100)
+    GMAIL_BATCH_SIZE = int(os.getenv('GMAIL_BATCH_SIZE', 50))
+
+    # History catch-up: label filter, records per page (Gmail allows up to 500),
+    # message IDs remembered for cross-page dedupe, and how far back to resync
+    # when a stored history ID has expired
+    HISTORY_LABEL_ID = os.getenv('HISTORY_LABEL_ID', 'INBOX')
+    HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 100))
+    HISTORY_DEDUPE_WINDOW = int(os.getenv('HISTORY_DEDUPE_WINDOW', 10000))
+    HISTORY_RESYNC_DAYS = int(os.getenv('HISTORY_RESYNC_DAYS', 2))
+
+    # History windows left incomplete by Gmail errors are read again after a
+    # backoff (seconds), at most this many times in a row
+    HISTORY_RETRY_ATTEMPTS = int(os.getenv('HISTORY_RETRY_ATTEMPTS', 5))
+    HISTORY_RETRY_BASE = float(os.getenv('HISTORY_RETRY_BASE', 2))
+    HISTORY_RETRY_MAX = float(os.getenv('HISTORY_RETRY_MAX', 60))
+
     # Pub/Sub Configuration
     PUBSUB_TOPIC_NAME = os.getenv('PUBSUB_TOPIC_NAME')
 
+    # Gmail watch renewal: the server re-registers the push watch this many
+    # hours before it expires, retrying failures after WATCH_RETRY_BASE seconds
+    # doubling up to WATCH_RETRY_MAX (jittered)
+    WATCH_RENEW_ENABLED = os.getenv('WATCH_RENEW_ENABLED', 'true').lower() == 'true'
+    WATCH_RENEW_BEFORE_HOURS = float(os.getenv('WATCH_RENEW_BEFORE_HOURS', 24))
+    WATCH_RETRY_BASE = float(os.getenv('WATCH_RETRY_BASE', 30))
+    WATCH_RETRY_MAX = float(os.getenv('WATCH_RETRY_MAX', 1800))
+
     # Mathematricks API Configuration
     MATHEMATRICKS_API_URL = os.getenv('MATHEMATRICKS_API_URL', 'https://mathematricks.fund/api/signals')
     MATHEMATRICKS_PASSPHRASE = os.getenv('MATHEMATRICKS_PASSPHRASE')
 
+    # Mathematricks API connection pool, timeouts (seconds) and retry policy
+    API_POOL_SIZE = int(os.getenv('API_POOL_SIZE', 10))
+    API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', 5))
+    API_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', 30))
+    API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 3))
+    API_BACKOFF_BASE = float(os.getenv('API_BACKOFF_BASE', 0.5))
+    API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', 30))
+
     # Strategy Configuration
     STRATEGY_NAME = os.getenv('STRATEGY_NAME', 'Gmail_Signal_Integration')
 
-    # Signal Detection Configuration
+    # Signal Detection Configuration: text marking signal emails (several
+    # identifiers may be comma-separated, see identifier_matcher.py)
     SIGNAL_IDENTIFIER = os.getenv('SIGNAL_IDENTIFIER', 'SIGNAL')
+    SIGNAL_IDENTIFIER_IGNORE_CASE = os.getenv('SIGNAL_IDENTIFIER_IGNORE_CASE', 'false').lower() == 'true'
+
+    # Optional JSON file of text signal fields ({"field": "regex with one group"})
+    SIGNAL_FIELDS_FILE = os.getenv('SIGNAL_FIELDS_FILE', '')
+
+    # Optional JSON/YAML file of routing rules picking each signal's strategy
+    # and endpoint (see routing_rules.py), and how often it is checked for changes
+    ROUTING_RULES_FILE = os.getenv('ROUTING_RULES_FILE', '')
+    ROUTING_RULES_RELOAD_SECONDS = float(os.getenv('ROUTING_RULES_RELOAD_SECONDS', 5))
+
+    # Body decoding: maximum decoded body size, dropping quoted replies,
+    # converting HTML-only bodies to text, and whether large bodies Gmail
+    # stores as attachments are downloaded
+    MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 262144))
+    STRIP_QUOTED_REPLIES = os.getenv('STRIP_QUOTED_REPLIES', 'false').lower() == 'true'
+    CONVERT_HTML_BODIES = os.getenv('CONVERT_HTML_BODIES', 'true').lower() == 'true'
+    FETCH_ATTACHMENT_BODIES = os.getenv('FETCH_ATTACHMENT_BODIES', 'false').lower() == 'true'
+
+    # Maximum characters of an email searched for an embedded JSON signal
+    JSON_SCAN_MAX_BYTES = int(os.getenv('JSON_SCAN_MAX_BYTES', 262144))
+
+    # Signals read from CSV/JSON attachments (see attachment_signals.py):
+    # allowed MIME types, largest attachment fetched, rows read per
+    # attachment and rows forwarded per payload
+    ATTACHMENT_SIGNALS_ENABLED = os.getenv('ATTACHMENT_SIGNALS_ENABLED', 'false').lower() == 'true'
+    ATTACHMENT_SIGNAL_TYPES = [
+        mime_type.strip().lower()
+        for mime_type in os.getenv('ATTACHMENT_SIGNAL_TYPES', 'text/csv,application/json,application/x-ndjson').split(',')
+        if mime_type.strip()
+    ]
+    ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', 10485760))
+    ATTACHMENT_MAX_ROWS = int(os.getenv('ATTACHMENT_MAX_ROWS', 100000))
+    ATTACHMENT_BATCH_SIZE = int(os.getenv('ATTACHMENT_BATCH_SIZE', 500))
+
+    # Metadata-only prefilter run before downloading full message bodies. Off
+    # by default: it only sees the subject and snippet, so an identifier that
+    # appears further into the body is missed unless the sender is allowlisted
+    PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'false').lower() == 'true'
+    PREFILTER_MATCH_SNIPPET = os.getenv('PREFILTER_MATCH_SNIPPET', 'true').lower() == 'true'
+    # Comma-separated sender addresses or @domains that always get a full fetch
+    SIGNAL_SENDER_ALLOWLIST = [
+        sender.strip().lower()
+        for sender in os.getenv('SIGNAL_SENDER_ALLOWLIST', '').split(',')
+        if sender.strip()
+    ]
 
     # Flask Configuration
     FLASK_HOST = os.getenv('FLASK_HOST', '0.0.0.0')
     FLASK_PORT = int(os.getenv('FLASK_PORT', 5000))
 
+    # Production server (`main.py serve`): gunicorn worker processes, request
+    # threads per worker and worker timeout in seconds
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 2))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 4))
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 30))
+
+    # Local state database (history cursor); mount it on a volume in containers
+    STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'gmail_signal_state.db')
+
+    # Duplicate suppression: how long forwarded message IDs and signal content
+    # hashes are remembered (0, the default, turns content dedupe off so a
+    # repeated identical order is still sent), and how many entries are
+    # cached in memory
+    DEDUPE_TTL_DAYS = int(os.getenv('DEDUPE_TTL_DAYS', 30))
+    DEDUPE_CONTENT_TTL_SECONDS = int(os.getenv('DEDUPE_CONTENT_TTL_SECONDS', 0))
+    DEDUPE_MEMORY_SIZE = int(os.getenv('DEDUPE_MEMORY_SIZE', 10000))
+
+    # Outbound signal spool: redelivery interval and backoff (seconds), age after
+    # which an undelivered signal is dead-lettered, and retention of delivered entries
+    SPOOL_DRAIN_INTERVAL = float(os.getenv('SPOOL_DRAIN_INTERVAL', 5))
+    SPOOL_BACKOFF_BASE = float(os.getenv('SPOOL_BACKOFF_BASE', 2))
+    SPOOL_BACKOFF_MAX = float(os.getenv('SPOOL_BACKOFF_MAX', 60))
+    SPOOL_MAX_AGE_SECONDS = float(os.getenv('SPOOL_MAX_AGE_SECONDS', 300))
+    SPOOL_DONE_RETENTION_SECONDS = float(os.getenv('SPOOL_DONE_RETENTION_SECONDS', 86400))
+
+    # Background Worker Configuration
+    WORKER_COUNT = int(os.getenv('WORKER_COUNT', 4))
+    WORK_QUEUE_MAX_SIZE = int(os.getenv('WORK_QUEUE_MAX_SIZE', 1000))
+
+    # Multiple mailboxes: optional JSON file listing the Gmail accounts this
+    # server watches (see mailbox_registry.py), and how many workers one
+    # mailbox may occupy at once unless its entry says otherwise
+    MAILBOXES_FILE = os.getenv('MAILBOXES_FILE', '')
+    MAILBOX_MAX_WORKERS = int(os.getenv('MAILBOX_MAX_WORKERS', 1))
+
+    # Logging: minimum level, 'json' lines or 'text', and how many records may
+    # wait for the background writer before new ones are dropped
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+    # Polling mode (`main.py poll`): seconds between polls while signals flow,
+    # longest idle interval, growth per idle poll and +/- jitter fraction
+    POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', 2))
+    POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', 60))
+    POLL_BACKOFF_FACTOR = float(os.getenv('POLL_BACKOFF_FACTOR', 1.5))
+    POLL_JITTER = float(os.getenv('POLL_JITTER', 0.2))
+
+    # Pipeline engine for `main.py start` ('threads' or 'async') and the
+    # async engine's limit on Gmail requests in flight
+    PIPELINE_ENGINE = os.getenv('PIPELINE_ENGINE', 'threads')
+    ASYNC_CONCURRENCY = int(os.getenv('ASYNC_CONCURRENCY', 20))
+
     @classmethod
     def validate(cls):
         """Validate that all required configuration is present"""
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from state_store import connect_state_db
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class DedupeStore:
+    """Record of forwarded signals so each Gmail message is sent only once"""
+
+    # How often expired rows are deleted from the database (seconds)
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self, db_path=None, message_ttl=None, content_ttl=None, memory_size=None):
+        """
+        Args:
+            db_path: State database path (default: Config.STATE_DB_PATH)
+            message_ttl: Seconds a message ID is remembered (default: Config.DEDUPE_TTL_DAYS)
+            content_ttl: Seconds a signal content hash is remembered; 0 turns
+                content dedupe off (default: Config.DEDUPE_CONTENT_TTL_SECONDS)
+            memory_size: Entries kept in the in-memory front (default: Config.DEDUPE_MEMORY_SIZE)
+        """
+        self.message_ttl = message_ttl or Config.DEDUPE_TTL_DAYS * 86400
+        self.content_ttl = Config.DEDUPE_CONTENT_TTL_SECONDS if content_ttl is None else content_ttl
+        self.memory_size = memory_size or Config.DEDUPE_MEMORY_SIZE
+
+        self._conn = connect_state_db(db_path)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._last_prune = 0.0
+
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS forwarded_signals ('
+                'key TEXT PRIMARY KEY, '
+                'expires_at REAL NOT NULL) WITHOUT ROWID'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS forwarded_signals_expires '
+                'ON forwarded_signals (expires_at)'
+            )
+
+    @staticmethod
+    def content_hash(signal_data):
+        """
+        Hash extracted signal data independently of key order
+
+        Args:
+            signal_data: Extracted signal dict (the pipelines pass
+                [strategy_name, signal] so mailboxes of different strategies
+                never suppress each other's signals)
+
+        Returns:
+            str: Hex SHA-256 digest
+        """
+        encoded = json.dumps(signal_data, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def is_forwarded(self, message_id):
+        """
+        Check whether a message has already been forwarded
+
+        Args:
+            message_id: Gmail message ID
+
+        Returns:
+            bool: True if the message ID is recorded and not expired
+        """
+        key = f"msg:{message_id}"
+        now = time.time()
+
+        with self._lock:
+            expires_at = self._memory.get(key)
+            if expires_at is not None:
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return True
+                del self._memory[key]
+
+            row = self._conn.execute(
+                'SELECT expires_at FROM forwarded_signals WHERE key = ? AND expires_at > ?',
+                (key, now)
+            ).fetchone()
+
+            if row:
+                self._remember(key, row[0])
+                return True
+
+        return False
+
+    def claim(self, message_id, content_hash=None, record=None):
+        """
+        Atomically record a message (and its signal content) as forwarded
+
+        Claiming fails if the message ID, or the same signal content within
+        the content TTL, was already claimed by any thread or process.
+        Content is only compared when the content TTL is set.
+
+        Args:
+            message_id: Gmail message ID
+            content_hash: Hash from content_hash() (optional)
+            record: Optional callable(connection) writing the caller's own
+                state, e.g. SignalSpool.insert; it runs in the claim's
+                transaction, so the claim is never committed without it.
+                The state database must be the one of this store.
+
+        Returns:
+            The result of record (True without one) if the caller should
+            forward the signal, False if it was already claimed
+        """
+        now = time.time()
+        keys = [(f"msg:{message_id}", now + self.message_ttl)]
+        if content_hash and self.content_ttl > 0:
+            keys.append((f"sig:{content_hash}", now + self.content_ttl))
+        result = True
+
+        with self._lock:
+            self._maybe_prune(now)
+
+            for key, _ in keys:
+                expires_at = self._memory.get(key)
+                if expires_at is not None and expires_at > now:
+                    return False
+
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for key, expires_at in keys:
+                    cursor = self._conn.execute(
+                        'INSERT INTO forwarded_signals (key, expires_at) VALUES (?, ?) '
+                        'ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at '
+                        'WHERE forwarded_signals.expires_at <= ?',
+                        (key, expires_at, now)
+                    )
+                    if cursor.rowcount == 0:
+                        self._conn.execute('ROLLBACK')
+                        return False
+                if record is not None:
+                    result = record(self._conn)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+            for key, expires_at in keys:
+                self._remember(key, expires_at)
+
+        return result
+
+    def release(self, message_id, content_hash=None):
+        """
+        Forget a claim so the message can be forwarded again
+
+        Args:
+            message_id: Gmail message ID
+            content_hash: Hash passed to claim() (optional)
+        """
+        keys = [f"msg:{message_id}"]
+        if content_hash:
+            keys.append(f"sig:{content_hash}")
+
+        with self._lock:
+            for key in keys:
+                self._memory.pop(key, None)
+                self._conn.execute('DELETE FROM forwarded_signals WHERE key = ?', (key,))
+
+    def _remember(self, key, expires_at):
+        """Add a key to the bounded in-memory front (lock must be held)"""
+        self._memory[key] = expires_at
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _maybe_prune(self, now):
+        """Delete expired rows at most once per PRUNE_INTERVAL (lock must be held)"""
+        if now - self._last_prune < self.PRUNE_INTERVAL:
+            return
+
+        self._last_prune = now
+        cursor = self._conn.execute('DELETE FROM forwarded_signals WHERE expires_at <= ?', (now,))
+        if cursor.rowcount:
+            logger.info("Pruned %d expired dedupe entries", cursor.rowcount)
@@ -0,0 +1,247 @@
+"""
+End-to-end benchmark of the webhook against local Gmail and Mathematricks stand-ins
+
+Delivers synthetic mail to a StubGmailServer and replays the matching
+Pub/Sub push envelopes into the real /webhook route at a fixed rate, then
+waits for the pipeline to forward every signal to a StubMathematricksServer.
+Both stand-ins can add latency and fail a share of requests. The result is
+a JSON-serialisable dict (run with `main.py bench`) so runs of different
+versions can be compared.
+"""
+
+import base64
+import contextlib
+import http.client
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from werkzeug.serving import WSGIRequestHandler, make_server
+from config import Config
+
+
+def run_end_to_end(count=500, rate=50.0, signal_every=2, clients=8, gmail_latency=0.005,
+                   api_latency=0.01, gmail_error_rate=0.0, api_error_rate=0.0,
+                   drain_timeout=30.0, seed=1):
+    """
+    Run one end-to-end benchmark
+
+    Args:
+        count: Emails delivered, one push notification each
+        rate: Notifications per second offered to /webhook
+        signal_every: Every n-th email is a signal email
+        clients: Concurrent keep-alive connections posting notifications
+        gmail_latency / api_latency: Seconds added to every stand-in request
+        gmail_error_rate / api_error_rate: Share of stand-in requests that fail
+        drain_timeout: Seconds to wait for outstanding signals after the last notification
+        seed: Seed of the stand-ins' error decisions
+
+    Returns:
+        dict: Settings, notification acknowledgement stats, signal delivery
+            stats (throughput, latency percentiles, duplicates, lost) and
+            request counts
+    """
+    from benchmarks import make_mailbox, stub_credentials
+    from signal_pipeline import SignalPipeline
+    from stub_servers import StubGmailServer, StubMathematricksServer
+    from webhook import create_app
+
+    settings = {
+        'count': count, 'rate': rate, 'signal_every': signal_every, 'clients': clients,
+        'gmail_latency': gmail_latency, 'api_latency': api_latency,
+        'gmail_error_rate': gmail_error_rate, 'api_error_rate': api_error_rate,
+        'seed': seed
+    }
+    mailbox = make_mailbox(count, signal_every)
+    expected = {message['id'] for message in mailbox if message['snippet'].startswith('SIGNAL')}
+    sent_at = {}
+    acks = []
+    api_url = Config.MATHEMATRICKS_API_URL
+
+    with StubGmailServer(latency=gmail_latency, error_rate=gmail_error_rate, seed=seed) as gmail_server, \
+            StubMathematricksServer(latency=api_latency, error_rate=api_error_rate, seed=seed) as api_server, \
+            tempfile.TemporaryDirectory() as directory, \
+            _quiet_logging():
+        Config.MATHEMATRICKS_API_URL = api_server.url
+        pipeline = SignalPipeline(stub_credentials(gmail_server, directory), os.path.join(directory, 'state.db'))
+        pipeline.history_cursor.advance(gmail_server.history_id)
+        server = make_server('127.0.0.1', 0, create_app(pipeline), threaded=True,
+                             request_handler=_QuietRequestHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                poster = _EnvelopePoster(server.server_port)
+                futures = []
+
+                for index, message in enumerate(mailbox):
+                    # Open-loop pacing: notification i is due at start + i / rate
+                    delay = start + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    history_id = gmail_server.add_message(message)
+                    sent_at[message['id']] = time.time()
+                    futures.append(pool.submit(poster.post, history_id))
+
+                acks = [future.result() for future in futures]
+            sent = time.perf_counter() - start
+
+            deadline = time.monotonic() + drain_timeout
+            while not expected.issubset(api_server.accepted_at) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            pipeline.stop()
+            Config.MATHEMATRICKS_API_URL = api_url
+
+        accepted_at = dict(api_server.accepted_at)
+        delivered_ids = [payload.get('signalID') for payload in api_server.signals]
+        gmail_requests, gmail_errors = gmail_server.requests, gmail_server.errors
+        api_requests, api_errors = api_server.requests, api_server.errors
+
+    forwarded = expected.intersection(accepted_at)
+    latencies = sorted(accepted_at[message_id] - sent_at[message_id] for message_id in forwarded)
+    ack_latencies = sorted(latency for _, latency in acks)
+    last_forward = max(accepted_at.values(), default=None)
+
+    return {
+        'version': _git_version(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'settings': settings,
+        'notifications': {
+            'sent': len(acks),
+            'acknowledged': sum(status == 200 for status, _ in acks),
+            'rejected': sum(status != 200 for status, _ in acks),
+            'offered_per_s': rate,
+            'achieved_per_s': round(len(acks) / sent, 1) if sent else 0.0,
+            'ack_p50_ms': _percentile_ms(ack_latencies, 50),
+            'ack_p99_ms': _percentile_ms(ack_latencies, 99),
+        },
+        'signals': {
+            'expected': len(expected),
+            'forwarded': len(forwarded),
+            'lost': len(expected) - len(forwarded),
+            'duplicates': len(delivered_ids) - len(set(delivered_ids)),
+            'unexpected': len(set(accepted_at) - expected),
+            'per_s': round(len(forwarded) / (last_forward - min(sent_at.values())), 1) if forwarded else 0.0,
+            'latency_p50_ms': _percentile_ms(latencies, 50),
+            'latency_p99_ms': _percentile_ms(latencies, 99),
+            'latency_max_ms': _percentile_ms(latencies, 100),
+        },
+        'requests': {
+            'gmail': gmail_requests,
+            'gmail_errors': gmail_errors,
+            'api': api_requests,
+            'api_errors': api_errors,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'pipeline': pipeline.stats.counters(),
+    }
+
+
+def format_summary(result):
+    """
+    One-paragraph human-readable summary of a run_end_to_end result
+
+    Returns:
+        str: Summary lines
+    """
+    notifications = result['notifications']
+    signals = result['signals']
+    requests = result['requests']
+    return (
+        f"notifications: {notifications['acknowledged']}/{notifications['sent']} acknowledged at "
+        f"{notifications['achieved_per_s']}/s (offered {notifications['offered_per_s']}/s), "
+        f"ack p50 {notifications['ack_p50_ms']} ms p99 {notifications['ack_p99_ms']} ms\n"
+        f"signals: {signals['forwarded']}/{signals['expected']} forwarded at {signals['per_s']}/s, "
+        f"lost {signals['lost']}, duplicates {signals['duplicates']}, "
+        f"latency p50 {signals['latency_p50_ms']} ms p99 {signals['latency_p99_ms']} ms "
+        f"max {signals['latency_max_ms']} ms\n"
+        f"requests: gmail {requests['gmail']} ({requests['gmail_errors']} failed), "
+        f"api {requests['api']} ({requests['api_errors']} failed), elapsed {result['elapsed_s']} s"
+    )
+
+
+@contextlib.contextmanager
+def _quiet_logging():
+    """Only log errors while the benchmark runs; failures injected into the stand-ins log warnings"""
+    logging.disable(logging.WARNING)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    """Request handler that does not log every request"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class _EnvelopePoster:
+    """Posts Pub/Sub push envelopes to /webhook over one keep-alive connection per thread"""
+
+    def __init__(self, port):
+        self.port = port
+        self._local = threading.local()
+
+    def post(self, history_id):
+        """
+        Post the notification for a history ID
+
+        Returns:
+            tuple: (HTTP status, seconds until the response arrived)
+        """
+        data = base64.b64encode(json.dumps(
+            {'emailAddress': 'me@example.com', 'historyId': history_id}
+        ).encode()).decode()
+        body = json.dumps({
+            'message': {'data': data, 'messageId': str(history_id)},
+            'subscription': 'projects/bench/subscriptions/gmail-webhook-subscription'
+        })
+
+        start = time.perf_counter()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+
+        try:
+            connection.request('POST', '/webhook', body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            status = 0
+
+        return status, time.perf_counter() - start
+
+
+def _percentile_ms(sorted_seconds, percent):
+    """Nearest-rank percentile in milliseconds (None without samples)"""
+    if not sorted_seconds:
+        return None
+    index = max(0, -(-len(sorted_seconds) * percent // 100) - 1)
+    return round(sorted_seconds[index] * 1000, 1)
+
+
+def _git_version():
+    """Commit the benchmark ran against, if this is a git checkout"""
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
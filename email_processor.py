@@ -1,14 +1,298 @@
 import base64
 import email
+import logging
+import re
+from collections import OrderedDict
 from email.mime.text import MIMEText
+from email.utils import parseaddr
 from googleapiclient.errors import HttpError
 from config import Config
+from html_text import html_to_text
+from identifier_matcher import get_matcher
+
+logger = logging.getLogger(__name__)
+
+# Start of a quoted earlier message in a reply or forward
+QUOTE_HEADER_PATTERN = re.compile(
+    r'^(?:On .{1,300}wrote:|-{2,}\s*Original Message\s*-{2,})\s*$',
+    re.MULTILINE | re.IGNORECASE
+)
+QUOTED_LINE_PATTERN = re.compile(r'^>.*(?:\n|$)', re.MULTILINE)
+
+
+class MessageFetchError(Exception):
+    """A message could not be fetched for a reason that may go away (5xx, 429, network)"""
+
+
+def _decode_body_data(data, max_bytes=None):
+    """
+    Decode a base64url Gmail body to text, optionally only its first bytes
+
+    Args:
+        data: base64url encoded body
+        max_bytes: Maximum decoded bytes (None for all)
+
+    Returns:
+        tuple: (text, truncated: bool, decoded bytes)
+    """
+    if max_bytes is not None:
+        # 4 base64 characters encode 3 bytes
+        prefix_length = (max_bytes + 2) // 3 * 4
+        if len(data) > prefix_length:
+            raw = base64.urlsafe_b64decode(data[:prefix_length])[:max_bytes]
+            return raw.decode('utf-8', errors='replace'), True, len(raw)
+
+    raw = base64.urlsafe_b64decode(data)
+    return raw.decode('utf-8', errors='replace'), False, len(raw)
+
+
+def strip_quoted_reply(text):
+    """
+    Remove quoted earlier messages from a reply
+
+    Drops everything from an "On ... wrote:" or "Original Message" line
+    onwards, and any remaining lines starting with '>'.
+
+    Args:
+        text: Plain text body
+
+    Returns:
+        str: Body without quoted sections
+    """
+    match = QUOTE_HEADER_PATTERN.search(text)
+    if match:
+        text = text[:match.start()]
+    return QUOTED_LINE_PATTERN.sub('', text)
+
+
+class ParsedMessage:
+    """
+    Gmail message whose headers and bodies are decoded once, on first use
+
+    Detection, extraction and logging all read from the same instance, so
+    each MIME part is base64- and UTF-8-decoded at most once per message.
+    Decoded bodies are capped at Config.MAX_BODY_BYTES.
+    """
+
+    __slots__ = (
+        'message', 'truncated', 'skipped_parts', '_fetch_attachment', '_headers',
+        '_plain_body', '_html_part', '_html_body', '_html_text', '_body', '_content',
+        '_identifier_hits'
+    )
+
+    def __init__(self, message, fetch_attachment=None):
+        """
+        Args:
+            message: Gmail message object (any format)
+            fetch_attachment: Callable(attachment_id) returning base64url data for
+                bodies Gmail stores as attachments; such bodies are skipped without it
+        """
+        self.message = message
+        self.truncated = False
+        self.skipped_parts = 0
+        self._fetch_attachment = fetch_attachment
+        self._headers = None
+        self._plain_body = None
+        self._html_part = None
+        self._html_body = None
+        self._html_text = None
+        self._body = None
+        self._content = None
+        self._identifier_hits = None
+
+    @property
+    def id(self):
+        """Gmail message ID"""
+        return self.message.get('id')
+
+    @property
+    def internal_date(self):
+        """When Gmail received the message, as a Unix timestamp (None if unknown)"""
+        internal_date = self.message.get('internalDate')
+        return int(internal_date) / 1000 if internal_date else None
+
+    @property
+    def headers(self):
+        """Dictionary of headers"""
+        if self._headers is None:
+            self._headers = {
+                header['name']: header['value']
+                for header in self.message.get('payload', {}).get('headers', [])
+            }
+        return self._headers
+
+    @property
+    def subject(self):
+        """Subject header ('' if missing)"""
+        return self.headers.get('Subject', '')
+
+    @property
+    def plain_body(self):
+        """Concatenated text/plain parts"""
+        if self._plain_body is None:
+            self._decode_bodies()
+        return self._plain_body
+
+    @property
+    def html_body(self):
+        """First text/html part (only decoded when asked for)"""
+        if self._html_body is None:
+            if self._plain_body is None:
+                self._decode_bodies()
+
+            self._html_body = ''
+            data = self._part_data(self._html_part) if self._html_part else None
+            if data:
+                self._html_body, truncated, _ = _decode_body_data(data, Config.MAX_BODY_BYTES)
+                self.truncated = self.truncated or truncated
+        return self._html_body
+
+    @property
+    def attachments(self):
+        """Parts with a file name and a body, in MIME tree order"""
+        attachments = []
+        stack = [self.message.get('payload', {})]
+
+        while stack:
+            part = stack.pop()
+            if 'parts' in part:
+                stack.extend(reversed(part['parts']))
+            elif part.get('filename') and ('attachmentId' in part.get('body', {}) or 'data' in part.get('body', {})):
+                attachments.append(part)
+
+        return attachments
+
+    @property
+    def html_text(self):
+        """First text/html part converted to plain text"""
+        if self._html_text is None:
+            self._html_text, truncated = html_to_text(self.html_body)
+            self.truncated = self.truncated or truncated
+        return self._html_text
+
+    @property
+    def body(self):
+        """Plain text body, falling back to the HTML part (as text) when there is no plain text"""
+        if self._body is None:
+            self._body = self.plain_body or (self.html_text if Config.CONVERT_HTML_BODIES else self.html_body)
+        return self._body
+
+    @property
+    def content(self):
+        """Subject and body as one string, the text signals are extracted from"""
+        if self._content is None:
+            self._content = f"{self.subject}\n{self.body}"
+        return self._content
+
+    def identifier_hits(self, matcher):
+        """
+        Signal identifiers in the subject and body, scanned once per matcher
+
+        Args:
+            matcher: IdentifierMatcher of the mailbox
+
+        Returns:
+            list: (identifier, offset in content) tuples ordered by offset
+        """
+        if self._identifier_hits is None or self._identifier_hits[0] is not matcher:
+            self._identifier_hits = (matcher, matcher.find(self.content))
+        return self._identifier_hits[1]
+
+    def _decode_bodies(self):
+        """
+        Walk the MIME tree once, decoding text/plain parts into a list
+
+        Stops decoding once Config.MAX_BODY_BYTES of body data is decoded and
+        remembers the first text/html part for the HTML fallback.
+        """
+        payload = self.message.get('payload', {})
+        remaining = Config.MAX_BODY_BYTES
+        plain_parts = []
+
+        if 'parts' not in payload and payload.get('mimeType') != 'text/html':
+            # Simple (single part) message: its body is the text whatever the type
+            payload = dict(payload, mimeType='text/plain')
+
+        stack = [payload]
+
+        while stack:
+            part = stack.pop()
+
+            if 'parts' in part:
+                stack.extend(reversed(part['parts']))
+                continue
+
+            mime_type = part.get('mimeType', '')
+
+            if mime_type == 'text/html':
+                if self._html_part is None:
+                    self._html_part = part
+                continue
+
+            if mime_type != 'text/plain':
+                continue
+
+            if remaining <= 0:
+                self.truncated = True
+                break
+
+            data = self._part_data(part)
+            if not data:
+                continue
+
+            text, truncated, size = _decode_body_data(data, remaining)
+            if Config.STRIP_QUOTED_REPLIES:
+                text = strip_quoted_reply(text)
+
+            plain_parts.append(text)
+            remaining -= size
+            self.truncated = self.truncated or truncated
+
+        self._plain_body = ''.join(plain_parts)
+
+    def _part_data(self, part):
+        """
+        Get the base64url data of a body part
+
+        Returns:
+            str: Body data, or None if the part has no inline data and its
+                attachment-backed body may not be fetched
+        """
+        body = part.get('body', {})
+
+        if 'data' in body:
+            return body['data']
+
+        if 'attachmentId' in body:
+            if self._fetch_attachment is None:
+                self.skipped_parts += 1
+                return None
+            return self._fetch_attachment(body['attachmentId'])
+
+        return None
+
 
 class EmailProcessor:
     """Process and parse Gmail messages"""
 
-    def __init__(self, gmail_service):
+    # Maximum number of calls Gmail accepts in one batch request
+    MAX_BATCH_SIZE = 100
+
+    # Headers requested by the metadata-only prefilter
+    PREFILTER_HEADERS = ['Subject', 'From']
+
+    def __init__(self, gmail_service, stats=None, signal_identifier=None):
+        """
+        Args:
+            gmail_service: Gmail API service
+            stats: Optional PipelineStats for the history page counter
+            signal_identifier: Text marking a signal email, or a list of
+                identifiers (default: Config.SIGNAL_IDENTIFIER)
+        """
         self.service = gmail_service
+        self.stats = stats
+        self.signal_identifier = signal_identifier or Config.SIGNAL_IDENTIFIER
+        self.identifier_matcher = get_matcher(self.signal_identifier)
 
     def get_message(self, message_id):
         """
@@ -18,7 +302,10 @@ class EmailProcessor:
             message_id: Gmail message ID
 
         Returns:
-            dict: Message data
+            dict: Message data, or None if the message no longer exists
+
+        Raises:
+            MessageFetchError: Any other error; fetching again later may succeed
         """
         try:
             message = self.service.users().messages().get(
@@ -28,142 +315,384 @@ class EmailProcessor:
             ).execute()
             return message
         except HttpError as error:
-            print(f"Error fetching message {message_id}: {error}")
-            return None
+            if error.resp.status == 404:
+                logger.info("Message %s no longer exists", message_id)
+                return None
+            raise MessageFetchError(f"Error fetching message {message_id}: {error}") from error
 
-    def get_message_body(self, message):
+    def get_messages(self, message_ids, format='full', metadata_headers=None):
         """
-        Extract message body from Gmail message
+        Fetch several email messages using Gmail batch requests
+
+        IDs are sent in chunks of Config.GMAIL_BATCH_SIZE (Gmail accepts at
+        most 100 calls per batch). A failed item is reported in the errors
+        mapping without aborting the rest of the batch.
+
+        Args:
+            message_ids: Iterable of Gmail message IDs
+            format: Gmail message format (default: 'full')
+            metadata_headers: Headers to return when format is 'metadata'
+
+        Returns:
+            tuple: (messages: dict of ID to message, errors: dict of ID to error)
+        """
+        messages = {}
+        errors = {}
+
+        # Drop duplicates while keeping the original order
+        message_ids = list(dict.fromkeys(message_ids))
+        batch_size = max(1, min(Config.GMAIL_BATCH_SIZE, self.MAX_BATCH_SIZE))
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = str(exception)
+            else:
+                messages[request_id] = response
+
+        for start in range(0, len(message_ids), batch_size):
+            chunk = message_ids[start:start + batch_size]
+            batch = self.service.new_batch_http_request(callback=callback)
+
+            for message_id in chunk:
+                params = {'userId': 'me', 'id': message_id, 'format': format}
+                if format == 'metadata' and metadata_headers:
+                    params['metadataHeaders'] = metadata_headers
+
+                batch.add(
+                    self.service.users().messages().get(**params),
+                    request_id=message_id
+                )
+
+            try:
+                batch.execute()
+            except HttpError as error:
+                # The whole batch request failed - report every item in it
+                logger.warning("Error executing message batch: %s", error)
+                for message_id in chunk:
+                    if message_id not in messages:
+                        errors.setdefault(message_id, str(error))
+
+        for message_id, error in errors.items():
+            logger.warning("Error fetching message %s: %s", message_id, error)
+
+        return messages, errors
+
+    def prefilter(self, message_ids):
+        """
+        Cheaply narrow a list of messages down to possible signal emails
+
+        Only the Subject/From headers and snippet are fetched
+        (format='metadata'). When Config.SIGNAL_SENDER_ALLOWLIST is set, every
+        message from an allowlisted sender is a candidate and all other
+        senders are dropped; otherwise a message is a candidate when the
+        signal identifier appears in its subject or snippet. Messages whose
+        metadata could not be fetched are kept as candidates.
+
+        The snippet only covers the start of the body, so without an
+        allowlist a signal whose identifier appears later is dropped here;
+        this is why Config.PREFILTER_ENABLED is off by default.
 
         Args:
-            message: Gmail message object
+            message_ids: List of Gmail message IDs
 
         Returns:
-            str: Message body text
+            tuple: (candidate_ids: list, report: dict with 'checked',
+                    'rejected' and 'bytes_saved')
         """
-        if 'payload' not in message:
-            return ""
+        metadata, errors = self.get_messages(
+            message_ids,
+            format='metadata',
+            metadata_headers=self.PREFILTER_HEADERS
+        )
+
+        candidates = []
+        rejected = 0
+        bytes_saved = 0
+
+        for message_id in message_ids:
+            message = metadata.get(message_id)
+
+            if message is None or self.could_be_signal(message):
+                candidates.append(message_id)
+            else:
+                rejected += 1
+                bytes_saved += message.get('sizeEstimate', 0)
+
+        report = {
+            'checked': len(message_ids),
+            'rejected': rejected,
+            'bytes_saved': bytes_saved
+        }
 
-        payload = message['payload']
+        return candidates, report
 
-        # Check for simple body
-        if 'body' in payload and 'data' in payload['body']:
-            return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+    def could_be_signal(self, message):
+        """
+        Decide from headers and snippet alone whether a message may be a signal
 
-        # Check for multipart message
-        if 'parts' in payload:
-            return self._get_multipart_body(payload['parts'])
+        Args:
+            message: Gmail message fetched with format='metadata'
+
+        Returns:
+            bool: True if the full message should be fetched
+        """
+        headers = self.get_message_headers(message)
+
+        allowlist = Config.SIGNAL_SENDER_ALLOWLIST
+        if allowlist:
+            sender = parseaddr(headers.get('From', ''))[1].lower()
+            domain = sender.rpartition('@')[2]
+            return sender in allowlist or f"@{domain}" in allowlist
 
-        return ""
+        if self.identifier_matcher.matches(headers.get('Subject', '')):
+            return True
 
-    def _get_multipart_body(self, parts):
+        return Config.PREFILTER_MATCH_SNIPPET and self.identifier_matcher.matches(message.get('snippet', ''))
+
+    def parse(self, message):
         """
-        Extract body from multipart message
+        Wrap a Gmail message in a ParsedMessage that decodes it only once
 
         Args:
-            parts: List of message parts
+            message: Gmail message object (or an existing ParsedMessage)
 
         Returns:
-            str: Combined message body
+            ParsedMessage: Lazily decoded message view
+        """
+        if isinstance(message, ParsedMessage):
+            return message
+
+        fetch_attachment = None
+        if Config.FETCH_ATTACHMENT_BODIES and message.get('id'):
+            def fetch_attachment(attachment_id):
+                return self.get_attachment_data(message['id'], attachment_id)
+
+        return ParsedMessage(message, fetch_attachment)
+
+    def get_attachment_data(self, message_id, attachment_id):
         """
-        body = ""
+        Fetch the body of a part Gmail stores as an attachment
 
-        for part in parts:
-            mime_type = part.get('mimeType', '')
+        Args:
+            message_id: Gmail message ID
+            attachment_id: body.attachmentId of the part
 
-            # Recursively handle nested parts
-            if 'parts' in part:
-                body += self._get_multipart_body(part['parts'])
-            elif mime_type == 'text/plain' and 'data' in part.get('body', {}):
-                # Decode text/plain part
-                text = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                body += text
-            elif mime_type == 'text/html' and not body and 'data' in part.get('body', {}):
-                # Fallback to HTML if no plain text found
-                html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-                body += html
-
-        return body
+        Returns:
+            str: base64url encoded data, or None on error
+        """
+        try:
+            attachment = self.service.users().messages().attachments().get(
+                userId='me',
+                messageId=message_id,
+                id=attachment_id
+            ).execute()
+            return attachment.get('data')
+        except HttpError as error:
+            logger.warning("Error fetching attachment %s of message %s: %s", attachment_id, message_id, error)
+            return None
+
+    def get_message_body(self, message):
+        """
+        Extract message body from Gmail message
+
+        Args:
+            message: Gmail message object or ParsedMessage
+
+        Returns:
+            str: Message body text (plain text, or HTML if there is none)
+        """
+        return self.parse(message).body
 
     def get_message_headers(self, message):
         """
         Extract headers from Gmail message
 
         Args:
-            message: Gmail message object
+            message: Gmail message object or ParsedMessage
 
         Returns:
             dict: Dictionary of headers
         """
-        headers = {}
-
-        if 'payload' in message and 'headers' in message['payload']:
-            for header in message['payload']['headers']:
-                headers[header['name']] = header['value']
-
-        return headers
+        return self.parse(message).headers
 
     def is_signal_email(self, message):
         """
-        Check if email contains the signal identifier
+        Check if email contains any of the signal identifiers
+
+        The hits are cached on the ParsedMessage, so the extractor of the
+        same mailbox does not scan the message again.
 
         Args:
-            message: Gmail message object
+            message: Gmail message object or ParsedMessage
 
         Returns:
             bool: True if message is a signal email
         """
-        # Get headers
-        headers = self.get_message_headers(message)
-        subject = headers.get('Subject', '')
-
-        # Get body
-        body = self.get_message_body(message)
-
-        # Check if signal identifier is present
-        signal_id = Config.SIGNAL_IDENTIFIER
-        return signal_id in subject or signal_id in body
+        return bool(self.parse(message).identifier_hits(self.identifier_matcher))
 
     def get_message_summary(self, message):
         """
         Get a summary of the message for logging
 
         Args:
-            message: Gmail message object
+            message: Gmail message object or ParsedMessage
 
         Returns:
             dict: Message summary
         """
-        headers = self.get_message_headers(message)
+        parsed = self.parse(message)
+        headers = parsed.headers
 
         return {
-            'id': message.get('id'),
-            'threadId': message.get('threadId'),
+            'id': parsed.id,
+            'threadId': parsed.message.get('threadId'),
             'from': headers.get('From', ''),
             'to': headers.get('To', ''),
-            'subject': headers.get('Subject', ''),
+            'subject': parsed.subject,
             'date': headers.get('Date', ''),
-            'snippet': message.get('snippet', '')
+            'snippet': parsed.message.get('snippet', ''),
+            'body_length': len(parsed.body),
+            'truncated': parsed.truncated,
+            'skipped_parts': parsed.skipped_parts
         }
 
-    def get_history(self, start_history_id):
+    def iter_history(self, start_history_id, label_id=None, page_size=None):
         """
-        Get message history since a specific history ID
+        Lazily yield the IDs of messages added since a history ID
+
+        Pages are requested one at a time as the caller consumes IDs, so a
+        long catch-up runs in constant memory. IDs are deduplicated across
+        pages within a bounded window. If Gmail answers 404 because the
+        history ID has expired, falls back to listing recent messages
+        (the last Config.HISTORY_RESYNC_DAYS days).
+
+        When the generator is exhausted, self.latest_history_id holds the
+        mailbox history ID the yielded messages are complete up to.
 
         Args:
             start_history_id: Starting history ID
+            label_id: Only return messages with this label (default: Config.HISTORY_LABEL_ID)
+            page_size: Records per page (default: Config.HISTORY_PAGE_SIZE)
+
+        Yields:
+            str: Gmail message ID
+        """
+        label_id = label_id or Config.HISTORY_LABEL_ID
+        page_size = page_size or Config.HISTORY_PAGE_SIZE
+        seen = BoundedIdSet(Config.HISTORY_DEDUPE_WINDOW)
+        page_token = None
+
+        self.latest_history_id = int(start_history_id)
+
+        while True:
+            params = {
+                'userId': 'me',
+                'startHistoryId': start_history_id,
+                'historyTypes': ['messageAdded'],
+                'maxResults': page_size
+            }
+            if label_id:
+                params['labelId'] = label_id
+            if page_token:
+                params['pageToken'] = page_token
+
+            try:
+                history = self.service.users().history().list(**params).execute()
+                self._increment('history_pages')
+            except HttpError as error:
+                if error.resp.status == 404 and page_token is None:
+                    logger.warning("History ID %s has expired, resyncing recent messages", start_history_id)
+                    yield from self._iter_resync(label_id, page_size, seen)
+                    return
+                raise
+
+            for history_record in history.get('history', []):
+                for message_info in history_record.get('messagesAdded', []):
+                    message_id = message_info['message']['id']
+                    if seen.add(message_id):
+                        yield message_id
+
+            page_token = history.get('nextPageToken')
+            if not page_token:
+                self.latest_history_id = max(
+                    self.latest_history_id,
+                    int(history.get('historyId', 0))
+                )
+                return
+
+    def get_current_history_id(self):
+        """
+        Get the mailbox's current history ID
 
         Returns:
-            list: List of history records
+            int: History ID from the user's profile
         """
-        try:
-            history = self.service.users().history().list(
-                userId='me',
-                startHistoryId=start_history_id,
-                historyTypes=['messageAdded']
-            ).execute()
+        profile = self.service.users().getProfile(userId='me').execute()
+        return int(profile['historyId'])
 
-            return history.get('history', [])
-        except HttpError as error:
-            print(f"Error fetching history: {error}")
-            return []
+    def _iter_resync(self, label_id, page_size, seen):
+        """
+        Yield recent message IDs with messages().list after history expired
+
+        Args:
+            label_id: Label to list (None for all mail)
+            page_size: Messages per page
+            seen: BoundedIdSet used for deduplication
+        """
+        # Take the history ID first so nothing arriving during the listing is lost
+        resync_history_id = self.get_current_history_id()
+        page_token = None
+
+        while True:
+            params = {
+                'userId': 'me',
+                'q': f"newer_than:{Config.HISTORY_RESYNC_DAYS}d",
+                'maxResults': page_size
+            }
+            if label_id:
+                params['labelIds'] = [label_id]
+            if page_token:
+                params['pageToken'] = page_token
+
+            response = self.service.users().messages().list(**params).execute()
+            self._increment('history_pages')
+
+            for message_info in response.get('messages', []):
+                if seen.add(message_info['id']):
+                    yield message_info['id']
+
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                self.latest_history_id = resync_history_id
+                return
+
+    def _increment(self, name):
+        """Increment a stats counter if stats are attached"""
+        if self.stats is not None:
+            self.stats.increment(name)
+
+
+class BoundedIdSet:
+    """Set of recently seen IDs that forgets the oldest past a fixed size"""
+
+    def __init__(self, max_size):
+        self.max_size = max(1, int(max_size))
+        self._ids = OrderedDict()
+
+    def add(self, item_id):
+        """
+        Add an ID
+
+        Returns:
+            bool: True if the ID was not already present
+        """
+        if item_id in self._ids:
+            return False
+
+        self._ids[item_id] = None
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+        return True
+
+    def __contains__(self, item_id):
+        return item_id in self._ids
@@ -0,0 +1,143 @@
+import logging
+import threading
+from dedupe_store import DedupeStore
+
+logger = logging.getLogger(__name__)
+
+
+class ForwardLedger:
+    """
+    Claim -> spool -> send -> mark bookkeeping of direct signal sends
+
+    Shared by SignalPipeline and AsyncSignalEngine, which only differ in how
+    a payload is sent: the engine claims a signal with claim(), sends it with
+    its own forwarder if a spool ID comes back, and reports the outcome to
+    finish(). Neither method sends anything or waits on the network; the
+    async engine runs them on worker threads.
+    """
+
+    def __init__(self, dedupe_store, signal_spool, spool_drainer, lease, stats=None):
+        """
+        Args:
+            dedupe_store: DedupeStore recording forwarded signals
+            signal_spool: SignalSpool every payload is written to before it is sent
+            spool_drainer: SpoolDrainer redelivering queued and failed signals
+            lease: Seconds a direct send keeps its spool entry from the drainer
+                (the forwarder's max_send_time())
+            stats: Optional PipelineStats
+        """
+        self.dedupe_store = dedupe_store
+        self.signal_spool = signal_spool
+        self.spool_drainer = spool_drainer
+        self.lease = lease
+        self.stats = stats
+
+        # Spool IDs of signals this process is sending right now
+        self._in_flight = set()
+        self._in_flight_lock = threading.Lock()
+
+        # Keeps a claimed signal from being counted as a backlog by another
+        # claim before it is registered as in flight
+        self._claim_lock = threading.Lock()
+
+    def claim(self, payload, claim_id, api_url=None):
+        """
+        Claim and spool a signal, queued for the drainer if earlier signals are undelivered
+
+        Args:
+            payload: Formatted signal payload
+            claim_id: Dedupe key recorded as forwarded (the message ID, or
+                the signal ID of an attachment batch)
+            api_url: Endpoint chosen by a routing rule (None for the default)
+
+        Returns:
+            int: Spool ID of the entry to send now (then registered as in
+                flight until finish()), or None if the signal was already
+                forwarded or was queued behind a backlog
+        """
+        with self._claim_lock:
+            # Earlier undelivered signals must go out first; this process's own
+            # concurrent sends (other workers, other mailboxes) are not a backlog
+            backlog = self.has_backlog()
+
+            # Queued entries are due at once for the drainer; a direct send holds
+            # a lease so the drainer leaves it alone while it is in flight
+            lease = 0 if backlog else self.lease
+
+            # Make sure this message (or, if enabled, the same signal) is only
+            # forwarded once, and spool the payload in the same transaction so a
+            # failed or interrupted forward is redelivered rather than lost
+            content_hash = DedupeStore.content_hash([payload['strategy_name'], payload['signal']])
+            spool_id = self.dedupe_store.claim(
+                claim_id, content_hash,
+                record=lambda conn: self.signal_spool.insert(conn, payload, lease=lease, api_url=api_url)
+            )
+
+            if spool_id and not backlog:
+                with self._in_flight_lock:
+                    self._in_flight.add(spool_id)
+
+        if not spool_id:
+            logger.warning("Signal already forwarded, dropping duplicate", extra={'signal_id': payload['signalID']})
+            self._increment('signals_duplicate')
+            return None
+
+        if backlog:
+            logger.info("Signal queued behind undelivered signals", extra={'signal_id': payload['signalID']})
+            self._increment('signals_spooled')
+            self.spool_drainer.wake()
+            return None
+
+        return spool_id
+
+    def finish(self, spool_id, payload, success, response):
+        """
+        Record the outcome of a send started by claim()
+
+        Args:
+            spool_id: Spool ID returned by claim()
+            payload: Signal payload that was sent
+            success: Whether the API accepted it
+            response: Response dict of the forwarder
+        """
+        # Still in flight until its spool entry is updated, so no claim in
+        # between takes it for a backlog
+        try:
+            if success:
+                logger.info("Forwarded signal", extra={'signal_id': payload['signalID']})
+                self.signal_spool.mark_done(spool_id)
+                self._increment('signals_forwarded')
+            elif not response.get('retryable', True):
+                # Sending it again cannot succeed and would hold up the signals behind it
+                logger.error("Signal rejected, dead-lettering it: %s", response.get('error'),
+                             extra={'signal_id': payload['signalID']})
+                self.signal_spool.dead_letter(spool_id, response.get('error'))
+                self._increment('signals_rejected')
+            else:
+                logger.warning("Failed to forward signal, spooled for redelivery: %s", response.get('error'),
+                               extra={'signal_id': payload['signalID']})
+                self.signal_spool.mark_failed(spool_id, response.get('error'))
+                self._increment('signals_failed')
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.discard(spool_id)
+
+        # Signals queued behind this one while it was in flight can go now
+        if self.has_backlog():
+            self.spool_drainer.wake()
+
+    def has_backlog(self):
+        """
+        Check for undelivered signals other than the ones this process is sending
+
+        Returns:
+            bool: True if the spool holds other pending entries
+        """
+        with self._in_flight_lock:
+            in_flight = list(self._in_flight)
+        return self.signal_spool.has_backlog(exclude=in_flight)
+
+    def _increment(self, name):
+        """Increment a stats counter if stats are attached"""
+        if self.stats is not None:
+            self.stats.increment(name)
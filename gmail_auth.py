@@ -1,22 +1,43 @@
 import os
 import json
+import logging
+import functools
+import random
+import tempfile
+import threading
+from datetime import datetime
+import httplib2
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from config import Config
 
+logger = logging.getLogger(__name__)
+
+
 class GmailAuthenticator:
     """Handle Gmail API authentication using OAuth2"""
 
-    def __init__(self):
+    def __init__(self, token_file=None):
+        """
+        Args:
+            token_file: OAuth token file of the account (default: token.json)
+        """
         self.creds = None
         self.service = None
-        self.token_file = 'token.json'
+        self.token_file = token_file or 'token.json'
         self.credentials_file = 'credentials.json'
 
-    def authenticate(self):
-        """Authenticate and return Gmail API service"""
+    def load_credentials(self):
+        """
+        Load credentials from token.json, refreshing or running the OAuth flow if needed
+
+        Returns:
+            Credentials: Valid OAuth credentials
+        """
 
         # Load existing token if available
         if os.path.exists(self.token_file):
@@ -50,11 +71,41 @@ class GmailAuthenticator:
                 self.creds = flow.run_local_server(port=8080)
 
             # Save the credentials for the next run
-            with open(self.token_file, 'w') as token:
-                token.write(self.creds.to_json())
+            self.save_credentials(self.creds)
+
+        return self.creds
+
+    def save_credentials(self, creds):
+        """
+        Write credentials to token.json atomically
+
+        The token is written to a temporary file in the same directory and
+        renamed over token.json, so a crash or a concurrent reader never
+        sees a partially written file.
 
-        # Build Gmail API service
-        self.service = build('gmail', 'v1', credentials=self.creds)
+        Args:
+            creds: OAuth credentials
+        """
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        fd, temp_path = tempfile.mkstemp(prefix='.token-', suffix='.json', dir=directory)
+
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(creds.to_json())
+                token.flush()
+                os.fsync(token.fileno())
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.token_file)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def authenticate(self):
+        """Authenticate and return Gmail API service"""
+        self.load_credentials()
+
+        # Build Gmail API service from the discovery document bundled with the client
+        self.service = build('gmail', 'v1', credentials=self.creds, static_discovery=True)
         return self.service
 
     def get_service(self):
@@ -84,11 +135,11 @@ class GmailAuthenticator:
 
         try:
             watch_response = self.service.users().watch(userId='me', body=request_body).execute()
-            print(f"Push notifications enabled. History ID: {watch_response.get('historyId')}")
-            print(f"Expiration: {watch_response.get('expiration')}")
+            logger.info("Push notifications enabled. History ID: %s, expiration: %s",
+                        watch_response.get('historyId'), watch_response.get('expiration'))
             return watch_response
         except Exception as e:
-            print(f"Error setting up push notifications: {e}")
+            logger.error("Error setting up push notifications: %s", e)
             raise
 
     def stop_push_notifications(self):
@@ -98,7 +149,155 @@ class GmailAuthenticator:
 
         try:
             self.service.users().stop(userId='me').execute()
-            print("Push notifications stopped")
+            logger.info("Push notifications stopped")
         except Exception as e:
-            print(f"Error stopping push notifications: {e}")
+            logger.error("Error stopping push notifications: %s", e)
             raise
+
+
+class CredentialsManager:
+    """
+    Long-lived, thread-safe source of Gmail credentials and services
+
+    Credentials are loaded once and refreshed by a background thread
+    shortly before they expire, so request handlers never wait on a token
+    refresh. The discovery document is parsed once, and each thread gets
+    its own Gmail service because httplib2 connections are not thread-safe.
+    """
+
+    def __init__(self, authenticator=None, refresh_margin=None, discovery_document=None):
+        """
+        Args:
+            authenticator: GmailAuthenticator that loads and saves token.json
+                (default: a new one)
+            refresh_margin: Seconds before expiry the token is refreshed
+                (default: Config.TOKEN_REFRESH_MARGIN)
+            discovery_document: Gmail discovery document (default: the one
+                bundled with googleapiclient)
+        """
+        self.authenticator = authenticator or GmailAuthenticator()
+        self.refresh_margin = refresh_margin or Config.TOKEN_REFRESH_MARGIN
+        self._discovery_document = discovery_document
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failures = 0
+
+    @property
+    def creds(self):
+        """Current credentials (None until first loaded)"""
+        return self.authenticator.creds
+
+    def credentials(self):
+        """
+        Get valid credentials, loading or refreshing them if needed
+
+        Returns:
+            Credentials: OAuth credentials
+        """
+        creds = self.authenticator.creds
+        if creds is not None and creds.valid:
+            return creds
+
+        with self._lock:
+            creds = self.authenticator.creds
+            if creds is None:
+                return self.authenticator.load_credentials()
+            if not creds.valid:
+                self._refresh_locked()
+            return creds
+
+    def refresh(self):
+        """Refresh the access token now and save it"""
+        with self._lock:
+            if self.authenticator.creds is None:
+                self.authenticator.load_credentials()
+            else:
+                self._refresh_locked()
+
+    def get_service(self):
+        """
+        Get the calling thread's Gmail service
+
+        Returns:
+            googleapiclient.discovery.Resource: Gmail API service
+        """
+        service = getattr(self._local, 'service', None)
+
+        if service is None:
+            http = AuthorizedHttp(self.credentials(), http=httplib2.Http(timeout=Config.API_READ_TIMEOUT))
+            service = build_from_document(self.discovery_document(), http=http)
+            self._local.service = service
+
+        return service
+
+    def discovery_document(self):
+        """Parsed Gmail discovery document, loaded once per process and shared by every mailbox"""
+        if self._discovery_document is None:
+            self._discovery_document = _bundled_discovery_document()
+        elif isinstance(self._discovery_document, str):
+            self._discovery_document = json.loads(self._discovery_document)
+        return self._discovery_document
+
+    def start(self):
+        """Start the thread that loads and proactively refreshes the token (safe to call more than once)"""
+        with self._lock:
+            if self._thread:
+                return
+
+            self._thread = threading.Thread(target=self._run, name='token-refresher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the refresh thread"""
+        self._stop.set()
+
+    def seconds_until_refresh(self):
+        """
+        Seconds until the token should be refreshed
+
+        Returns:
+            float: Delay (0 if the token is due now)
+        """
+        creds = self.authenticator.creds
+        if creds is None:
+            return 0.0
+        if creds.expiry is None:
+            return self.refresh_margin
+
+        # google-auth keeps expiry as a naive UTC datetime
+        remaining = (creds.expiry - datetime.utcnow()).total_seconds()
+        return max(0.0, remaining - self.refresh_margin)
+
+    def _refresh_locked(self):
+        """Refresh and save the token (lock must be held)"""
+        creds = self.authenticator.creds
+        creds.refresh(Request())
+        self.authenticator.save_credentials(creds)
+        logger.info("Gmail access token refreshed, valid until %s", creds.expiry)
+
+    def _run(self):
+        """Refresher loop: refresh shortly before expiry, retrying failures with backoff"""
+        while True:
+            if self._failures:
+                # Jittered exponential backoff, never past the refresh margin
+                delay = random.uniform(0, min(self.refresh_margin / 2, 2 ** self._failures))
+            else:
+                delay = self.seconds_until_refresh()
+
+            if self._stop.wait(delay):
+                return
+
+            try:
+                self.refresh()
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                logger.error("Error refreshing Gmail access token (attempt %d): %s", self._failures, e)
+
+
+@functools.lru_cache(maxsize=1)
+def _bundled_discovery_document():
+    """Gmail discovery document bundled with googleapiclient, parsed once per process"""
+    return json.loads(get_static_doc('gmail', 'v1'))
@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+from state_store import connect_state_db
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; thread locking still applies
+    fcntl = None
+
+
+class HistoryCursor:
+    """Durable record of the last fully processed Gmail history ID"""
+
+    def __init__(self, name='me', db_path=None):
+        """
+        Args:
+            name: Cursor name (one cursor per mailbox)
+            db_path: State database path (default: Config.STATE_DB_PATH)
+        """
+        self.name = name
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self._conn = connect_state_db(self.db_path)
+        self._conn_lock = threading.Lock()
+        self._hold_lock = threading.Lock()
+
+        # Sidecar file flocked by the current holder of the catch-up rights
+        self._lock_file = None
+
+        with self._conn_lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS history_cursor ('
+                'name TEXT PRIMARY KEY, '
+                'history_id INTEGER NOT NULL, '
+                'updated_at REAL NOT NULL)'
+            )
+
+    def get(self):
+        """
+        Get the last fully processed history ID
+
+        Returns:
+            int: History ID, or None if the cursor was never set
+        """
+        with self._conn_lock:
+            row = self._conn.execute(
+                'SELECT history_id FROM history_cursor WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def advance(self, history_id):
+        """
+        Move the cursor forward to a history ID
+
+        The update is a single compare-and-set statement, so the cursor never
+        moves backwards even if several threads or processes race.
+
+        Args:
+            history_id: Last fully processed history ID
+
+        Returns:
+            bool: True if the cursor moved, False if it was already at or past it
+        """
+        history_id = int(history_id)
+
+        with self._conn_lock:
+            cursor = self._conn.execute(
+                'INSERT INTO history_cursor (name, history_id, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET '
+                'history_id = excluded.history_id, updated_at = excluded.updated_at '
+                'WHERE excluded.history_id > history_cursor.history_id',
+                (self.name, history_id, time.time())
+            )
+
+        return cursor.rowcount > 0
+
+    @contextmanager
+    def hold(self):
+        """
+        Hold exclusive catch-up rights for this cursor
+
+        Serialises history processing across threads (in-process lock) and
+        across processes sharing the database (flock on a sidecar file), so
+        two handlers never read the same history window. Yields the current
+        cursor value.
+        """
+        self.acquire()
+
+        try:
+            yield self.get()
+        finally:
+            self.release()
+
+    def acquire(self, blocking=True):
+        """
+        Take the catch-up rights hold() takes, to be given back with release()
+
+        Args:
+            blocking: Wait for another holder; if False, give up at once
+
+        Returns:
+            bool: True if the rights were taken
+        """
+        if not self._hold_lock.acquire(blocking):
+            return False
+
+        if fcntl is None:
+            return True
+
+        lock_file = None
+
+        try:
+            lock_file = open(f"{self.db_path}.{self.name}.lock", 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BaseException as e:
+            if lock_file is not None:
+                lock_file.close()
+            self._hold_lock.release()
+            if isinstance(e, BlockingIOError):
+                # Another process holds the lock
+                return False
+            raise
+
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        """Give back the catch-up rights taken by acquire()"""
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+        self._hold_lock.release()
@@ -0,0 +1,128 @@
+import logging
+import random
+import threading
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryPoller:
+    """
+    Drive the pipeline by polling Gmail history instead of receiving push notifications
+
+    Each poll catches up from the persistent history cursor, exactly like a
+    push notification would. The interval drops to the minimum as soon as
+    a poll finds signal emails, stays put while ordinary mail arrives, and
+    grows by the backoff factor (up to the maximum) while the mailbox is
+    idle. Every wait is jittered so several pollers don't synchronise.
+    """
+
+    def __init__(self, pipeline, min_interval=None, max_interval=None, backoff_factor=None, jitter=None):
+        """
+        Args:
+            pipeline: SignalPipeline to drive
+            min_interval: Seconds between polls while signals flow (default: Config.POLL_MIN_INTERVAL)
+            max_interval: Longest idle interval in seconds (default: Config.POLL_MAX_INTERVAL)
+            backoff_factor: Interval growth per idle poll (default: Config.POLL_BACKOFF_FACTOR)
+            jitter: Random +/- fraction applied to each wait (default: Config.POLL_JITTER)
+        """
+        self.pipeline = pipeline
+        self.min_interval = min_interval or Config.POLL_MIN_INTERVAL
+        self.max_interval = max_interval or Config.POLL_MAX_INTERVAL
+        self.backoff_factor = backoff_factor or Config.POLL_BACKOFF_FACTOR
+        self.jitter = Config.POLL_JITTER if jitter is None else jitter
+        self.interval = self.min_interval
+        self.polls = 0
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Stop the poll loop after the current poll"""
+        self._stop.set()
+
+    def run(self, max_polls=None, report_every=None):
+        """
+        Poll until stopped
+
+        Args:
+            max_polls: Stop after this many polls (default: never)
+            report_every: Print the latency report every N polls (default: only
+                after polls that forwarded signals)
+        """
+        self.ensure_cursor()
+
+        while not self._stop.is_set():
+            forwarded = self.poll_once()
+
+            if forwarded or (report_every and self.polls % report_every == 0):
+                self.print_report()
+
+            if max_polls and self.polls >= max_polls:
+                return
+
+            self._stop.wait(self.next_wait())
+
+    def ensure_cursor(self):
+        """Start each mailbox's history cursor at its current history ID if it was never set"""
+        for mailbox in self.pipeline.registry:
+            state = self.pipeline.mailbox_state(mailbox)
+            if state.history_cursor.get() is not None:
+                continue
+
+            history_id = state.get_email_processor().get_current_history_id()
+            state.history_cursor.advance(history_id)
+            logger.info("Initialized %s with history ID: %s", mailbox.cursor_name, history_id)
+
+    def poll_once(self):
+        """
+        Catch up every mailbox on new mail once and adapt the interval
+
+        Returns:
+            int: Signals forwarded by this poll
+        """
+        stats = self.pipeline.stats
+        before = stats.snapshot()['counters']
+        self.polls += 1
+
+        try:
+            with stats.time('poll'):
+                for mailbox in self.pipeline.registry:
+                    self.pipeline.process_notification({
+                        'resume': True,
+                        'emailAddress': mailbox.email,
+                        'received_at': time.perf_counter()
+                    })
+        except Exception as e:
+            stats.increment('poll_failed')
+            logger.exception("Error polling Gmail history: %s", e)
+
+        after = stats.snapshot()['counters']
+        new_messages = after.get('history_messages', 0) - before.get('history_messages', 0)
+        signals = after.get('signal_emails', 0) - before.get('signal_emails', 0)
+
+        if signals:
+            self.interval = self.min_interval
+        elif not new_messages:
+            self.interval = min(self.max_interval, self.interval * self.backoff_factor)
+
+        return after.get('signals_forwarded', 0) - before.get('signals_forwarded', 0)
+
+    def next_wait(self):
+        """
+        Seconds to wait before the next poll
+
+        Returns:
+            float: Current interval with jitter applied
+        """
+        return max(0.0, self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def print_report(self):
+        """Print poll-to-forward latency percentiles"""
+        stage = self.pipeline.stats.snapshot()['stages'].get('notify_to_forward')
+
+        if not stage:
+            logger.info("Polls: %d, no signals forwarded yet (next poll in ~%.1fs)", self.polls, self.interval)
+            return
+
+        logger.info("Polls: %d, poll-to-forward latency over %d signals: p50=%.0fms p90=%.0fms p99=%.0fms max=%.0fms",
+                    self.polls, stage['count'], stage['p50_ms'], stage['p90_ms'], stage['p99_ms'], stage['max_ms'])
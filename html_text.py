@@ -0,0 +1,265 @@
+"""
+HTML-to-text conversion for emails that have no text/plain part
+
+Signal fields in HTML emails sit in table cells, styled spans and
+entity-encoded text, where the text signal patterns cannot see them, and
+CSS braces get in the way of the JSON scanner. The converter (stdlib
+html.parser, fed in chunks) turns such a body into the plain text the
+extractor expects:
+
+- style, script and similar elements are dropped, entities unescaped
+- block elements and <br> end a line; other whitespace is collapsed
+- a two-cell table row whose first cell is a short label becomes a
+  "key: value" line, and the rows of a table whose first row is all <th>
+  become "header: value" lines
+- output stops at max_chars, without parsing the rest of the document
+"""
+
+import re
+from html.parser import HTMLParser
+from config import Config
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class _OutputFull(Exception):
+    """Raised inside the parser once the output limit is reached"""
+
+
+class _Table:
+    """Rows being collected for one (possibly nested) table"""
+
+    __slots__ = ('header', 'rows_seen', 'cells', 'cell', 'header_cells')
+
+    def __init__(self):
+        self.header = None
+        self.rows_seen = 0
+        self.cells = None
+        self.cell = None
+        self.header_cells = True
+
+
+class HTMLTextConverter(HTMLParser):
+    """Incremental HTML parser producing signal-friendly plain text"""
+
+    # Elements whose content is never text a reader sees
+    SKIPPED_TAGS = frozenset({'style', 'script', 'noscript', 'template', 'title', 'svg'})
+
+    # Elements that start and end a line
+    BLOCK_TAGS = frozenset({
+        'address', 'article', 'aside', 'blockquote', 'br', 'caption', 'dd', 'div', 'dl', 'dt',
+        'figcaption', 'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr',
+        'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table', 'ul',
+    })
+
+    # Longest first cell of a two-cell row still treated as a field label
+    LABEL_MAX_CHARS = 40
+
+    def __init__(self, max_chars=None):
+        """
+        Args:
+            max_chars: Maximum characters of text produced (default: Config.MAX_BODY_BYTES)
+        """
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars or Config.MAX_BODY_BYTES
+        self.truncated = False
+        self._lines = []
+        self._line = []
+        self._length = 0
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._tables = []
+
+    def feed(self, data):
+        """Parse more HTML; once the output is full further input is ignored"""
+        if self.truncated:
+            return
+        try:
+            super().feed(data)
+        except _OutputFull:
+            self.truncated = True
+
+    def close(self):
+        """Finish parsing and flush any open line or table row"""
+        if not self.truncated:
+            try:
+                super().close()
+                while self._tables:
+                    self._end_table()
+                self._end_line()
+            except _OutputFull:
+                self.truncated = True
+
+    def text(self):
+        """
+        Text produced so far
+
+        Returns:
+            str: Non-empty lines joined by newlines
+        """
+        return '\n'.join(self._lines)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag == 'table':
+            self._end_line()
+            self._tables.append(_Table())
+        elif tag == 'tr' and self._tables:
+            self._end_row()
+            self._tables[-1].cells = []
+        elif tag in ('td', 'th') and self._tables:
+            table = self._tables[-1]
+            self._end_cell()
+            if table.cells is None:
+                table.cells = []
+            table.cell = []
+            table.header_cells = table.header_cells and tag == 'th'
+        elif tag in self.BLOCK_TAGS:
+            self._break()
+            if tag == 'pre':
+                self._pre_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS and not self._skip_depth:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth:
+            return
+
+        if tag == 'table' and self._tables:
+            self._end_table()
+        elif tag == 'tr' and self._tables:
+            self._end_row()
+        elif tag in ('td', 'th') and self._tables:
+            self._end_cell()
+        elif tag in self.BLOCK_TAGS:
+            if tag == 'pre':
+                self._pre_depth = max(0, self._pre_depth - 1)
+            self._break()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+
+        if not self._pre_depth:
+            data = WHITESPACE_PATTERN.sub(' ', data)
+            if data == ' ' or not data:
+                self._space()
+                return
+
+        cell = self._tables[-1].cell if self._tables else None
+        if cell is not None:
+            cell.append(data)
+        elif self._pre_depth:
+            lines = data.split('\n')
+            self._line.append(lines[0])
+            for line in lines[1:]:
+                self._end_line()
+                self._line.append(line)
+        else:
+            self._line.append(data)
+
+    def _space(self):
+        """Record whitespace between inline elements"""
+        cell = self._tables[-1].cell if self._tables else None
+        target = cell if cell is not None else self._line
+        if target and not target[-1].endswith(' '):
+            target.append(' ')
+
+    def _break(self):
+        """Line break: inside a cell it is only a space"""
+        if self._tables and self._tables[-1].cell is not None:
+            self._space()
+        else:
+            self._end_line()
+
+    def _end_cell(self):
+        table = self._tables[-1]
+        if table.cell is not None:
+            table.cells.append(''.join(table.cell).strip())
+            table.cell = None
+
+    def _end_row(self):
+        """Emit the collected row as "key: value" lines where the shape allows"""
+        table = self._tables[-1]
+        self._end_cell()
+        cells = table.cells
+        table.cells = None
+        if not cells:
+            table.header_cells = True
+            return
+
+        table.rows_seen += 1
+        is_header = table.header_cells and table.rows_seen == 1 and len(cells) > 1
+        table.header_cells = True
+        if is_header:
+            # Its labels are repeated on every following row instead
+            table.header = cells
+            return
+
+        filled = [cell for cell in cells if cell]
+        if table.header and not is_header and len(cells) == len(table.header):
+            for key, value in zip(table.header, cells):
+                if value:
+                    self._emit(f"{key.rstrip(':').strip()}: {value}" if key else value)
+        elif len(filled) == 2 and len(cells) == 2 and len(filled[0]) <= self.LABEL_MAX_CHARS:
+            self._emit(f"{filled[0].rstrip(':').strip()}: {filled[1]}")
+        elif filled:
+            self._emit(' '.join(filled))
+
+    def _end_table(self):
+        self._end_row()
+        table = self._tables.pop()
+        if table.header and table.rows_seen == 1:
+            # A header row with nothing under it is plain text after all
+            self._emit(' '.join(cell for cell in table.header if cell))
+
+    def _end_line(self):
+        self._emit(''.join(self._line).strip())
+        self._line = []
+
+    def _emit(self, line):
+        """Append a line, stopping the parse once max_chars is reached"""
+        if not line:
+            return
+
+        remaining = self.max_chars - self._length
+        if len(line) >= remaining:
+            self._lines.append(line[:remaining])
+            self._length = self.max_chars
+            raise _OutputFull()
+
+        self._lines.append(line)
+        self._length += len(line) + 1
+
+
+def html_to_text(html, max_chars=None, chunk_size=65536):
+    """
+    Convert an HTML email body to plain text
+
+    Args:
+        html: HTML document
+        max_chars: Maximum characters of text returned (default: Config.MAX_BODY_BYTES)
+        chunk_size: Characters of HTML fed to the parser at a time
+
+    Returns:
+        tuple: (text, truncated: bool)
+    """
+    converter = HTMLTextConverter(max_chars)
+
+    for start in range(0, len(html), chunk_size):
+        converter.feed(html[start:start + chunk_size])
+        if converter.truncated:
+            break
+
+    converter.close()
+    return converter.text(), converter.truncated
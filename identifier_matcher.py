@@ -0,0 +1,232 @@
+"""
+One-pass matching of the identifiers that mark signal emails
+
+SIGNAL_IDENTIFIER may list several identifiers (comma-separated, or a list
+per mailbox in MAILBOXES_FILE): per-strategy tags, sender keywords and so
+on. They are compiled once into an Aho-Corasick automaton that reports
+which identifiers occur in a text, and where, in a single scan however
+many there are.
+
+For a handful of identifiers CPython's str.find, which runs at memchr
+speed, beats any scan driven from Python, so up to DIRECT_SEARCH_LIMIT
+identifiers are searched one by one and the automaton takes over above
+that (see `python benchmarks.py identifiers`).
+"""
+
+import functools
+import re
+from collections import deque
+from config import Config
+
+
+def parse_identifiers(value):
+    """
+    Normalise an identifier setting into a tuple
+
+    Args:
+        value: Identifier, comma-separated identifiers, or a list of them
+
+    Returns:
+        tuple: Non-empty identifiers in the given order, without duplicates
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+
+    identifiers = []
+    for identifier in value or ():
+        identifier = str(identifier).strip()
+        if identifier and identifier not in identifiers:
+            identifiers.append(identifier)
+
+    return tuple(identifiers)
+
+
+@functools.lru_cache(maxsize=256)
+def _matcher(identifiers, ignore_case):
+    """Shared matcher per identifier set (see get_matcher)"""
+    return IdentifierMatcher(identifiers, ignore_case)
+
+
+def get_matcher(identifiers=None, ignore_case=None):
+    """
+    Matcher for a set of identifiers, built once and shared
+
+    The EmailProcessor and SignalExtractor of a mailbox get the same
+    instance, which lets a ParsedMessage reuse the detector's hits in the
+    extractor instead of scanning the message again.
+
+    Args:
+        identifiers: Identifier, comma-separated identifiers, or a list of them
+            (default: Config.SIGNAL_IDENTIFIER)
+        ignore_case: Match regardless of case (default: Config.SIGNAL_IDENTIFIER_IGNORE_CASE)
+
+    Returns:
+        IdentifierMatcher: Compiled matcher
+    """
+    identifiers = parse_identifiers(identifiers or Config.SIGNAL_IDENTIFIER)
+    if ignore_case is None:
+        ignore_case = Config.SIGNAL_IDENTIFIER_IGNORE_CASE
+    return _matcher(identifiers, bool(ignore_case))
+
+
+class IdentifierMatcher:
+    """
+    Aho-Corasick automaton over a set of identifiers
+
+    States are trie nodes; each has a goto dict, a failure link to the
+    longest proper suffix that is also a trie node, and the identifiers
+    ending there (including those reached through failure links), so
+    overlapping and nested identifiers are all reported.
+    """
+
+    # Identifier count up to which one str.find per identifier is faster
+    DIRECT_SEARCH_LIMIT = 12
+
+    def __init__(self, identifiers, ignore_case=False):
+        """
+        Args:
+            identifiers: Identifiers to look for
+            ignore_case: Match regardless of case; hit positions then refer
+                to text.lower(), which only differs from the text's own
+                offsets for a few non-ASCII characters
+        """
+        self.identifiers = parse_identifiers(identifiers)
+        if not self.identifiers:
+            raise ValueError("At least one signal identifier is required")
+
+        self.ignore_case = ignore_case
+        self._keys = [identifier.lower() if ignore_case else identifier for identifier in self.identifiers]
+        self._direct = len(self.identifiers) <= self.DIRECT_SEARCH_LIMIT
+        self._build()
+
+    def _build(self):
+        """Build the trie, failure links and output lists"""
+        goto = [{}]
+        outputs = [()]
+
+        for index, key in enumerate(self._keys):
+            state = 0
+            for char in key:
+                following = goto[state].get(char)
+                if following is None:
+                    following = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                    goto[state][char] = following
+                state = following
+            outputs[state] += (index,)
+
+        # Breadth-first, so a state's failure target is finished before the state
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+
+        while pending:
+            state = pending.popleft()
+            for char, following in goto[state].items():
+                pending.append(following)
+
+                target = fail[state]
+                while target and char not in goto[target]:
+                    target = fail[target]
+                target = goto[target].get(char, 0)
+
+                fail[following] = target if target != following else 0
+                outputs[following] += outputs[fail[following]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+
+        # Jumps over text no identifier can start in while the automaton is at the root
+        self._starts = re.compile('[' + re.escape(''.join(sorted(goto[0]))) + ']')
+
+    def find(self, text):
+        """
+        Find the first occurrence of every identifier in the text
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            list: (identifier, offset) tuples ordered by offset; empty if none occur
+        """
+        if self.ignore_case:
+            text = text.lower()
+
+        if self._direct:
+            hits = {}
+            for index, key in enumerate(self._keys):
+                position = text.find(key)
+                if position != -1:
+                    hits[index] = position
+        else:
+            hits = self._scan(text, stop_at_first=False)
+
+        return sorted(((self.identifiers[index], position) for index, position in hits.items()),
+                      key=lambda hit: hit[1])
+
+    def matches(self, text):
+        """
+        Check whether any identifier occurs in the text, stopping at the first hit
+
+        Args:
+            text: Text to scan
+
+        Returns:
+            bool: True if an identifier occurs
+        """
+        if not text:
+            return False
+
+        if self.ignore_case:
+            text = text.lower()
+
+        if self._direct:
+            return any(key in text for key in self._keys)
+
+        return bool(self._scan(text, stop_at_first=True))
+
+    def _scan(self, text, stop_at_first):
+        """
+        Run the automaton over the text
+
+        Returns:
+            dict: Identifier index to offset of its first occurrence
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        root = goto[0]
+        next_start = self._starts.search
+        lengths = [len(key) for key in self._keys]
+
+        hits = {}
+        state = 0
+        position = 0
+        length = len(text)
+
+        while position < length:
+            if not state:
+                match = next_start(text, position)
+                if match is None:
+                    break
+                position = match.start()
+                state = root[text[position]]
+            else:
+                char = text[position]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+
+            for index in outputs[state]:
+                if index not in hits:
+                    hits[index] = position + 1 - lengths[index]
+                    if stop_at_first or len(hits) == len(lengths):
+                        return hits
+
+            position += 1
+
+        return hits
+
+    def __repr__(self):
+        return f"IdentifierMatcher({', '.join(self.identifiers)})"
@@ -0,0 +1,137 @@
+"""
+Registry of the Gmail mailboxes served by one server
+
+Without Config.MAILBOXES_FILE there is a single mailbox configured from the
+environment (token.json, STRATEGY_NAME, SIGNAL_IDENTIFIER), and every
+notification belongs to it. MAILBOXES_FILE is a JSON list with one object
+per account; only "email" and "token_file" are required:
+
+    [
+        {"email": "desk-a@example.com", "token_file": "tokens/desk-a.json",
+         "strategy_name": "Desk_A", "signal_identifier": "SIGNAL", "max_workers": 1},
+        {"email": "desk-b@example.com", "token_file": "tokens/desk-b.json"}
+    ]
+
+Notifications are routed by their emailAddress; the first entry is the
+default mailbox used by `main.py poll` and the /test endpoint.
+"""
+
+import json
+from config import Config
+
+
+class Mailbox:
+    """Settings of one Gmail account watched for signal emails"""
+
+    def __init__(self, email=None, token_file='token.json', strategy_name=None,
+                 signal_identifier=None, max_workers=None):
+        """
+        Args:
+            email: Account address (None for the single mailbox configured
+                from the environment, which accepts every notification)
+            token_file: OAuth token file of the account
+            strategy_name: Strategy name sent with its signals (default: Config.STRATEGY_NAME)
+            signal_identifier: Text marking its signal emails, or a list of
+                identifiers (default: Config.SIGNAL_IDENTIFIER)
+            max_workers: Worker threads it may occupy at once (default: Config.MAILBOX_MAX_WORKERS)
+        """
+        self.email = email.strip().lower() if email else None
+        self.token_file = token_file
+        self.strategy_name = strategy_name or Config.STRATEGY_NAME
+        self.signal_identifier = signal_identifier or Config.SIGNAL_IDENTIFIER
+        self.max_workers = max(1, int(max_workers or Config.MAILBOX_MAX_WORKERS))
+
+    @property
+    def cursor_name(self):
+        """History cursor name; the environment-configured mailbox keeps the original 'me' cursor"""
+        return self.email or 'me'
+
+    def __repr__(self):
+        return f"Mailbox({self.email or 'me'})"
+
+
+class MailboxRegistry:
+    """Mailboxes served by this process, looked up by address"""
+
+    # Keys accepted in a MAILBOXES_FILE entry
+    FIELDS = ('email', 'token_file', 'strategy_name', 'signal_identifier', 'max_workers')
+
+    def __init__(self, mailboxes=None):
+        """
+        Args:
+            mailboxes: Mailbox instances; the first is the default (default:
+                one mailbox configured from the environment)
+        """
+        self.mailboxes = list(mailboxes) if mailboxes else [Mailbox()]
+        self._by_email = {}
+
+        for mailbox in self.mailboxes:
+            if mailbox.email is None:
+                if len(self.mailboxes) > 1:
+                    raise ValueError("Every mailbox needs an email address when several are configured")
+                continue
+            if mailbox.email in self._by_email:
+                raise ValueError(f"Mailbox {mailbox.email} is configured twice")
+            self._by_email[mailbox.email] = mailbox
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load mailboxes from a JSON file
+
+        Args:
+            path: JSON list of mailbox objects (see module docstring)
+
+        Returns:
+            MailboxRegistry: Registry of the listed mailboxes
+        """
+        with open(path, 'r') as f:
+            entries = json.load(f)
+
+        if not isinstance(entries, list) or not entries:
+            raise ValueError(f"Mailbox file {path} must contain a non-empty JSON list")
+
+        mailboxes = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get('email') or not entry.get('token_file'):
+                raise ValueError(f"Every mailbox in {path} needs an email and a token_file")
+
+            unknown = set(entry) - set(cls.FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown mailbox settings in {path}: {', '.join(sorted(unknown))}")
+
+            mailboxes.append(Mailbox(**entry))
+
+        return cls(mailboxes)
+
+    @classmethod
+    def from_config(cls):
+        """Registry from Config.MAILBOXES_FILE, or the single environment-configured mailbox"""
+        if Config.MAILBOXES_FILE:
+            return cls.from_file(Config.MAILBOXES_FILE)
+        return cls()
+
+    @property
+    def default(self):
+        """First configured mailbox"""
+        return self.mailboxes[0]
+
+    def get(self, email):
+        """
+        Find the mailbox a notification belongs to
+
+        Args:
+            email: emailAddress of the notification
+
+        Returns:
+            Mailbox: Matching mailbox, or None if this server does not serve it
+        """
+        if not self._by_email:
+            return self.default
+        return self._by_email.get((email or '').strip().lower())
+
+    def __iter__(self):
+        return iter(self.mailboxes)
+
+    def __len__(self):
+        return len(self.mailboxes)
@@ -6,22 +6,34 @@ This application monitors Gmail for signal emails and forwards them to the Mathe
 """
 
 import sys
+import json
 import argparse
+from datetime import datetime
 from gmail_auth import GmailAuthenticator
 from api_forwarder import APIForwarder
+from signal_spool import SignalSpool, SpoolDrainer
+from signal_pipeline import SignalPipeline
+from history_poller import HistoryPoller
+from watch_renewer import WatchRenewer
+from mailbox_registry import MailboxRegistry
 from webhook import run_webhook_server
+from wsgi_server import run_production_server
+from async_engine import run_async_server
+from e2e_bench import format_summary, run_end_to_end
+from structured_logging import setup_logging
 from config import Config
 
 
 def setup_authentication():
-    """Set up Gmail API authentication"""
+    """Set up Gmail API authentication for every configured mailbox"""
     print("Setting up Gmail authentication...")
 
     try:
-        gmail_auth = GmailAuthenticator()
-        service = gmail_auth.authenticate()
+        for mailbox in MailboxRegistry.from_config():
+            if mailbox.email:
+                print(f"Authenticating {mailbox.email} ({mailbox.token_file})...")
+            GmailAuthenticator(mailbox.token_file).authenticate()
         print("Authentication successful!")
-        return service
     except Exception as e:
         print(f"Authentication failed: {e}")
         sys.exit(1)
@@ -37,12 +49,16 @@ def setup_push_notifications():
         sys.exit(1)
 
     try:
-        gmail_auth = GmailAuthenticator()
-        gmail_auth.authenticate()
-        watch_response = gmail_auth.setup_push_notifications(Config.PUBSUB_TOPIC_NAME)
-        print(f"Push notifications enabled successfully!")
-        print(f"History ID: {watch_response.get('historyId')}")
-        print(f"Expiration: {watch_response.get('expiration')}")
+        for mailbox in MailboxRegistry.from_config():
+            gmail_auth = GmailAuthenticator(mailbox.token_file)
+            gmail_auth.authenticate()
+            watch_response = gmail_auth.setup_push_notifications(Config.PUBSUB_TOPIC_NAME)
+            # The running server renews the watch before this expiration
+            WatchRenewer(mailbox=mailbox.email).record(watch_response)
+            label = f" for {mailbox.email}" if mailbox.email else ""
+            print(f"Push notifications enabled successfully{label}!")
+            print(f"History ID: {watch_response.get('historyId')}")
+            print(f"Expiration: {watch_response.get('expiration')}")
     except Exception as e:
         print(f"Failed to set up push notifications: {e}")
         sys.exit(1)
@@ -53,9 +69,11 @@ def stop_push_notifications():
     print("Stopping push notifications...")
 
     try:
-        gmail_auth = GmailAuthenticator()
-        gmail_auth.authenticate()
-        gmail_auth.stop_push_notifications()
+        for mailbox in MailboxRegistry.from_config():
+            gmail_auth = GmailAuthenticator(mailbox.token_file)
+            gmail_auth.authenticate()
+            gmail_auth.stop_push_notifications()
+            WatchRenewer(mailbox=mailbox.email).forget()
         print("Push notifications stopped successfully")
     except Exception as e:
         print(f"Failed to stop push notifications: {e}")
@@ -82,10 +100,150 @@ def test_api_connection():
         sys.exit(1)
 
 
-def start_webhook():
-    """Start the webhook server"""
+def start_webhook(engine='threads'):
+    """
+    Start the webhook server
+
+    Args:
+        engine: 'threads' (Flask and worker threads) or 'async' (aiohttp event loop)
+    """
     print("Starting webhook server...")
-    run_webhook_server()
+
+    if engine == 'async':
+        try:
+            run_async_server()
+        except RuntimeError as e:
+            print(f"Failed to start server: {e}")
+            sys.exit(1)
+    else:
+        run_webhook_server()
+
+
+def serve_webhook(workers=None, threads=None):
+    """Start the webhook under gunicorn with several worker processes"""
+    print("Starting production webhook server...")
+
+    try:
+        run_production_server(workers, threads)
+    except RuntimeError as e:
+        print(f"Failed to start server: {e}")
+        sys.exit(1)
+
+
+def poll_mailbox():
+    """Run the pipeline by polling Gmail history instead of push notifications"""
+    print("Polling Gmail history (Ctrl+C to stop)...")
+
+    pipeline = SignalPipeline()
+    pipeline.gmail_auth.start()
+    pipeline.spool_drainer.start()
+    poller = HistoryPoller(pipeline)
+
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        print()
+        poller.print_report()
+
+
+def manage_spool(action, status=None, entry_ids=None):
+    """
+    Inspect, replay or purge the outbound signal spool
+
+    Replay sends pending entries by default, leaving out the ones a running
+    server is still sending; dead entries are only replayed with
+    status='dead' or by ID.
+
+    Args:
+        action: 'list', 'replay' or 'purge'
+        status: Only entries with this status ('pending', 'done' or 'dead')
+        entry_ids: Only these spool entry IDs
+    """
+    spool = SignalSpool()
+
+    if action == 'list':
+        entries = spool.entries(status, entry_ids)
+        if not entries:
+            print("Spool is empty")
+            return
+
+        for entry in entries:
+            created = datetime.fromtimestamp(entry['created_at']).isoformat(timespec='seconds')
+            print(f"#{entry['id']} {entry['status']:<8} {entry['signal_id']} "
+                  f"created={created} attempts={entry['attempts']}"
+                  + (f" error={entry['last_error']}" if entry['last_error'] else ""))
+
+    elif action == 'replay':
+        api_forwarder = APIForwarder()
+        drainer = SpoolDrainer(spool, api_forwarder)
+        failed = 0
+
+        # A running server's drainer skips its passes until the replay is done
+        with drainer.hold():
+            if entry_ids:
+                entries = spool.entries(status, entry_ids)
+            else:
+                # Dead entries are only resent when asked for, and entries a
+                # running server is still sending directly would go out twice
+                entries = spool.entries(status or SignalSpool.PENDING)
+                leased = [entry for entry in entries if SignalSpool.is_leased(entry)]
+                if leased:
+                    print(f"Skipping {len(leased)} signals still being sent by a running server "
+                          f"(use --id to replay them anyway)")
+                    entries = [entry for entry in entries if not SignalSpool.is_leased(entry)]
+
+            for entry in entries:
+                print(f"Replaying #{entry['id']} ({entry['signal_id']})...")
+                success, response = api_forwarder.send_signal(SignalSpool.payload_for(entry),
+                                                              api_url=entry['api_url'])
+
+                if success:
+                    spool.mark_done(entry['id'])
+                else:
+                    spool.mark_failed(entry['id'], response.get('error'))
+                    failed += 1
+
+        print(f"Replayed {len(entries) - failed}/{len(entries)} signals")
+        if failed:
+            sys.exit(1)
+
+    elif action == 'purge':
+        if status or entry_ids:
+            deleted = spool.purge(status, entry_ids)
+        else:
+            # Never drop undelivered signals unless asked to explicitly
+            deleted = spool.purge(SignalSpool.DONE) + spool.purge(SignalSpool.DEAD)
+
+        print(f"Purged {deleted} spool entries")
+
+
+def run_benchmark(args):
+    """Run the end-to-end benchmark and write its JSON result"""
+    print(f"Replaying {args.count} notifications at {args.rate}/s into /webhook "
+          f"(gmail errors {args.gmail_error_rate:.0%}, api errors {args.api_error_rate:.0%})...",
+          file=sys.stderr)
+
+    result = run_end_to_end(
+        count=args.count,
+        rate=args.rate,
+        gmail_latency=args.gmail_latency,
+        api_latency=args.api_latency,
+        gmail_error_rate=args.gmail_error_rate,
+        api_error_rate=args.api_error_rate
+    )
+
+    print(format_summary(result), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(result, indent=2))
+
+    # Lost signals are a regression
+    if result['signals']['lost']:
+        sys.exit(1)
 
 
 def main():
@@ -98,27 +256,133 @@ Examples:
   # First-time setup
   python main.py setup
 
-  # Start the webhook server
+  # Start the webhook server (development server)
   python main.py start
 
+  # Start the webhook server on the asyncio engine
+  python main.py start --engine async
+
+  # Start the webhook server under gunicorn
+  python main.py serve --workers 4
+
+  # Poll Gmail instead of receiving push notifications
+  python main.py poll
+
   # Test API connection
   python main.py test-api
 
+  # End-to-end benchmark against local Gmail/Mathematricks stand-ins
+  python main.py bench --rate 200 --api-error-rate 0.05 --output bench.json
+
   # Stop push notifications
   python main.py stop
+
+  # Inspect, replay or purge undelivered signals
+  python main.py spool list
+  python main.py spool replay --id 12
+  python main.py spool purge --status dead
         """
     )
 
     parser.add_argument(
         'command',
-        choices=['setup', 'start', 'test-api', 'stop', 'auth'],
+        choices=['setup', 'start', 'serve', 'poll', 'test-api', 'stop', 'auth', 'spool', 'bench'],
         help='Command to execute'
     )
 
+    parser.add_argument(
+        'action',
+        nargs='?',
+        choices=['list', 'replay', 'purge'],
+        default='list',
+        help='Spool action (spool command only, default: list)'
+    )
+
+    parser.add_argument(
+        '--status',
+        choices=[SignalSpool.PENDING, SignalSpool.DONE, SignalSpool.DEAD],
+        help='Only spool entries with this status'
+    )
+
+    parser.add_argument(
+        '--id',
+        dest='entry_ids',
+        type=int,
+        action='append',
+        help='Only this spool entry ID (repeatable)'
+    )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='Worker processes (serve command only, default: SERVER_WORKERS)'
+    )
+
+    parser.add_argument(
+        '--threads',
+        type=int,
+        help='Request threads per worker (serve command only, default: SERVER_THREADS)'
+    )
+
+    parser.add_argument(
+        '--engine',
+        choices=['threads', 'async'],
+        default=Config.PIPELINE_ENGINE,
+        help='Pipeline engine (start command only, default: PIPELINE_ENGINE)'
+    )
+
+    parser.add_argument(
+        '--count',
+        type=int,
+        default=500,
+        help='Emails delivered (bench command only, default: 500)'
+    )
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=50.0,
+        help='Notifications per second posted to /webhook (bench command only, default: 50)'
+    )
+
+    parser.add_argument(
+        '--gmail-latency',
+        type=float,
+        default=0.005,
+        help='Seconds added to every fake Gmail request (bench command only, default: 0.005)'
+    )
+
+    parser.add_argument(
+        '--api-latency',
+        type=float,
+        default=0.01,
+        help='Seconds added to every fake Mathematricks request (bench command only, default: 0.01)'
+    )
+
+    parser.add_argument(
+        '--gmail-error-rate',
+        type=float,
+        default=0.0,
+        help='Share of fake Gmail requests answered with 500 (bench command only, default: 0)'
+    )
+
+    parser.add_argument(
+        '--api-error-rate',
+        type=float,
+        default=0.0,
+        help='Share of fake Mathematricks requests answered with 503 (bench command only, default: 0)'
+    )
+
+    parser.add_argument(
+        '--output',
+        help='Write the JSON result to this file instead of stdout (bench command only)'
+    )
+
     args = parser.parse_args()
+    setup_logging()
 
-    # Validate configuration (except for auth command)
-    if args.command != 'auth':
+    # Validate configuration (auth and bench need none)
+    if args.command not in ('auth', 'bench'):
         try:
             Config.validate()
         except ValueError as e:
@@ -141,11 +405,26 @@ Examples:
         print("You can now start the webhook server with: python main.py start")
 
     elif args.command == 'start':
+        print("=== Gmail Signal Integration ===")
+        print(f"Strategy: {Config.STRATEGY_NAME}")
+        print(f"Signal Identifier: {Config.SIGNAL_IDENTIFIER}")
+        print(f"API URL: {Config.MATHEMATRICKS_API_URL}")
+        print(f"Engine: {args.engine}\n")
+        start_webhook(args.engine)
+
+    elif args.command == 'serve':
+        print("=== Gmail Signal Integration ===")
+        print(f"Strategy: {Config.STRATEGY_NAME}")
+        print(f"Signal Identifier: {Config.SIGNAL_IDENTIFIER}")
+        print(f"API URL: {Config.MATHEMATRICKS_API_URL}\n")
+        serve_webhook(args.workers, args.threads)
+
+    elif args.command == 'poll':
         print("=== Gmail Signal Integration ===")
         print(f"Strategy: {Config.STRATEGY_NAME}")
         print(f"Signal Identifier: {Config.SIGNAL_IDENTIFIER}")
         print(f"API URL: {Config.MATHEMATRICKS_API_URL}\n")
-        start_webhook()
+        poll_mailbox()
 
     elif args.command == 'test-api':
         test_api_connection()
@@ -153,6 +432,12 @@ Examples:
     elif args.command == 'stop':
         stop_push_notifications()
 
+    elif args.command == 'spool':
+        manage_spool(args.action, args.status, args.entry_ids)
+
+    elif args.command == 'bench':
+        run_benchmark(args)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,117 @@
+"""
+Prometheus text exposition of PipelineStats
+
+Counters become `gmail_signal_<name>_total`, stage latencies become the
+`gmail_signal_stage_duration_seconds` histogram labelled by stage, and
+the lag between Gmail receiving an email (its internalDate) and the
+signal being forwarded gets its own histogram. Rendering only copies
+counts under the stats lock, so scraping does not slow the pipeline down.
+"""
+
+import re
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+PREFIX = 'gmail_signal'
+
+# Counter descriptions; counters not listed here are exported without HELP
+COUNTER_HELP = {
+    'notifications_received': 'Pub/Sub push notifications received',
+    'history_pages': 'Gmail history (or resync list) pages fetched',
+    'history_messages': 'Message IDs read from Gmail history',
+    'messages_fetched': 'Full messages fetched from Gmail',
+    'fetch_errors': 'Messages that failed to fetch in a batch',
+    'signal_emails': 'Fetched messages detected as signal emails',
+    'signals_extracted_json': 'Signals extracted from embedded JSON',
+    'signals_extracted_text': 'Signals extracted from key: value text',
+    'signals_extracted_raw': 'Signal emails forwarded as raw content',
+    'signals_extracted_none': 'Signal emails no signal could be extracted from',
+    'forward_attempts': 'HTTP requests sent to the Mathematricks API',
+    'forward_attempt_failures': 'Mathematricks API requests that failed or returned non-200',
+    'forward_retries': 'Mathematricks API requests that were retries',
+    'signals_forwarded': 'Signals delivered to the Mathematricks API',
+    'signals_failed': 'Signals that failed to forward and were spooled',
+    'signals_rejected': 'Signals the Mathematricks API rejected permanently and were dead-lettered',
+}
+
+# Stages exported as their own histogram instead of a stage label
+SEPARATE_HISTOGRAMS = {
+    'email_to_forward': ('email_to_forward_seconds', 'Seconds from Gmail internalDate to successful forward'),
+}
+
+_INVALID_NAME_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def render_metrics(stats, gauges=None):
+    """
+    Render pipeline statistics in the Prometheus text format
+
+    Args:
+        stats: PipelineStats instance
+        gauges: Optional dict of gauge name -> (value, help text)
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+
+    for name, value in sorted(stats.counters().items()):
+        metric = f"{PREFIX}_{_metric_name(name)}_total"
+        if name in COUNTER_HELP:
+            lines.append(f"# HELP {metric} {COUNTER_HELP[name]}")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+
+    for name, (value, help_text) in sorted((gauges or {}).items()):
+        metric = f"{PREFIX}_{_metric_name(name)}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {_format_value(value)}")
+
+    histograms = stats.histograms()
+    stage_metric = f"{PREFIX}_stage_duration_seconds"
+    stage_lines = []
+
+    for stage, histogram in sorted(histograms.items()):
+        if stage in SEPARATE_HISTOGRAMS:
+            name, help_text = SEPARATE_HISTOGRAMS[stage]
+            metric = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            lines.extend(_histogram_lines(metric, histogram))
+        else:
+            stage_lines.extend(_histogram_lines(stage_metric, histogram, f'stage="{stage}"'))
+
+    if stage_lines:
+        lines.append(f"# HELP {stage_metric} Latency of each pipeline stage")
+        lines.append(f"# TYPE {stage_metric} histogram")
+        lines.extend(stage_lines)
+
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(metric, histogram, labels=''):
+    """Bucket, sum and count samples of one histogram"""
+    separator = ',' if labels else ''
+    lines = [
+        f'{metric}_bucket{{{labels}{separator}le="{_format_value(bound)}"}} {count}'
+        for bound, count in histogram['buckets']
+    ]
+    suffix = f"{{{labels}}}" if labels else ''
+    lines.append(f"{metric}_sum{suffix} {_format_value(histogram['sum'])}")
+    lines.append(f"{metric}_count{suffix} {histogram['count']}")
+    return lines
+
+
+def _metric_name(name):
+    """Make a counter or gauge name safe for Prometheus"""
+    return _INVALID_NAME_CHARS.sub('_', name)
+
+
+def _format_value(value):
+    """Format a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
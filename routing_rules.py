@@ -0,0 +1,308 @@
+"""
+Routing rules: which strategy and endpoint a signal is dispatched to
+
+Rules are read from Config.ROUTING_RULES_FILE (JSON, or YAML when PyYAML
+is installed) and checked in file order; the first rule whose conditions
+all match decides the signal's strategy_name and/or API endpoint:
+
+    {"rules": [
+        {"name": "desk-a equities",
+         "sender": ["alerts@desk-a.com", "@desk-a.net"],
+         "ticker": ["AAPL", "MSFT"],
+         "subject": "\\[EQ\\]",
+         "strategy_name": "Desk_A_Equities",
+         "api_url": "https://mathematricks.fund/api/signals"},
+        {"name": "crypto desk", "subject": "^CRYPTO", "strategy_name": "Crypto"}
+    ]}
+
+Conditions: "sender" (addresses, or "@domain"), "ticker", "mailbox"
+(address of the receiving mailbox) and "subject" (regular expression,
+searched case-insensitively). A rule without conditions matches every
+signal. Signals no rule matches keep their mailbox's strategy and the
+default MATHEMATRICKS_API_URL.
+
+Rules are compiled into hash indexes on sender, domain and ticker, so a
+message is only checked against the rules that could match it plus the
+rules without a sender or ticker condition. The file is re-read when it
+changes (checked at most every ROUTING_RULES_RELOAD_SECONDS); a file that
+fails to load is logged and the previous rules stay in force.
+"""
+
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from email.utils import parseaddr
+from config import Config
+
+try:
+    import yaml
+except ImportError:  # YAML rule files need PyYAML; JSON works without it
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingRule:
+    """One compiled rule: conditions to match and where matching signals go"""
+
+    # Condition and action keys accepted in a rule
+    CONDITIONS = ('sender', 'ticker', 'mailbox', 'subject')
+    ACTIONS = ('strategy_name', 'api_url')
+
+    def __init__(self, name=None, sender=None, ticker=None, mailbox=None, subject=None,
+                 strategy_name=None, api_url=None):
+        """
+        Args:
+            name: Label used in logs (default: assigned from the rule's position)
+            sender: Sender address or "@domain", or a list of them
+            ticker: Ticker symbol or list of symbols
+            mailbox: Receiving mailbox address or list of addresses
+            subject: Regular expression searched in the subject (case-insensitive)
+            strategy_name: Strategy name to send matching signals with
+            api_url: Endpoint to send matching signals to
+        """
+        if not strategy_name and not api_url:
+            raise ValueError(f"Routing rule {name or '(unnamed)'} needs a strategy_name or an api_url")
+
+        self.name = name
+        self.senders = self._values(sender, str.lower)
+        self.tickers = self._values(ticker, str.upper)
+        self.mailboxes = self._values(mailbox, str.lower)
+        self.subject = re.compile(subject, re.IGNORECASE) if subject else None
+        self.strategy_name = strategy_name
+        self.api_url = api_url
+
+    @staticmethod
+    def _values(value, normalise):
+        """Normalised set of one value or a list of values (None if the condition is absent)"""
+        if value is None:
+            return None
+        values = [value] if isinstance(value, str) else value
+        return frozenset(normalise(str(item).strip()) for item in values)
+
+    def matches(self, sender, domain, subject, ticker, mailbox):
+        """
+        Check every condition of the rule (arguments already normalised)
+
+        Returns:
+            bool: True if the signal should be routed by this rule
+        """
+        if self.senders is not None and sender not in self.senders and domain not in self.senders:
+            return False
+        if self.tickers is not None and ticker not in self.tickers:
+            return False
+        if self.mailboxes is not None and mailbox not in self.mailboxes:
+            return False
+        if self.subject is not None and not self.subject.search(subject):
+            return False
+        return True
+
+    def __repr__(self):
+        return f"RoutingRule({self.name})"
+
+
+class RuleSet:
+    """
+    Immutable, indexed list of routing rules
+
+    Every rule is filed under one index: its sender addresses/domains if it
+    has a sender condition, otherwise its tickers, otherwise the list of
+    rules checked for every message. Matching merges the index hits in rule
+    order and stops at the first rule whose conditions all hold.
+    """
+
+    def __init__(self, rules=()):
+        """
+        Args:
+            rules: RoutingRule instances in priority order
+        """
+        self.rules = list(rules)
+        self._by_sender = {}
+        self._by_ticker = {}
+        self._unindexed = []
+
+        for position, rule in enumerate(self.rules):
+            if rule.name is None:
+                rule.name = f"rule {position + 1}"
+
+            if rule.senders is not None:
+                for sender in rule.senders:
+                    self._by_sender.setdefault(sender, []).append(position)
+            elif rule.tickers is not None:
+                for ticker in rule.tickers:
+                    self._by_ticker.setdefault(ticker, []).append(position)
+            else:
+                self._unindexed.append(position)
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load and compile rules from a JSON or YAML file
+
+        Args:
+            path: Rule file; either a list of rules or {"rules": [...]}
+
+        Returns:
+            RuleSet: Compiled rules
+        """
+        with open(path, 'r') as f:
+            if path.endswith(('.yaml', '.yml')):
+                if yaml is None:
+                    raise RuntimeError("PyYAML is not installed; run `pip install pyyaml` or use a JSON rule file")
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+
+        if isinstance(data, dict):
+            data = data.get('rules')
+        if not isinstance(data, list):
+            raise ValueError(f"Routing rule file {path} must contain a list of rules")
+
+        rules = []
+        allowed = {'name', *RoutingRule.CONDITIONS, *RoutingRule.ACTIONS}
+        for entry in data:
+            if not isinstance(entry, dict):
+                raise ValueError(f"Every routing rule in {path} must be an object")
+
+            unknown = set(entry) - allowed
+            if unknown:
+                raise ValueError(f"Unknown routing rule keys in {path}: {', '.join(sorted(unknown))}")
+
+            try:
+                rules.append(RoutingRule(**entry))
+            except re.error as e:
+                raise ValueError(f"Invalid subject pattern in routing rule {entry.get('name')}: {e}")
+            except TypeError:
+                raise ValueError(f"Conditions of routing rule {entry.get('name')} must be strings or lists of strings")
+
+        return cls(rules)
+
+    def match(self, sender='', subject='', ticker=None, mailbox=None):
+        """
+        Find the first rule matching a signal
+
+        Args:
+            sender: From header or address of the email
+            subject: Subject of the email
+            ticker: Ticker of the extracted signal
+            mailbox: Address of the mailbox that received it
+
+        Returns:
+            RoutingRule: First matching rule, or None
+        """
+        if not self.rules:
+            return None
+
+        sender = parseaddr(sender or '')[1].lower()
+        domain = '@' + sender.rpartition('@')[2] if sender else ''
+        ticker = str(ticker).strip().upper() if ticker else None
+        mailbox = mailbox.lower() if mailbox else None
+        subject = subject or ''
+
+        candidates = [self._unindexed]
+        for index, key in ((self._by_sender, sender), (self._by_sender, domain), (self._by_ticker, ticker)):
+            positions = index.get(key)
+            if positions:
+                candidates.append(positions)
+
+        for position in (candidates[0] if len(candidates) == 1 else heapq.merge(*candidates)):
+            rule = self.rules[position]
+            if rule.matches(sender, domain, subject, ticker, mailbox):
+                return rule
+
+        return None
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class RoutingRules:
+    """
+    Routing rules of Config.ROUTING_RULES_FILE, reloaded when the file changes
+
+    Thread-safe: the compiled RuleSet is swapped in one assignment, so
+    readers always see either the old or the new rules.
+    """
+
+    def __init__(self, path=None, reload_interval=None):
+        """
+        Args:
+            path: Rule file (default: Config.ROUTING_RULES_FILE; empty means no rules)
+            reload_interval: Seconds between checks for a changed file
+                (default: Config.ROUTING_RULES_RELOAD_SECONDS; 0 disables reloading)
+        """
+        self.path = path if path is not None else Config.ROUTING_RULES_FILE
+        self.reload_interval = (Config.ROUTING_RULES_RELOAD_SECONDS
+                                if reload_interval is None else reload_interval)
+        self.rules = RuleSet()
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+
+        # A broken file at startup is a configuration error, not something to run without
+        if self.path:
+            self.reload()
+
+    def reload(self):
+        """Load the rule file now (raises if it cannot be loaded)"""
+        mtime = os.stat(self.path).st_mtime
+        self.rules = RuleSet.from_file(self.path)
+        self._mtime = mtime
+        logger.info("Loaded %d routing rules from %s", len(self.rules), self.path)
+
+    def check_for_changes(self):
+        """Reload the rule file if it changed since it was last loaded, keeping the old rules on error"""
+        if not self.path or not self.reload_interval:
+            return
+
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval or not self._reload_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._checked_at = now
+            if os.stat(self.path).st_mtime != self._mtime:
+                self.reload()
+        except Exception as e:
+            logger.error("Keeping previous routing rules, could not reload %s: %s", self.path, e)
+        finally:
+            self._reload_lock.release()
+
+    def route(self, sender='', subject='', ticker=None, mailbox=None):
+        """
+        Find the rule for a signal, picking up a changed rule file first
+
+        Returns:
+            RoutingRule: First matching rule, or None
+        """
+        self.check_for_changes()
+        return self.rules.match(sender, subject, ticker, mailbox)
+
+    def apply(self, payload, parsed_message, mailbox=None):
+        """
+        Route an extracted signal, setting the payload's strategy_name from the matching rule
+
+        Args:
+            payload: Formatted signal payload (updated in place)
+            parsed_message: ParsedMessage the signal came from
+            mailbox: Address of the receiving mailbox
+
+        Returns:
+            RoutingRule: Matching rule (its api_url, if set, is where the
+                signal goes), or None
+        """
+        signal = payload['signal']
+        ticker = (signal.get('ticker') or signal.get('symbol')) if isinstance(signal, dict) else None
+        if not isinstance(ticker, str):
+            ticker = None
+
+        rule = self.route(parsed_message.headers.get('From', ''), parsed_message.subject, ticker, mailbox)
+
+        if rule is not None and rule.strategy_name:
+            payload['strategy_name'] = rule.strategy_name
+
+        return rule
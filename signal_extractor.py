@@ -1,13 +1,533 @@
 import re
+import copy
 import json
 from datetime import datetime
 from config import Config
+from identifier_matcher import get_matcher
+
+# Common patterns for trading signals; each pattern has one capturing group
+# holding the field value. Override with Config.SIGNAL_FIELDS_FILE.
+DEFAULT_SIGNAL_FIELDS = {
+    'ticker': r'(?:ticker|symbol|stock)[\s:]+([A-Z]{1,5})',
+    'action': r'(?:action|side|direction)[\s:]+(\w+)',
+    'price': r'(?:price|entry)[\s:]+\$?([\d.]+)',
+    'quantity': r'(?:quantity|qty|shares|size)[\s:]+(\d+)',
+    'stop_loss': r'(?:stop[\s-]?loss|sl)[\s:]+\$?([\d.]+)',
+    'take_profit': r'(?:take[\s-]?profit|tp|target)[\s:]+\$?([\d.]+)',
+    'type': r'(?:type|order[\s-]?type)[\s:]+(\w+)',
+}
+
+# Keys that mark a JSON object as a trading signal
+SIGNAL_JSON_KEYS = ('ticker', 'symbol', 'action', 'trade', 'signal')
+
+
+def load_signal_fields(path=None):
+    """
+    Load text signal field definitions
+
+    Args:
+        path: JSON file mapping field name to regex (default: Config.SIGNAL_FIELDS_FILE);
+            when empty the built-in DEFAULT_SIGNAL_FIELDS are used
+
+    Returns:
+        dict: Field name to regex pattern
+    """
+    path = path or Config.SIGNAL_FIELDS_FILE
+    if not path:
+        return dict(DEFAULT_SIGNAL_FIELDS)
+
+    with open(path, 'r') as f:
+        fields = json.load(f)
+
+    if not isinstance(fields, dict) or not fields:
+        raise ValueError(f"Signal field file {path} must contain a non-empty JSON object")
+
+    return fields
+
+
+# A numbered or named backreference, or a named group: such patterns change
+# meaning once their groups are renumbered inside the combined scanner
+GROUP_REFERENCE_PATTERN = re.compile(r'\\[1-9]|\(\?P[<=]')
+
+
+def _group_end(text):
+    """
+    Offset just past the parenthesised group that opens the text
+
+    Returns:
+        int: End offset, or None if the group never closes
+    """
+    depth = 0
+    escaped = False
+    in_class = False
+
+    for index, char in enumerate(text):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+
+    return None
+
+
+def _split_alternatives(pattern):
+    """Split a pattern at its top-level '|' characters"""
+    alternatives = []
+    depth = 0
+    escaped = False
+    in_class = False
+    start = 0
+
+    for index, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(pattern[start:index])
+            start = index + 1
+
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def _is_optional(pattern, offset):
+    """Whether a quantifier at an offset lets the atom before it match nothing"""
+    return pattern[offset:offset + 1] in ('?', '*') or pattern.startswith(('{0', '{,'), offset)
+
+
+def _leading_literals(pattern):
+    """
+    Literal text every match of a field pattern starts with
+
+    Understands patterns whose alternatives start with a literal word or
+    with a non-capturing group of such alternatives, which covers
+    keyword-led patterns like '(?:ticker|symbol)...'. A leading character
+    or group made optional by '?', '*' or '{0,n}' (as in '(?:Stop )?Loss')
+    has no literal to rely on.
+
+    Args:
+        pattern: Regex pattern
+
+    Returns:
+        set: Lower-cased literal prefixes, one per alternative, or None if
+            they cannot be determined
+    """
+    prefixes = set()
+
+    for alternative in _split_alternatives(pattern):
+        if alternative.startswith('(?:'):
+            end = _group_end(alternative)
+            if end is None or _is_optional(alternative, end):
+                return None
+            inner = _leading_literals(alternative[3:end - 1])
+            if inner is None:
+                return None
+            prefixes |= inner
+            continue
+
+        prefix = []
+        for index, char in enumerate(alternative):
+            if not (char.isalnum() or char in ' _') or _is_optional(alternative, index + 1):
+                break
+            prefix.append(char)
+
+        if not prefix:
+            return None
+        prefixes.add(''.join(prefix).lower())
+
+    return prefixes
+
+
+class TextSignalParser:
+    """
+    Single-pass parser for plain text signals
+
+    Field patterns are compiled once into one alternation inside a
+    lookahead, so the content is scanned a single time no matter how many
+    fields there are, and a field whose match overlaps another field's
+    match is still found. The result equals a separate re.search per field:
+    only fields whose patterns provably cannot start at the same position
+    as another field's are combined (see _leading_literals), and patterns
+    the combiner cannot vouch for, such as those with backreferences or an
+    optional leading part, are searched on their own.
+    """
+
+    def __init__(self, fields=None):
+        """
+        Args:
+            fields: Mapping of field name to regex with one capturing group
+                (default: DEFAULT_SIGNAL_FIELDS)
+        """
+        fields = fields or DEFAULT_SIGNAL_FIELDS
+
+        for field, pattern in fields.items():
+            if re.compile(pattern).groups < 1:
+                raise ValueError(f"Pattern for signal field '{field}' needs a capturing group")
+
+        self.fields = list(fields)
+        self.field_count = len(fields)
+
+        leading = {
+            field: None if GROUP_REFERENCE_PATTERN.search(pattern) else _leading_literals(pattern)
+            for field, pattern in fields.items()
+        }
+
+        # Two fields may share a start position when one's literal prefix
+        # begins with the other's; then only one of them would be reported
+        combined = [field for field in fields if leading[field]]
+        clashing = set()
+        for index, field in enumerate(combined):
+            for other in combined[index + 1:]:
+                if any(a.startswith(b) or b.startswith(a) for a in leading[field] for b in leading[other]):
+                    clashing.update((field, other))
+        combined = [field for field in combined if field not in clashing]
+
+        self._scanner = None
+        self._group_fields = {}
+        self._value_groups = {}
+
+        if combined:
+            alternatives = []
+            for index, field in enumerate(combined):
+                group_name = f"f{index}"
+                alternatives.append(f"(?P<{group_name}>{fields[field]})")
+                self._group_fields[group_name] = field
+
+            # Let the regex engine skip positions that cannot start any field
+            chars = {prefix[0] for field in combined for prefix in leading[field]}
+            chars |= {char.swapcase() for char in chars}
+
+            try:
+                self._scanner = re.compile(
+                    f"(?=[{re.escape(''.join(sorted(chars)))}])(?=(?:{'|'.join(alternatives)}))",
+                    re.IGNORECASE
+                )
+            except re.error:
+                # e.g. inline flags that are only valid at the start of a pattern
+                combined = []
+                self._group_fields = {}
+
+        if self._scanner is not None:
+            # The value is the first capturing group inside each field's wrapper group
+            self._value_groups = {
+                group_name: self._scanner.groupindex[group_name] + 1
+                for group_name in self._group_fields
+            }
+
+        self._separate = [
+            (field, re.compile(pattern, re.IGNORECASE))
+            for field, pattern in fields.items()
+            if field not in combined
+        ]
+
+    def parse(self, content):
+        """
+        Extract every known field from the content
+
+        Args:
+            content: Email content
+
+        Returns:
+            dict: Field name to extracted value, in field definition order
+        """
+        found = {}
+
+        if self._scanner is not None:
+            wanted = len(self._group_fields)
+
+            for match in self._scanner.finditer(content):
+                group_name = match.lastgroup
+                field = self._group_fields[group_name]
+
+                if field not in found:
+                    found[field] = match.group(self._value_groups[group_name]).strip()
+
+                    if len(found) == wanted:
+                        break
+
+        for field, regex in self._separate:
+            match = regex.search(content)
+            if match:
+                found[field] = match.group(1).strip()
+
+        return {field: found[field] for field in self.fields if field in found}
+
+
+class JSONSignalScanner:
+    """
+    Linear-time search for a JSON signal object embedded in text
+
+    Every brace block is walked once by a brace matcher that ignores braces
+    inside strings, and json.JSONDecoder.raw_decode is only run on blocks
+    the matcher found balanced. A decoded block is searched as a whole;
+    for a block that is not JSON (CSS rules, templates) the blocks nested
+    inside it are tried instead, using where the failed decode stopped so
+    that no span is decoded twice (see _decode_span). Blocks nested deeper
+    than MAX_NESTING are never handed to the recursive decoder.
+    """
+
+    # What the brace matcher looks at: a run of braces or brackets (group 1
+    # matches when the last brace of a run can open an object, see
+    # OBJECT_START) or a string (JSON strings cannot contain raw newlines, so
+    # a quote left open ends at the line break); everything else is skipped
+    TOKENS = re.compile(
+        r'(?=[{}\[\]"])(?:\{+((?=\s*["}]))?|\}+|\[+|\]+'
+        r'|"(?:[^"\\\n]|\\[\s\S])*(?:["\n]|$))'
+    )
+
+    # A JSON object starts with a key or is empty; rules out CSS blocks and
+    # nested braces without paying for a failed decode
+    OBJECT_START = re.compile(r'\{\s*["}]')
+
+    # Deepest object/array nesting of a block that is decoded
+    MAX_NESTING = 64
+
+    def __init__(self, max_bytes=None, signal_keys=SIGNAL_JSON_KEYS):
+        """
+        Args:
+            max_bytes: Maximum characters of content examined
+                (default: Config.JSON_SCAN_MAX_BYTES)
+            signal_keys: Keys identifying a signal object
+        """
+        self.max_bytes = max_bytes or Config.JSON_SCAN_MAX_BYTES
+        self.signal_keys = signal_keys
+        self._decoder = json.JSONDecoder()
+
+    def find(self, content):
+        """
+        Find the first JSON object containing a signal key
+
+        Args:
+            content: Email content
+
+        Returns:
+            dict: Signal object (possibly nested inside a larger object) or None
+        """
+        if len(content) > self.max_bytes:
+            content = content[:self.max_bytes]
+
+        for span in self._match_braces(content):
+            # Nothing to decode in a block like a CSS rule
+            if span[2] or self.OBJECT_START.match(content, span[0]):
+                signal_data = self._decode_span(content, span)
+                if signal_data is not None:
+                    return signal_data
+
+        return None
+
+    def _match_braces(self, content):
+        """
+        Walk the brace blocks of the content and yield the balanced ones
+
+        Text between blocks is skipped. Braces that cannot open a JSON object
+        (see OBJECT_START) are only counted, not collected, so long runs of
+        them cost one regex match.
+
+        Args:
+            content: Email content
+
+        Yields:
+            tuple: Each outermost balanced block as a (start, end, children,
+                nesting) span tree, nesting counting the object and array
+                levels from the block's own braces down. A block that never
+                closes ends the walk; the balanced blocks inside it follow.
+        """
+        search = self.TOKENS.search
+        position = content.find('{')
+
+        # Open blocks as [start, children, nesting, deepest nesting, braces
+        # opened inside that cannot start an object and are not closed yet]
+        stack = []
+
+        while position != -1:
+            match = search(content, position)
+            if match is None:
+                break
+
+            position, run_end = match.span()
+            char = content[position]
+
+            if char == '{':
+                if not stack:
+                    stack.append([position, [], 1, 1, 0])
+                    position += 1
+
+                # All but the last brace of a run are followed by another brace
+                last = run_end - 1
+                if position <= last and match.lastindex:
+                    stack[-1][4] += last - position
+                    stack.append([last, [], 1, 1, 0])
+                else:
+                    stack[-1][4] += run_end - position
+            elif char == '}':
+                closing = run_end - position
+
+                while closing:
+                    block = stack[-1]
+                    if block[4] >= closing:
+                        block[4] -= closing
+                        break
+
+                    # Close this block's open braces, then the block itself
+                    closing -= block[4] + 1
+                    end = run_end - closing
+                    stack.pop()
+
+                    span = (block[0], end, block[1], block[3])
+                    if not stack:
+                        yield span
+                        run_end = content.find('{', end)
+                        break
+
+                    parent = stack[-1]
+                    parent[1].append(span)
+                    parent[3] = max(parent[3], parent[2] + block[3])
+            elif char == '[':
+                block = stack[-1]
+                block[2] += run_end - position
+                block[3] = max(block[3], block[2])
+            elif char == ']':
+                # Never closes more than the arrays opened inside the block
+                block = stack[-1]
+                block[2] = max(block[2] - (run_end - position), 1)
+
+            position = run_end
+
+        # Never closed: every balanced block found inside is still a candidate
+        for block in stack:
+            yield from block[1]
+
+    def _decode_span(self, content, span):
+        """
+        Decode a balanced span, falling back to the spans nested inside it
+
+        A failed decode stops at a known offset. The parser passed through
+        every child span ending before that offset, so those are valid JSON
+        and decode on their own; the child span around it fails the same
+        way and is not decoded, only searched for children; child spans
+        after it are tried. Decodes that fail therefore read disjoint text,
+        as do the ones that succeed, which keeps the search linear.
+
+        Returns:
+            dict: Signal object or None
+        """
+        # (span, offset a decode of the span is known to fail at, or None)
+        pending = [(span, None)]
+
+        while pending:
+            (start, end, children, nesting), failed_at = pending.pop()
+
+            if failed_at is None:
+                data, failed_at = self._decode(content, start, end, nesting)
+
+                if failed_at is None:
+                    signal_data = self._find_signal(data)
+                    if signal_data is not None:
+                        return signal_data
+                    continue
+
+            # Try the spans nested inside it, first one first
+            for child in reversed(children):
+                child_start, child_end = child[0], child[1]
+                inside = child_start < failed_at < child_end
+                pending.append((child, failed_at if inside else None))
+
+        return None
+
+    def _decode(self, content, start, end, nesting):
+        """
+        Decode the JSON object of a balanced span
+
+        Returns:
+            tuple: (object, None) if the whole span is one object, otherwise
+                (None, offset the decode stopped at; the span's start when
+                it was not attempted)
+        """
+        if nesting > self.MAX_NESTING or not self.OBJECT_START.match(content, start):
+            return None, start
+
+        try:
+            data, data_end = self._decoder.raw_decode(content, start)
+        except json.JSONDecodeError as e:
+            return None, e.pos
+        except RecursionError:
+            return None, start
+
+        if data_end != end:
+            return None, start
+
+        return data, None
+
+    def _find_signal(self, data):
+        """Depth-first search of decoded JSON for an object with a signal key"""
+        pending = [data]
+
+        while pending:
+            item = pending.pop()
+
+            if isinstance(item, dict):
+                if any(key in item for key in self.signal_keys):
+                    return item
+                pending.extend(reversed(list(item.values())))
+            elif isinstance(item, list):
+                pending.extend(reversed(item))
+
+        return None
+
 
 class SignalExtractor:
     """Extract and parse signal data from email content"""
 
-    def __init__(self):
-        self.signal_identifier = Config.SIGNAL_IDENTIFIER
+    def __init__(self, fields=None, strategy_name=None, signal_identifier=None):
+        """
+        Args:
+            fields: Text signal field definitions (default: load_signal_fields())
+            strategy_name: Strategy name sent with each signal (default: Config.STRATEGY_NAME)
+            signal_identifier: Text marking a signal email, or a list of
+                identifiers (default: Config.SIGNAL_IDENTIFIER)
+        """
+        self.strategy_name = strategy_name or Config.STRATEGY_NAME
+        self.signal_identifier = signal_identifier or Config.SIGNAL_IDENTIFIER
+        self.identifier_matcher = get_matcher(self.signal_identifier)
+        self.text_parser = TextSignalParser(fields or load_signal_fields())
+        self.json_scanner = JSONSignalScanner()
+
+    def for_mailbox(self, mailbox):
+        """
+        Extractor for another mailbox's strategy and identifier
+
+        The compiled text parser and JSON scanner are shared, not rebuilt.
+
+        Args:
+            mailbox: Mailbox from the MailboxRegistry
+
+        Returns:
+            SignalExtractor: Copy using the mailbox's settings
+        """
+        extractor = copy.copy(self)
+        extractor.strategy_name = mailbox.strategy_name
+        extractor.signal_identifier = mailbox.signal_identifier
+        extractor.identifier_matcher = get_matcher(mailbox.signal_identifier)
+        return extractor
 
     def extract_signal(self, email_body, email_subject=""):
         """
@@ -21,24 +541,51 @@ class SignalExtractor:
             dict: Extracted signal data or None if no valid signal found
         """
         # Combine subject and body for processing
-        full_content = f"{email_subject}\n{email_body}"
+        return self._extract_from_content(f"{email_subject}\n{email_body}")
+
+    def _extract_from_content(self, full_content):
+        """
+        Extract signal data from combined subject and body text
 
+        Args:
+            full_content: Subject and body joined by a newline
+
+        Returns:
+            dict: Extracted signal data or None if no valid signal found
+        """
+        return self._classify_content(full_content)[1]
+
+    def _classify_content(self, full_content, is_signal=None):
+        """
+        Extract signal data and report which format it was found in
+
+        Args:
+            full_content: Subject and body joined by a newline
+            is_signal: Result of an identifier check already made on the
+                content (default: scan the content for the identifiers)
+
+        Returns:
+            tuple: (source, signal data) where source is 'json', 'text', 'raw',
+                or 'none' with None as data
+        """
         # Check if this is a signal email
-        if self.signal_identifier not in full_content:
-            return None
+        if is_signal is None:
+            is_signal = self.identifier_matcher.matches(full_content)
+        if not is_signal:
+            return 'none', None
 
         # Try to extract JSON signal
         json_signal = self._extract_json_signal(full_content)
         if json_signal:
-            return json_signal
+            return 'json', json_signal
 
         # Try to extract structured text signal
         text_signal = self._extract_text_signal(full_content)
         if text_signal:
-            return text_signal
+            return 'text', text_signal
 
         # Fallback: return entire content as signal
-        return {
+        return 'raw', {
             "type": "raw",
             "content": full_content.strip()
         }
@@ -53,21 +600,7 @@ class SignalExtractor:
         Returns:
             dict: Parsed JSON signal or None
         """
-        # Look for JSON objects in the content
-        json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-
-        matches = re.finditer(json_pattern, content, re.DOTALL)
-
-        for match in matches:
-            try:
-                signal_data = json.loads(match.group())
-                # Validate that it looks like a trading signal
-                if any(key in signal_data for key in ['ticker', 'symbol', 'action', 'trade', 'signal']):
-                    return signal_data
-            except json.JSONDecodeError:
-                continue
-
-        return None
+        return self.json_scanner.find(content)
 
     def _extract_text_signal(self, content):
         """
@@ -79,24 +612,7 @@ class SignalExtractor:
         Returns:
             dict: Parsed signal data or None
         """
-        signal_data = {}
-
-        # Common patterns for trading signals
-        patterns = {
-            'ticker': r'(?:ticker|symbol|stock)[\s:]+([A-Z]{1,5})',
-            'action': r'(?:action|side|direction)[\s:]+(\w+)',
-            'price': r'(?:price|entry)[\s:]+\$?([\d.]+)',
-            'quantity': r'(?:quantity|qty|shares|size)[\s:]+(\d+)',
-            'stop_loss': r'(?:stop[\s-]?loss|sl)[\s:]+\$?([\d.]+)',
-            'take_profit': r'(?:take[\s-]?profit|tp|target)[\s:]+\$?([\d.]+)',
-            'type': r'(?:type|order[\s-]?type)[\s:]+(\w+)',
-        }
-
-        # Extract fields using patterns
-        for field, pattern in patterns.items():
-            match = re.search(pattern, content, re.IGNORECASE)
-            if match:
-                signal_data[field] = match.group(1).strip()
+        signal_data = self.text_parser.parse(content)
 
         # Only return if we found at least ticker and action
         if 'ticker' in signal_data or 'action' in signal_data:
@@ -115,13 +631,14 @@ class SignalExtractor:
         Returns:
             dict: Formatted API payload
         """
-        # Generate unique signal ID based on message ID and timestamp
+        # The signal ID is the Gmail message ID so that a redelivered or
+        # reprocessed message always produces the same ID
         timestamp = int(datetime.now().timestamp())
-        signal_id = f"{message_id}_{timestamp}"
+        signal_id = message_id
 
         # Build API payload
         payload = {
-            "strategy_name": Config.STRATEGY_NAME,
+            "strategy_name": self.strategy_name,
             "signal_sent_EPOCH": timestamp,
             "signalID": signal_id,
             "passphrase": Config.MATHEMATRICKS_PASSPHRASE,
@@ -148,3 +665,22 @@ class SignalExtractor:
             return None
 
         return self.format_for_api(signal_data, message_id)
+
+    def extract_message(self, parsed_message):
+        """
+        Extract and format a signal, also reporting the format it was found in
+
+        Args:
+            parsed_message: ParsedMessage from EmailProcessor.parse()
+
+        Returns:
+            tuple: (source, payload) where source is 'json', 'text', 'raw', or
+                'none' with None as payload
+        """
+        source, signal_data = self._classify_content(parsed_message.content,
+                                                     bool(parsed_message.identifier_hits(self.identifier_matcher)))
+
+        if not signal_data:
+            return 'none', None
+
+        return source, self.format_for_api(signal_data, parsed_message.id)
@@ -0,0 +1,735 @@
+import logging
+import threading
+import time
+from itertools import islice
+from gmail_auth import CredentialsManager, GmailAuthenticator
+from email_processor import EmailProcessor, MessageFetchError, BoundedIdSet
+from signal_extractor import SignalExtractor
+from api_forwarder import APIForwarder
+from dedupe_store import DedupeStore
+from forward_ledger import ForwardLedger
+from history_cursor import HistoryCursor
+from signal_spool import SignalSpool, SpoolDrainer
+from work_queue import PipelineStats, WorkQueue
+from watch_renewer import WatchRenewer
+from mailbox_registry import MailboxRegistry
+from routing_rules import RoutingRules
+from attachment_signals import AttachmentSignalReader
+from structured_logging import log_context
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxState:
+    """
+    Per-mailbox part of the pipeline
+
+    Holds one account's credentials, history cursor, extractor and watch
+    renewer; the workers, forwarder, spool and dedupe store are shared by
+    every mailbox. Credentials are loaded and Gmail services built only
+    when the mailbox is first processed. Worker slots cap how many workers
+    the mailbox occupies: a notification arriving while they are all taken
+    is parked instead of holding a worker, merged with any notification
+    already parked, since one catch-up from the cursor covers both.
+    """
+
+    def __init__(self, mailbox, gmail_auth, signal_extractor, db_path=None, stats=None):
+        """
+        Args:
+            mailbox: Mailbox from the MailboxRegistry
+            gmail_auth: CredentialsManager of the account
+            signal_extractor: SignalExtractor using the mailbox's settings
+            db_path: State database path (default: Config.STATE_DB_PATH)
+            stats: PipelineStats shared by the pipeline
+        """
+        self.mailbox = mailbox
+        self.gmail_auth = gmail_auth
+        self.signal_extractor = signal_extractor
+        self.stats = stats
+
+        # Durable cursor of the last fully processed history ID of this account
+        self.history_cursor = HistoryCursor(mailbox.cursor_name, db_path)
+
+        # Keeps this account's Gmail push watch from expiring
+        self.watch_renewer = WatchRenewer(gmail_auth, db_path=db_path, stats=stats, mailbox=mailbox.email)
+
+        # Messages fully handled, skipped when a history window is read again
+        # after a fetch failure (only the worker holding the cursor uses it)
+        self.handled = BoundedIdSet(Config.HISTORY_DEDUPE_WINDOW)
+
+        # Timer queueing the next read of an incomplete history window (only
+        # the worker holding the cursor schedules it)
+        self.retry_timer = None
+
+        # Per-thread EmailProcessor bound to that thread's Gmail service
+        self._local = threading.local()
+        self._slot_lock = threading.Lock()
+        self._active = 0
+        self._parked = None
+
+    def get_email_processor(self):
+        """
+        Get the calling thread's EmailProcessor for this mailbox
+
+        Returns:
+            EmailProcessor: Processor using this thread's own Gmail service
+        """
+        email_processor = getattr(self._local, 'email_processor', None)
+
+        if email_processor is None:
+            email_processor = EmailProcessor(
+                self.gmail_auth.get_service(),
+                stats=self.stats,
+                signal_identifier=self.mailbox.signal_identifier
+            )
+            self._local.email_processor = email_processor
+
+            # Only mailboxes that receive mail get a token refresh thread; it
+            # starts after the token is loaded so it waits for the next expiry
+            self.gmail_auth.start()
+
+        return email_processor
+
+    def acquire(self, notification):
+        """
+        Take a worker slot for a notification, or park it if none is free
+
+        Returns:
+            bool: True if the caller should process it now
+        """
+        with self._slot_lock:
+            if self._active < self.mailbox.max_workers:
+                self._active += 1
+                return True
+
+            self._parked = _merge_notifications(self._parked, notification)
+            return False
+
+    def release(self):
+        """
+        Give back a worker slot
+
+        Returns:
+            dict: Notification parked in the meantime (to queue next), or None
+        """
+        with self._slot_lock:
+            self._active -= 1
+            parked, self._parked = self._parked, None
+            return parked
+
+
+class SignalPipeline:
+    """
+    Per-process state and logic of the notification -> signal pipeline
+
+    Owns the extractor, forwarder, state stores and worker threads, and one
+    MailboxState per Gmail account in the MailboxRegistry. Notifications
+    are routed by their emailAddress. Each server process builds its own
+    instance (see webhook.create_app), so nothing mutable is shared between
+    workers except the state database, which is safe for concurrent
+    processes.
+    """
+
+    def __init__(self, gmail_auth=None, db_path=None, registry=None, auth_factory=None):
+        """
+        Args:
+            gmail_auth: CredentialsManager of the default mailbox (default: built
+                by auth_factory)
+            db_path: State database path (default: Config.STATE_DB_PATH)
+            registry: MailboxRegistry of the served accounts (default:
+                MailboxRegistry.from_config())
+            auth_factory: Callable returning the CredentialsManager of a Mailbox
+                (default: one reading the mailbox's token file)
+        """
+        self.stats = PipelineStats()
+        self.db_path = db_path
+        self.registry = registry or MailboxRegistry.from_config()
+        self.auth_factory = auth_factory or _mailbox_credentials
+        self.api_forwarder = APIForwarder(stats=self.stats)
+
+        # Compiled field patterns, shared by every mailbox's extractor
+        self._signal_extractor = SignalExtractor()
+
+        # Strategy and endpoint of each signal, reloaded when the rule file changes
+        self.routing_rules = RoutingRules()
+
+        # Reader of order baskets attached to signal emails (opt-in)
+        self.attachment_reader = AttachmentSignalReader() if Config.ATTACHMENT_SIGNALS_ENABLED else None
+
+        # Messages already forwarded (Pub/Sub redeliveries, overlapping history)
+        self.dedupe_store = DedupeStore(db_path)
+
+        # On-disk spool of outbound signals, redelivered in the background on failure
+        self.signal_spool = SignalSpool(db_path)
+        self.spool_drainer = SpoolDrainer(self.signal_spool, self.api_forwarder, stats=self.stats)
+
+        # Claims, spools and marks the signals this process sends directly
+        self.forward_ledger = ForwardLedger(self.dedupe_store, self.signal_spool, self.spool_drainer,
+                                            self.api_forwarder.max_send_time(), stats=self.stats)
+
+        # MailboxState per account, built on first use
+        self._default_gmail_auth = gmail_auth
+        self._mailboxes = {}
+        self._mailboxes_lock = threading.Lock()
+
+        # Notification being processed by this worker thread
+        self._local = threading.local()
+
+        # Background workers shared by every mailbox
+        self.work_queue = WorkQueue(
+            self.process_notification,
+            worker_count=Config.WORKER_COUNT,
+            max_size=Config.WORK_QUEUE_MAX_SIZE,
+            stats=self.stats,
+            name='webhook-worker'
+        )
+
+    @property
+    def default_mailbox(self):
+        """MailboxState of the first configured mailbox"""
+        return self.mailbox_state(self.registry.default)
+
+    @property
+    def gmail_auth(self):
+        """CredentialsManager of the default mailbox"""
+        return self.default_mailbox.gmail_auth
+
+    @property
+    def history_cursor(self):
+        """History cursor of the default mailbox"""
+        return self.default_mailbox.history_cursor
+
+    @property
+    def signal_extractor(self):
+        """SignalExtractor of the default mailbox"""
+        return self.default_mailbox.signal_extractor
+
+    @property
+    def watch_renewer(self):
+        """WatchRenewer of the default mailbox"""
+        return self.default_mailbox.watch_renewer
+
+    def mailbox_state(self, mailbox):
+        """
+        Get (or build) the state of a configured mailbox
+
+        Args:
+            mailbox: Mailbox from the registry
+
+        Returns:
+            MailboxState: The mailbox's credentials, cursor and extractor
+        """
+        key = mailbox.cursor_name
+        state = self._mailboxes.get(key)
+        if state is not None:
+            return state
+
+        with self._mailboxes_lock:
+            state = self._mailboxes.get(key)
+            if state is None:
+                if mailbox is self.registry.default and self._default_gmail_auth is not None:
+                    gmail_auth = self._default_gmail_auth
+                else:
+                    gmail_auth = self.auth_factory(mailbox)
+
+                state = MailboxState(
+                    mailbox,
+                    gmail_auth,
+                    self._signal_extractor.for_mailbox(mailbox),
+                    db_path=self.db_path,
+                    stats=self.stats
+                )
+                self._mailboxes[key] = state
+
+        return state
+
+    def route(self, email_address):
+        """
+        Find the state of the mailbox a notification belongs to
+
+        Args:
+            email_address: emailAddress of the notification
+
+        Returns:
+            MailboxState: The mailbox's state, or None if it is not served here
+        """
+        mailbox = self.registry.get(email_address)
+        return self.mailbox_state(mailbox) if mailbox is not None else None
+
+    def watch_statuses(self):
+        """
+        Get the watch state of every mailbox for health checks
+
+        Returns:
+            dict: Mailbox address ('me' for the single default mailbox) -> WatchRenewer.status()
+        """
+        return {
+            mailbox.cursor_name: self.mailbox_state(mailbox).watch_renewer.status()
+            for mailbox in self.registry
+        }
+
+    def start(self):
+        """Start the worker, spool drainer, token refresh and watch renewal threads and catch up from the cursors"""
+        self.gmail_auth.start()
+        self.work_queue.start()
+        self.spool_drainer.start()
+        if Config.WATCH_RENEW_ENABLED and Config.PUBSUB_TOPIC_NAME:
+            for mailbox in self.registry:
+                self.mailbox_state(mailbox).watch_renewer.start()
+        self.resume_from_cursor()
+
+    def stop(self):
+        """Stop the token refresh, spool drainer, watch renewal and history retry threads (idle workers stay parked)"""
+        self.spool_drainer.stop()
+        for state in list(self._mailboxes.values()):
+            state.gmail_auth.stop()
+            state.watch_renewer.stop()
+            if state.retry_timer is not None:
+                state.retry_timer.cancel()
+
+    def submit(self, notification):
+        """
+        Queue a notification for the worker pool
+
+        Returns:
+            bool: True if queued, False if the queue is full
+        """
+        return self.work_queue.submit(notification)
+
+    def get_email_processor(self):
+        """
+        Get the calling thread's EmailProcessor of the default mailbox
+
+        Returns:
+            EmailProcessor: Processor using this thread's own Gmail service
+        """
+        return self.default_mailbox.get_email_processor()
+
+    def process_notification(self, notification):
+        """
+        Process a queued push notification on a worker thread
+
+        The notification is routed to its mailbox by emailAddress. If the
+        mailbox already occupies its share of workers the notification is
+        parked and queued again once a slot frees up, so one busy mailbox
+        cannot hold every worker.
+
+        Args:
+            notification: Decoded Gmail notification ({'emailAddress', 'historyId'}),
+                or {'resume': True, 'emailAddress'} to catch up from the stored
+                cursor ('history_retry' counts reads of an incomplete window).
+                An optional 'received_at' (time.perf_counter() when the mail
+                was noticed) is used for the notify_to_forward latency.
+        """
+        state = self.route(notification.get('emailAddress'))
+
+        if state is None:
+            logger.warning("No mailbox configured for %s, ignoring notification", notification.get('emailAddress'))
+            self.stats.increment('notifications_unknown_mailbox')
+            return
+
+        if not state.acquire(notification):
+            self.stats.increment('notifications_parked')
+            return
+
+        try:
+            self.process_mailbox_notification(state, notification)
+        finally:
+            parked = state.release()
+
+        if parked is not None and not self.work_queue.submit(parked):
+            # Queue full: catch up here rather than wait for the mailbox's next notification
+            self.process_notification(parked)
+
+    def process_mailbox_notification(self, state, notification):
+        """
+        Catch up one mailbox from its history cursor
+
+        History is read while holding the cursor, so two workers (or
+        processes) never read the same history window, and the cursor only
+        moves forward once every message in the window is handled. If any
+        message (or signal attachment) of the window could not be fetched,
+        or reading the history failed, the cursor stays put and the window
+        is read again after a backoff (see _retry_window), skipping the
+        messages already handled.
+
+        Args:
+            state: MailboxState the notification was routed to
+            notification: Decoded Gmail notification
+        """
+        history_id = notification.get('historyId')
+
+        with log_context(pubsub_message_id=notification.get('pubsub_message_id'), history_id=history_id,
+                         mailbox=state.mailbox.email), \
+                state.history_cursor.hold() as start_history_id:
+            if start_history_id is None:
+                if history_id:
+                    # First notification ever - just record the history ID
+                    logger.info("Initialized with history ID: %s", history_id)
+                    state.history_cursor.advance(history_id)
+                return
+
+            if history_id and int(history_id) <= start_history_id:
+                logger.debug("History ID %s already processed", history_id)
+                return
+
+            email_processor = state.get_email_processor()
+            self._local.received_at = notification.get('received_at')
+            self._local.mailbox = state
+            self._local.fetch_failures = 0
+
+            try:
+                latest_history_id = self.process_history(start_history_id, email_processor)
+                fetch_failures = self._local.fetch_failures
+            except Exception:
+                self._retry_window(state, notification)
+                raise
+            finally:
+                self._local.received_at = None
+                self._local.mailbox = None
+                self._local.fetch_failures = None
+
+            if fetch_failures:
+                logger.warning("%d messages could not be fetched; history cursor stays at %s to read them again",
+                               fetch_failures, start_history_id)
+                self._retry_window(state, notification)
+                return
+
+            if history_id:
+                latest_history_id = max(latest_history_id, int(history_id))
+
+            if state.history_cursor.advance(latest_history_id):
+                logger.info("History cursor advanced to %s", latest_history_id)
+
+    def _retry_window(self, state, notification):
+        """
+        Queue another catch-up of a mailbox whose history window is incomplete
+
+        The catch-up is queued after an exponential backoff, at most
+        Config.HISTORY_RETRY_ATTEMPTS times in a row; after that the window
+        waits for the mailbox's next notification. A retry already scheduled
+        covers the window too. Called while holding the mailbox's cursor.
+
+        Args:
+            state: MailboxState of the mailbox
+            notification: Notification whose window was incomplete
+        """
+        attempt = notification.get('history_retry', 0) + 1
+        if attempt > Config.HISTORY_RETRY_ATTEMPTS:
+            logger.error("History window still incomplete after %d retries; waiting for the next notification",
+                         Config.HISTORY_RETRY_ATTEMPTS)
+            self.stats.increment('history_retries_exhausted')
+            return
+
+        if state.retry_timer is not None and state.retry_timer.is_alive():
+            return
+
+        delay = min(Config.HISTORY_RETRY_MAX, Config.HISTORY_RETRY_BASE * (2 ** (attempt - 1)))
+        logger.info("Reading the history window again in %.1fs (retry %d/%d)",
+                    delay, attempt, Config.HISTORY_RETRY_ATTEMPTS)
+        self.stats.increment('history_windows_retried')
+
+        retry = {'resume': True, 'emailAddress': state.mailbox.email, 'history_retry': attempt}
+        state.retry_timer = threading.Timer(delay, self.work_queue.submit, args=(retry,))
+        state.retry_timer.daemon = True
+        state.retry_timer.start()
+
+    def process_history(self, start_history_id, email_processor):
+        """
+        Fetch and process every message added since a history ID
+
+        Message IDs are streamed from the paginated history and handled in
+        batches of Config.GMAIL_BATCH_SIZE, so a long catch-up runs in
+        constant memory.
+
+        Args:
+            start_history_id: Last fully processed history ID
+            email_processor: EmailProcessor instance
+
+        Returns:
+            int: History ID the processed messages are complete up to
+        """
+        message_ids = email_processor.iter_history(start_history_id)
+
+        while True:
+            with self.stats.time('history'):
+                chunk = list(islice(message_ids, Config.GMAIL_BATCH_SIZE))
+
+            if not chunk:
+                break
+
+            self.stats.increment('history_messages', len(chunk))
+            self.process_message_batch(chunk, email_processor)
+
+        return email_processor.latest_history_id
+
+    def process_message_batch(self, message_ids, email_processor):
+        """
+        Prefilter, batch-fetch and process a list of added messages
+
+        Args:
+            message_ids: List of Gmail message IDs
+            email_processor: EmailProcessor instance
+        """
+        state = getattr(self._local, 'mailbox', None)
+        handled = state.handled if state is not None else BoundedIdSet(len(message_ids))
+
+        # Never fetch messages that were already forwarded or handled
+        message_ids = [message_id for message_id in message_ids if message_id not in handled]
+        new_ids = [message_id for message_id in message_ids if not self.dedupe_store.is_forwarded(message_id)]
+        if len(new_ids) < len(message_ids):
+            logger.warning("Dropping %d messages whose signals were already forwarded",
+                           len(message_ids) - len(new_ids))
+            self.stats.increment('signals_duplicate', len(message_ids) - len(new_ids))
+        message_ids = new_ids
+
+        if message_ids and Config.PREFILTER_ENABLED:
+            # Skip the full download for mail that cannot be a signal
+            with self.stats.time('prefilter'):
+                message_ids, report = email_processor.prefilter(message_ids)
+
+            self.stats.increment('prefilter_checked', report['checked'])
+            self.stats.increment('prefilter_full_fetches_saved', report['rejected'])
+            self.stats.increment('prefilter_bytes_saved', report['bytes_saved'])
+            logger.info("Prefilter skipped %d/%d messages (~%d bytes not downloaded)",
+                        report['rejected'], report['checked'], report['bytes_saved'])
+
+        if not message_ids:
+            return
+
+        # Fetch every added message in as few batch round trips as possible
+        with self.stats.time('fetch'):
+            messages, errors = email_processor.get_messages(message_ids)
+
+        if errors:
+            self.stats.increment('fetch_errors', len(errors))
+
+        for message_id in message_ids:
+            if message_id in messages:
+                fetched = self.process_message(message_id, email_processor, message=messages[message_id])
+            elif message_id in errors:
+                # Batch items fail independently; fetch the failed ones again on their own
+                fetched = self.process_message(message_id, email_processor)
+            else:
+                continue
+
+            if fetched:
+                handled.add(message_id)
+            elif getattr(self._local, 'fetch_failures', None) is not None:
+                self._local.fetch_failures += 1
+
+    def resume_from_cursor(self):
+        """Queue a catch-up from every mailbox's stored history cursor (used at startup)"""
+        for mailbox in self.registry:
+            start_history_id = self.mailbox_state(mailbox).history_cursor.get()
+
+            if start_history_id is None:
+                logger.info("No stored history cursor for %s; waiting for the first notification",
+                            mailbox.cursor_name)
+                continue
+
+            logger.info("Resuming %s from stored history ID: %s", mailbox.cursor_name, start_history_id)
+            self.work_queue.submit({'resume': True, 'emailAddress': mailbox.email})
+
+    def process_message(self, message_id, email_processor, message=None):
+        """
+        Process a single email message
+
+        Args:
+            message_id: Gmail message ID
+            email_processor: EmailProcessor instance
+            message: Already fetched message (fetched by ID if omitted)
+
+        Returns:
+            bool: False if the message, or one of its signal attachments,
+                could not be fetched and should be read again later
+        """
+        with log_context(message_id=message_id):
+            try:
+                logger.debug("Processing message")
+
+                if self.dedupe_store.is_forwarded(message_id):
+                    logger.warning("Message was already forwarded, dropping duplicate")
+                    self.stats.increment('signals_duplicate')
+                    return True
+
+                # Fetch the message
+                if message is None:
+                    try:
+                        with self.stats.time('fetch'):
+                            message = email_processor.get_message(message_id)
+                    except MessageFetchError as e:
+                        logger.warning("Could not fetch message: %s", e)
+                        self.stats.increment('fetch_failed')
+                        return False
+
+                if not message:
+                    logger.info("Message no longer exists, skipping")
+                    return True
+
+                self.stats.increment('messages_fetched')
+
+                # Decode the message once for detection, extraction and logging
+                parsed = email_processor.parse(message)
+
+                # Check if it's a signal email
+                with self.stats.time('detect'):
+                    is_signal = email_processor.is_signal_email(parsed)
+
+                if not is_signal:
+                    logger.debug("Not a signal email")
+                    return True
+
+                hits = parsed.identifier_hits(email_processor.identifier_matcher)
+                logger.info("Signal email detected: %s", parsed.subject,
+                            extra={'identifiers': [identifier for identifier, _ in hits]})
+                if parsed.truncated or parsed.skipped_parts:
+                    summary = email_processor.get_message_summary(parsed)
+                    logger.warning("Body truncated to %d characters (%d attachment-backed parts skipped)",
+                                   summary['body_length'], summary['skipped_parts'])
+                self.stats.increment('signal_emails')
+
+                # Extract and format signal with the settings of the mailbox being
+                # caught up (the default mailbox for direct calls)
+                state = getattr(self._local, 'mailbox', None) or self.default_mailbox
+
+                # Order baskets in CSV/JSON attachments take the place of the signal in the text
+                if self.attachment_reader is not None:
+                    attachments = self.attachment_reader.signal_attachments(parsed)
+                    if attachments:
+                        return self._forward_attachments(parsed, attachments, email_processor, state)
+
+                with self.stats.time('extract'):
+                    source, payload = state.signal_extractor.extract_message(parsed)
+                self.stats.increment(f"signals_extracted_{source}")
+
+                if not payload:
+                    logger.warning("Could not extract signal")
+                    return True
+
+                logger.info("Extracted %s signal", source, extra={'signal_id': payload['signalID']})
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Signal data", extra={'signal_id': payload['signalID'], 'signal': payload['signal']})
+
+                self._forward(payload, parsed, state, message_id)
+
+            except Exception as e:
+                logger.exception("Error processing message: %s", e)
+
+            return True
+
+    def _forward_attachments(self, parsed, attachments, email_processor, state):
+        """
+        Forward the rows of a message's signal attachments as basket signals
+
+        Every batch is claimed, spooled and sent on its own as it is read, so
+        only one batch of rows is in memory at a time. The message itself is
+        only recorded as forwarded once every attachment was read to the end;
+        a message interrupted part-way is read again without resending the
+        batches already claimed.
+
+        Args:
+            parsed: ParsedMessage
+            attachments: (part, format) tuples from AttachmentSignalReader.signal_attachments
+            email_processor: EmailProcessor used to download the attachments
+            state: MailboxState of the receiving mailbox
+
+        Returns:
+            bool: False if an attachment could not be downloaded
+        """
+        complete = True
+        fetched = True
+
+        for index, (part, data_format) in enumerate(attachments):
+            filename = part.get('filename')
+            body = part.get('body', {})
+
+            with self.stats.time('attachment_fetch'):
+                data = body.get('data') or email_processor.get_attachment_data(parsed.id, body['attachmentId'])
+
+            if data is None:
+                self.stats.increment('fetch_failed')
+                complete = fetched = False
+                continue
+
+            self.stats.increment('attachments_read')
+            try:
+                for signal_id, signal_data in self.attachment_reader.signals(data, part, data_format, parsed.id, index):
+                    payload = state.signal_extractor.format_for_api(signal_data, signal_id)
+                    logger.info("Extracted basket of %d orders from %s", len(signal_data['orders']), filename,
+                                extra={'signal_id': signal_id})
+                    self.stats.increment('signals_extracted_attachment')
+                    self._forward(payload, parsed, state, signal_id)
+            except ValueError as e:
+                logger.error("Could not read signals from attachment %s: %s", filename, e)
+                self.stats.increment('attachment_errors')
+                complete = False
+
+        if complete:
+            self.dedupe_store.claim(parsed.id)
+
+        return fetched
+
+    def _forward(self, payload, parsed, state, claim_id):
+        """
+        Route, claim, spool and send one signal payload
+
+        Args:
+            payload: Formatted signal payload
+            parsed: ParsedMessage the signal came from
+            state: MailboxState of the receiving mailbox
+            claim_id: Dedupe key recorded as forwarded (the message ID, or
+                the signal ID of an attachment batch)
+        """
+        # Pick the strategy and endpoint
+        with self.stats.time('route'):
+            rule = self.routing_rules.apply(payload, parsed, state.mailbox.email)
+        api_url = rule.api_url if rule else None
+        if rule is not None:
+            logger.info("Routed by %s to %s", rule.name, payload['strategy_name'],
+                        extra={'signal_id': payload['signalID']})
+            self.stats.increment('signals_routed')
+
+        spool_id = self.forward_ledger.claim(payload, claim_id, api_url)
+        if spool_id is None:
+            return
+
+        # Forward to API
+        with self.stats.time('forward'):
+            success, response = self.api_forwarder.send_signal(payload, api_url=api_url)
+        self.forward_ledger.finish(spool_id, payload, success, response)
+
+        if success:
+            received_at = getattr(self._local, 'received_at', None)
+            if received_at is not None:
+                self.stats.record('notify_to_forward', time.perf_counter() - received_at)
+            if parsed.internal_date:
+                self.stats.record('email_to_forward', time.time() - parsed.internal_date)
+
+
+def _mailbox_credentials(mailbox):
+    """CredentialsManager reading a mailbox's own token file"""
+    return CredentialsManager(GmailAuthenticator(mailbox.token_file))
+
+
+def _merge_notifications(parked, notification):
+    """
+    One notification standing in for two of the same mailbox
+
+    Catching up to the later history ID covers both; the earlier receive
+    time is kept so notify_to_forward latency includes the wait.
+    """
+    if parked is None:
+        return notification
+
+    merged = dict(notification)
+    history_ids = [int(item['historyId']) for item in (parked, notification) if item.get('historyId')]
+    if history_ids:
+        merged['historyId'] = max(history_ids)
+
+    received = [item['received_at'] for item in (parked, notification) if item.get('received_at') is not None]
+    if received:
+        merged['received_at'] = min(received)
+
+    return merged
@@ -0,0 +1,460 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from state_store import connect_state_db
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; only one process drains there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class SignalSpool:
+    """
+    Durable outbound spool of signal payloads
+
+    Every payload is written here before it is sent and marked done once the
+    API accepts it, so failed or interrupted forwards survive restarts and
+    can be redelivered. The passphrase is never written to disk; it is added
+    back from Config when an entry is redelivered.
+    """
+
+    PENDING = 'pending'
+    DONE = 'done'
+    DEAD = 'dead'
+
+    def __init__(self, db_path=None):
+        """
+        Args:
+            db_path: State database path (default: Config.STATE_DB_PATH)
+        """
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self._conn = connect_state_db(self.db_path)
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS signal_spool ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'signal_id TEXT NOT NULL UNIQUE, '
+                'payload TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'next_attempt_at REAL NOT NULL, '
+                'last_error TEXT, '
+                'api_url TEXT)'
+            )
+
+            # Spools created before routing rules have no api_url column
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(signal_spool)')}
+            if 'api_url' not in columns:
+                self._conn.execute('ALTER TABLE signal_spool ADD COLUMN api_url TEXT')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS signal_spool_due '
+                'ON signal_spool (status, next_attempt_at)'
+            )
+
+    def add(self, payload, lease=0, api_url=None):
+        """
+        Record a payload that is about to be sent
+
+        Args:
+            payload: Formatted signal payload
+            lease: Seconds before the drainer may pick the entry up; covers the
+                in-flight send so it is only redelivered if that send never
+                completes (e.g. the process crashed)
+            api_url: Endpoint chosen by a routing rule (None for the default)
+
+        Returns:
+            int: Spool entry ID
+        """
+        with self._lock:
+            return self.insert(self._conn, payload, lease, api_url)
+
+    def insert(self, conn, payload, lease=0, api_url=None):
+        """
+        Record a payload through another connection to the state database
+
+        Lets the insert join that connection's open transaction (see
+        DedupeStore.claim). Same arguments as add().
+
+        Args:
+            conn: sqlite3.Connection to this spool's database
+
+        Returns:
+            int: Spool entry ID
+        """
+        stored = {key: value for key, value in payload.items() if key != 'passphrase'}
+        now = time.time()
+
+        conn.execute(
+            'INSERT OR IGNORE INTO signal_spool '
+            '(signal_id, payload, status, created_at, updated_at, next_attempt_at, api_url) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (payload['signalID'], json.dumps(stored), self.PENDING, now, now, now + lease, api_url)
+        )
+        row = conn.execute(
+            'SELECT id FROM signal_spool WHERE signal_id = ?',
+            (payload['signalID'],)
+        ).fetchone()
+
+        return row[0]
+
+    def mark_done(self, entry_id):
+        """Mark an entry as delivered"""
+        self._update(entry_id, self.DONE)
+
+    def mark_failed(self, entry_id, error):
+        """
+        Record a failed delivery and schedule the next attempt with backoff
+
+        Args:
+            entry_id: Spool entry ID
+            error: Error description
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT attempts FROM signal_spool WHERE id = ?', (entry_id,)
+            ).fetchone()
+            if not row:
+                return
+
+            attempts = row[0] + 1
+            delay = min(Config.SPOOL_BACKOFF_MAX, Config.SPOOL_BACKOFF_BASE * (2 ** (attempts - 1)))
+            self._conn.execute(
+                'UPDATE signal_spool SET attempts = ?, last_error = ?, '
+                'updated_at = ?, next_attempt_at = ? WHERE id = ?',
+                (attempts, str(error), now, now + delay, entry_id)
+            )
+
+    def dead_letter(self, entry_id, reason):
+        """Stop redelivering an entry"""
+        self._update(entry_id, self.DEAD, reason)
+
+    def has_backlog(self, exclude=()):
+        """
+        Check for undelivered entries
+
+        Args:
+            exclude: Entry IDs to ignore (e.g. sends still in flight)
+
+        Returns:
+            bool: True if any other entry is pending
+        """
+        exclude = list(exclude)
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM signal_spool WHERE status = ? '
+                f"AND id NOT IN ({', '.join('?' for _ in exclude)}) LIMIT 1",
+                (self.PENDING, *exclude)
+            ).fetchone()
+
+        return row is not None
+
+    def pending(self, limit=100):
+        """
+        Get pending entries oldest first, whether or not their next attempt is due
+
+        Args:
+            limit: Maximum entries to return
+
+        Returns:
+            list: Entry dicts
+        """
+        return self._select(
+            'WHERE status = ? ORDER BY id LIMIT ?',
+            (self.PENDING, limit)
+        )
+
+    def entries(self, status=None, entry_ids=None):
+        """
+        List spool entries, oldest first
+
+        Args:
+            status: Only entries with this status
+            entry_ids: Only these entry IDs
+
+        Returns:
+            list: Entry dicts
+        """
+        clauses, params = self._filters(status, entry_ids)
+        return self._select(f"{clauses} ORDER BY id", params)
+
+    @classmethod
+    def is_leased(cls, entry, now=None):
+        """
+        Check whether an entry may still be in flight with the direct send that spooled it
+
+        A direct send spools its payload with a lease and no attempts, and
+        only gives the entry up when it records the outcome or the lease
+        runs out.
+
+        Args:
+            entry: Entry dict from entries()
+            now: Current time (default: time.time())
+
+        Returns:
+            bool: True if the entry is pending, never attempted and not yet due
+        """
+        now = time.time() if now is None else now
+        return entry['status'] == cls.PENDING and entry['attempts'] == 0 and entry['next_attempt_at'] > now
+
+    def purge(self, status=None, entry_ids=None):
+        """
+        Delete spool entries
+
+        Args:
+            status: Only entries with this status
+            entry_ids: Only these entry IDs
+
+        Returns:
+            int: Number of entries deleted
+        """
+        clauses, params = self._filters(status, entry_ids)
+
+        with self._lock:
+            cursor = self._conn.execute(f"DELETE FROM signal_spool {clauses}", params)
+
+        return cursor.rowcount
+
+    def prune_done(self, older_than):
+        """
+        Delete delivered entries older than a number of seconds
+
+        Returns:
+            int: Number of entries deleted
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'DELETE FROM signal_spool WHERE status = ? AND updated_at < ?',
+                (self.DONE, time.time() - older_than)
+            )
+
+        return cursor.rowcount
+
+    @staticmethod
+    def payload_for(entry):
+        """
+        Rebuild the sendable payload of an entry
+
+        Args:
+            entry: Entry dict
+
+        Returns:
+            dict: Payload including the passphrase
+        """
+        payload = dict(entry['payload'])
+        payload['passphrase'] = Config.MATHEMATRICKS_PASSPHRASE
+        return payload
+
+    def _update(self, entry_id, status, error=None):
+        """Set the status (and optionally the error) of an entry"""
+        with self._lock:
+            self._conn.execute(
+                'UPDATE signal_spool SET status = ?, updated_at = ?, '
+                'last_error = COALESCE(?, last_error) WHERE id = ?',
+                (status, time.time(), error, entry_id)
+            )
+
+    def _select(self, clauses, params):
+        """Run a SELECT over the spool and return entry dicts"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, signal_id, payload, status, attempts, created_at, '
+                f"updated_at, next_attempt_at, last_error, api_url FROM signal_spool {clauses}",
+                params
+            ).fetchall()
+
+        return [
+            {
+                'id': row[0],
+                'signal_id': row[1],
+                'payload': json.loads(row[2]),
+                'status': row[3],
+                'attempts': row[4],
+                'created_at': row[5],
+                'updated_at': row[6],
+                'next_attempt_at': row[7],
+                'last_error': row[8],
+                'api_url': row[9]
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    def _filters(status, entry_ids):
+        """Build a WHERE clause for a status and/or entry ID filter"""
+        conditions = []
+        params = []
+
+        if status:
+            conditions.append('status = ?')
+            params.append(status)
+
+        if entry_ids:
+            conditions.append(f"id IN ({', '.join('?' for _ in entry_ids)})")
+            params.extend(entry_ids)
+
+        clauses = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        return clauses, tuple(params)
+
+
+class SpoolDrainer:
+    """Background thread redelivering pending spool entries in order"""
+
+    def __init__(self, spool, api_forwarder, interval=None, max_age=None, stats=None):
+        """
+        Args:
+            spool: SignalSpool instance
+            api_forwarder: APIForwarder used for redelivery
+            interval: Seconds between drain passes (default: Config.SPOOL_DRAIN_INTERVAL)
+            max_age: Seconds after which an undelivered signal is dead-lettered
+                (default: Config.SPOOL_MAX_AGE_SECONDS)
+            stats: Optional PipelineStats for redelivery counters
+        """
+        self.spool = spool
+        self.api_forwarder = api_forwarder
+        self.interval = interval or Config.SPOOL_DRAIN_INTERVAL
+        self.max_age = max_age or Config.SPOOL_MAX_AGE_SECONDS
+        self.stats = stats
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the drainer thread (safe to call more than once)"""
+        with self._start_lock:
+            if self._thread:
+                return
+
+            self._thread = threading.Thread(target=self._run, name='spool-drainer', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Run a drain pass as soon as possible"""
+        self._wake.set()
+
+    def stop(self):
+        """Stop the drainer thread after the current pass"""
+        self._stop.set()
+        self._wake.set()
+
+    def drain(self):
+        """
+        Redeliver pending entries strictly oldest first
+
+        A pass stops at the oldest pending entry that is not due yet (backing
+        off, or still in flight) and at the first failed delivery, so later
+        signals are never sent ahead of an earlier one. Entries older than
+        max_age, and entries the API rejects permanently (see
+        APIForwarder.send_signal), are dead-lettered instead. Only one
+        process drains a spool at a time; a pass is skipped while another
+        process holds it.
+
+        Returns:
+            int: Number of entries delivered
+        """
+        with self._drain_lock() as acquired:
+            if not acquired:
+                return 0
+            return self._drain()
+
+    def _drain(self):
+        """Redeliver pending entries up to the first one not due (drain lock must be held)"""
+        delivered = 0
+
+        for entry in self.spool.pending():
+            now = time.time()
+            age = now - entry['created_at']
+            if age > self.max_age:
+                logger.error("Dead-lettering signal %s: undelivered after %.0fs", entry['signal_id'], age)
+                self.spool.dead_letter(entry['id'], f"Expired after {age:.0f}s")
+                self._increment('spool_dead_lettered')
+                continue
+
+            if entry['next_attempt_at'] > now:
+                # Head of the line is backing off or in flight; nothing may overtake it
+                break
+
+            success, response = self.api_forwarder.send_signal(self.spool.payload_for(entry), api_url=entry['api_url'])
+
+            if not success and not response.get('retryable', True):
+                # A permanent rejection must not block the signals behind it
+                logger.error("Dead-lettering signal %s: %s", entry['signal_id'], response.get('error'))
+                self.spool.dead_letter(entry['id'], response.get('error'))
+                self._increment('spool_dead_lettered')
+                continue
+
+            if not success:
+                logger.warning("Redelivery of signal %s failed: %s", entry['signal_id'], response.get('error'))
+                self.spool.mark_failed(entry['id'], response.get('error'))
+                self._increment('spool_redelivery_failed')
+                break
+
+            logger.info("Redelivered signal %s", entry['signal_id'])
+            self.spool.mark_done(entry['id'])
+            self._increment('spool_redelivered')
+            delivered += 1
+
+        return delivered
+
+    def hold(self):
+        """
+        Keep the drainers of every process off the spool, e.g. while it is
+        replayed by hand; waits for a pass in progress to finish
+
+        Returns:
+            Context manager holding the drain lock
+        """
+        return self._drain_lock(blocking=True)
+
+    @contextmanager
+    def _drain_lock(self, blocking=False):
+        """Try to take the cross-process drain lock; yields whether it was taken"""
+        with self._lock:
+            if fcntl is None:
+                yield True
+                return
+
+            with open(f"{self.spool.db_path}.spool.lock", 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self):
+        """Drainer loop: drain on every interval or wake-up"""
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+
+            try:
+                self.drain()
+                self.spool.prune_done(Config.SPOOL_DONE_RETENTION_SECONDS)
+            except Exception as e:
+                logger.exception("Error draining signal spool: %s", e)
+
+    def _increment(self, name):
+        """Increment a stats counter if stats are attached"""
+        if self.stats is not None:
+            self.stats.increment(name)
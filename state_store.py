@@ -0,0 +1,32 @@
+import os
+import sqlite3
+from config import Config
+
+
+def connect_state_db(db_path=None):
+    """
+    Open a connection to the local SQLite state database
+
+    The database is shared by threads and processes, so it runs in WAL mode
+    with full fsync on commit and waits on locks instead of failing.
+
+    Args:
+        db_path: Database file path (default: Config.STATE_DB_PATH)
+
+    Returns:
+        sqlite3.Connection: Connection in autocommit mode
+    """
+    db_path = db_path or Config.STATE_DB_PATH
+
+    directory = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(directory, exist_ok=True)
+
+    conn = sqlite3.connect(
+        db_path,
+        timeout=30,
+        isolation_level=None,
+        check_same_thread=False
+    )
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    return conn
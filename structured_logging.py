@@ -0,0 +1,199 @@
+"""
+Non-blocking JSON-lines logging
+
+Modules log through `logging.getLogger(__name__)`. setup_logging() routes
+every record through a bounded in-memory queue to a background thread
+that formats and writes it, so a burst of log lines never waits on stdout.
+Records carry the correlation IDs bound with log_context() (Gmail message
+ID, Pub/Sub messageId, signal ID, history ID), and any `passphrase` field or
+occurrence of the configured passphrase is redacted before it is written.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from config import Config
+
+REDACTED = '[REDACTED]'
+
+# Field names whose values are never written
+SECRET_FIELDS = frozenset({'passphrase'})
+
+# Correlation IDs of the current thread or asyncio task
+_context = contextvars.ContextVar('log_context', default={})
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'context'}
+
+_setup_lock = threading.Lock()
+_listener = None
+_listener_pid = None
+
+
+@contextmanager
+def log_context(**ids):
+    """
+    Bind correlation IDs to every record logged inside the block
+
+    IDs that are None are ignored; nested blocks add to the outer IDs.
+
+    Args:
+        **ids: e.g. message_id, pubsub_message_id, signal_id, history_id
+    """
+    token = _context.set({**_context.get(), **{key: value for key, value in ids.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def redact(value):
+    """
+    Copy of a value with secret fields and the configured passphrase masked
+
+    Args:
+        value: String, dict, list or scalar
+
+    Returns:
+        Redacted value
+    """
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in SECRET_FIELDS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str) and Config.MATHEMATRICKS_PASSPHRASE and Config.MATHEMATRICKS_PASSPHRASE in value:
+        return value.replace(Config.MATHEMATRICKS_PASSPHRASE, REDACTED)
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    """Format a record as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+
+        return json.dumps(redact(entry), default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format for local runs; correlation IDs go in brackets"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        context = getattr(record, 'context', None)
+        if context:
+            line += ' [' + ' '.join(f"{key}={value}" for key, value in context.items()) + ']'
+        return redact(line)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller
+
+    The message is rendered here (so later changes to the arguments don't
+    leak into the log) together with the current correlation IDs; JSON
+    encoding, redaction and the write happen on the listener thread. When
+    the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        record.context = _context.get()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None, log_format=None, stream=None):
+    """
+    Send all logging through the background queue (once per process)
+
+    Safe to call repeatedly; a forked worker process (gunicorn) calling it
+    again gets its own queue and writer thread.
+
+    Args:
+        level: Minimum level name (default: Config.LOG_LEVEL)
+        log_format: 'json' or 'text' (default: Config.LOG_FORMAT)
+        stream: Output stream (default: sys.stdout)
+    """
+    global _listener, _listener_pid
+
+    with _setup_lock:
+        if _listener_pid == os.getpid():
+            return
+
+        log_queue = queue.Queue(Config.LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(TextFormatter() if (log_format or Config.LOG_FORMAT) == 'text' else JSONFormatter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_QueueHandler(log_queue))
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+
+        # Only this process's listener; a listener inherited over fork has no thread
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        _listener_pid = os.getpid()
+        atexit.register(_flush, _listener, _listener_pid)
+
+
+def _flush(listener, pid):
+    """Write out queued records at exit (only in the process that owns the listener)"""
+    if os.getpid() == pid:
+        listener.stop()
+
+
+def dropped_records():
+    """
+    Records dropped because the log queue was full
+
+    Returns:
+        int: Count for this process
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _QueueHandler):
+            return handler.dropped
+    return 0
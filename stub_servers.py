@@ -0,0 +1,399 @@
+"""
+Local stand-ins for the Gmail API and the Mathematricks API
+
+Used by benchmarks.py to exercise the real clients (googleapiclient,
+requests, aiohttp) end to end without network access or credentials.
+Each server runs on a background thread and can add a fixed latency to
+every request to model the network round trip, and fail a random share
+of requests to model a flaky backend.
+"""
+
+import base64
+import json
+import random
+import re
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class _StubServer:
+    """Threaded HTTP server running a handler class on 127.0.0.1"""
+
+    def __init__(self, handler_class, port=0, latency=0.0, error_rate=0.0, seed=None):
+        """
+        Args:
+            handler_class: BaseHTTPRequestHandler subclass
+            port: Port to listen on (0 picks a free one)
+            latency: Seconds added to every response
+            error_rate: Share of requests (0-1) answered with a server error
+            seed: Seed of the random error decisions (for repeatable runs)
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), handler_class)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve on a background thread"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count_request(self):
+        """Count a request and wait out the configured latency"""
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def should_fail(self):
+        """Decide whether to fail the current request (counts the failure)"""
+        if not self.error_rate:
+            return False
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """Keep-alive handler with JSON helpers"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; don't let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    @property
+    def stub(self):
+        return self.server.stub
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def send_body(self, status, body, content_type='application/json'):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGmailServer(_StubServer):
+    """
+    Minimal Gmail REST API over an in-memory mailbox
+
+    Supports users.history.list, users.messages.get (full and metadata),
+    users.messages.attachments.get, users.messages.list, users.getProfile,
+    users.watch and batch requests, which is everything the pipeline calls.
+    """
+
+    def __init__(self, messages=(), port=0, latency=0.0, email_address='me@example.com', error_rate=0.0, seed=None):
+        """
+        Args:
+            messages: Gmail messages (format='full' dicts with an 'id')
+            port: Port to listen on (0 picks a free one)
+            latency: Seconds added to every request (one batch counts once)
+            email_address: Mailbox address reported by getProfile
+            error_rate: Share of history/message requests (each batch part
+                separately) answered with 500
+            seed: Seed of the random error decisions
+        """
+        super().__init__(_GmailHandler, port, latency, error_rate, seed)
+        self.email_address = email_address
+        self.messages = {}
+        self.attachments = {}
+        self.history = []
+        self.history_id = 1000
+        self.message_fetches = 0
+        self.watch_failures = 0
+        self.watches = []
+
+        for message in messages:
+            self.add_message(message)
+
+    def add_message(self, message, attachments=None):
+        """
+        Deliver a message to the mailbox
+
+        Args:
+            message: Gmail message (format='full' dict with an 'id')
+            attachments: Attachment ID to bytes, for parts whose body has an attachmentId
+
+        Returns:
+            int: History ID of the new messageAdded record
+        """
+        with self._lock:
+            self.history_id += 1
+            self.messages[message['id']] = message
+            for attachment_id, data in (attachments or {}).items():
+                self.attachments[(message['id'], attachment_id)] = {
+                    'size': len(data),
+                    'data': base64.urlsafe_b64encode(data).decode('ascii')
+                }
+            self.history.append((self.history_id, message['id']))
+            return self.history_id
+
+    def discovery_document(self):
+        """
+        Gmail discovery document pointing at this server
+
+        Returns:
+            str: Discovery JSON for googleapiclient.discovery.build_from_document
+        """
+        from googleapiclient.discovery_cache import get_static_doc
+
+        document = json.loads(get_static_doc('gmail', 'v1'))
+        document['rootUrl'] = f"{self.url}/"
+        document['baseUrl'] = f"{self.url}/"
+        return json.dumps(document)
+
+    def build_service(self):
+        """
+        googleapiclient Gmail service talking to this server
+
+        Returns:
+            googleapiclient.discovery.Resource: Gmail service
+        """
+        from google.oauth2.credentials import Credentials
+        from googleapiclient.discovery import build_from_document
+
+        return build_from_document(self.discovery_document(), credentials=Credentials(token='stub-token'))
+
+    def watch(self, request_body):
+        """Build a users.watch response (7-day expiry), or None while failures remain"""
+        with self._lock:
+            if self.watch_failures > 0:
+                self.watch_failures -= 1
+                return None
+            self.watches.append(request_body)
+            return {
+                'historyId': str(self.history_id),
+                'expiration': str(int((time.time() + 7 * 86400) * 1000))
+            }
+
+    def history_page(self, start_history_id, max_results, page_token):
+        """Build a users.history.list response"""
+        offset = int(page_token or 0)
+
+        with self._lock:
+            records = [record for record in self.history if record[0] > int(start_history_id)]
+            history_id = self.history_id
+
+        page = records[offset:offset + max_results]
+        response = {
+            'history': [
+                {'id': str(record_id), 'messagesAdded': [{'message': {'id': message_id}}]}
+                for record_id, message_id in page
+            ],
+            'historyId': str(history_id)
+        }
+        if offset + max_results < len(records):
+            response['nextPageToken'] = str(offset + max_results)
+        return response
+
+    def message_resource(self, message_id, query):
+        """Build a users.messages.get response, or None if the message is unknown"""
+        with self._lock:
+            message = self.messages.get(message_id)
+            self.message_fetches += 1
+
+        if message is None:
+            return None
+
+        if query.get('format', ['full'])[0] != 'metadata':
+            return message
+
+        wanted = set(query.get('metadataHeaders', []))
+        payload = message.get('payload', {})
+        return {
+            'id': message['id'],
+            'threadId': message.get('threadId', message['id']),
+            'snippet': message.get('snippet', ''),
+            'sizeEstimate': message.get('sizeEstimate', len(json.dumps(message))),
+            'payload': {
+                'mimeType': payload.get('mimeType', ''),
+                'headers': [
+                    header for header in payload.get('headers', [])
+                    if not wanted or header['name'] in wanted
+                ]
+            }
+        }
+
+
+class _GmailHandler(_JSONHandler):
+    """Request handler of StubGmailServer"""
+
+    MESSAGE_PATH = re.compile(r'^/gmail/v1/users/me/messages/([^/]+)$')
+    ATTACHMENT_PATH = re.compile(r'^/gmail/v1/users/me/messages/([^/]+)/attachments/([^/]+)$')
+
+    def do_GET(self):
+        self.stub.count_request()
+        status, body = self.route(self.path)
+        self.send_body(status, body)
+
+    def do_POST(self):
+        self.stub.count_request()
+        body = self.read_body()
+
+        if urlsplit(self.path).path == '/gmail/v1/users/me/watch':
+            response = self.stub.watch(json.loads(body or b'{}'))
+            if response is None:
+                self.send_body(503, {'error': {'code': 503, 'message': 'Backend Error'}})
+            else:
+                self.send_body(200, response)
+            return
+
+        if not self.path.startswith('/batch'):
+            self.send_body(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+
+        boundary = 'stub_batch_boundary'
+        self.send_body(
+            200,
+            self.batch_response(body, self.headers.get('Content-Type', ''), boundary),
+            f"multipart/mixed; boundary={boundary}"
+        )
+
+    def route(self, path):
+        """Answer one Gmail API GET; returns (status, body)"""
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+
+        if url.path != '/gmail/v1/users/me/profile' and self.stub.should_fail():
+            return 500, {'error': {'code': 500, 'message': 'Backend Error'}}
+
+        if url.path == '/gmail/v1/users/me/history':
+            return 200, self.stub.history_page(
+                query['startHistoryId'][0],
+                int(query.get('maxResults', ['100'])[0]),
+                query.get('pageToken', [None])[0]
+            )
+
+        if url.path == '/gmail/v1/users/me/profile':
+            return 200, {'emailAddress': self.stub.email_address, 'historyId': str(self.stub.history_id)}
+
+        if url.path == '/gmail/v1/users/me/messages':
+            return 200, {'messages': [{'id': message_id} for message_id in list(self.stub.messages)]}
+
+        match = self.ATTACHMENT_PATH.match(url.path)
+        if match:
+            attachment = self.stub.attachments.get(match.groups())
+            if attachment is None:
+                return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}
+            return 200, attachment
+
+        match = self.MESSAGE_PATH.match(url.path)
+        if match:
+            message = self.stub.message_resource(match.group(1), query)
+            if message is None:
+                return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}
+            return 200, message
+
+        return 404, {'error': {'code': 404, 'message': 'Not found'}}
+
+    def batch_response(self, body, content_type, boundary):
+        """Answer every request of a multipart/mixed batch"""
+        batch = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('utf-8') + body
+        )
+        parts = []
+
+        for part in batch.iter_parts():
+            request_line = part.get_payload(decode=True).split(b'\r\n', 1)[0].decode('utf-8')
+            path = request_line.split(' ')[1]
+            status, response = self.route(urlsplit(path)._replace(scheme='', netloc='').geturl())
+            content_id = part['Content-ID'].strip('<>')
+            encoded = json.dumps(response)
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(encoded)}\r\n\r\n"
+                f"{encoded}\r\n"
+            )
+
+        return (''.join(parts) + f"--{boundary}--\r\n").encode('utf-8')
+
+
+class StubMathematricksServer(_StubServer):
+    """Signal API that records every payload it accepts"""
+
+    def __init__(self, port=0, latency=0.0, fail_first=0, status_code=503, error_rate=0.0, seed=None):
+        """
+        Args:
+            port: Port to listen on (0 picks a free one)
+            latency: Seconds added to every request
+            fail_first: Number of initial requests answered with status_code
+            status_code: Status returned for the failing requests
+            error_rate: Share of later requests answered with status_code
+            seed: Seed of the random error decisions
+        """
+        super().__init__(_MathematricksHandler, port, latency, error_rate, seed)
+        self.fail_first = fail_first
+        self.status_code = status_code
+        self.signals = []
+        self.accepted_at = {}
+
+    def accept(self, payload):
+        """
+        Record a payload unless the request should fail
+
+        Returns:
+            int: HTTP status to answer with
+        """
+        if self.should_fail():
+            return self.status_code
+
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return self.status_code
+            self.signals.append(payload)
+            self.accepted_at.setdefault(payload.get('signalID'), time.time())
+            return 200
+
+
+class _MathematricksHandler(_JSONHandler):
+    """Request handler of StubMathematricksServer"""
+
+    def do_POST(self):
+        self.stub.count_request()
+        payload = json.loads(self.read_body() or b'{}')
+        status = self.stub.accept(payload)
+        self.send_body(status, {'status': 'ok' if status == 200 else 'error'})
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from async_engine import AsyncSignalEngine
+from benchmarks import make_mailbox, stub_credentials
+from config import Config
+from history_cursor import HistoryCursor
+from mailbox_registry import Mailbox, MailboxRegistry
+from stub_servers import StubGmailServer, StubMathematricksServer
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    with StubGmailServer(make_mailbox(40)) as gmail_server, StubMathematricksServer() as api_server:
+        monkeypatch.setattr(Config, 'GMAIL_API_URL', gmail_server.url)
+        monkeypatch.setattr(Config, 'MATHEMATRICKS_API_URL', api_server.url)
+        monkeypatch.setattr(Config, 'WATCH_RENEW_ENABLED', False)
+        yield gmail_server, api_server
+
+
+async def catch_up(engine, history_id, ticks, cursor_holder=None):
+    """Process one notification, counting event loop ticks into ticks[0] while it runs"""
+    done = asyncio.Event()
+
+    async def tick():
+        while not done.is_set():
+            ticks[0] += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    await engine.start()
+    try:
+        if cursor_holder is not None:
+            cursor_holder.start()
+        await engine.process_notification({'historyId': history_id})
+    finally:
+        done.set()
+        await ticker
+        await engine.close()
+
+
+def test_forwards_every_signal_once_and_advances_cursor(servers, tmp_path):
+    gmail_server, api_server = servers
+    db_path = os.path.join(tmp_path, 'state.db')
+    engine = AsyncSignalEngine(stub_credentials(gmail_server, tmp_path), db_path)
+    engine.history_cursor.advance(1000)
+
+    asyncio.run(catch_up(engine, gmail_server.history_id, [0]))
+
+    signal_ids = [payload['signalID'] for payload in api_server.signals]
+    assert len(signal_ids) == 20
+    assert len(set(signal_ids)) == 20
+    assert HistoryCursor(engine.mailbox.cursor_name, db_path).get() == gmail_server.history_id
+    assert engine.signal_spool.entries(status='pending') == []
+
+
+def test_waits_for_cursor_held_elsewhere_without_blocking_the_loop(servers, tmp_path):
+    gmail_server, api_server = servers
+    db_path = os.path.join(tmp_path, 'state.db')
+    engine = AsyncSignalEngine(stub_credentials(gmail_server, tmp_path), db_path)
+    engine.history_cursor.advance(1000)
+
+    # A second cursor object flocks the sidecar file like another process would
+    other = HistoryCursor(engine.mailbox.cursor_name, db_path)
+    other.acquire()
+    ticks = [0]
+    ticks_while_held = []
+
+    def release():
+        ticks_while_held.append(ticks[0])
+        other.release()
+
+    holder = threading.Timer(0.3, release)
+    asyncio.run(catch_up(engine, gmail_server.history_id, ticks, cursor_holder=holder))
+
+    assert ticks_while_held[0] >= 10
+    assert len(api_server.signals) == 20
+    assert other.get() == gmail_server.history_id
+
+
+def test_rejects_more_than_one_mailbox(tmp_path):
+    registry = MailboxRegistry([
+        Mailbox('a@example.com', token_file=os.path.join(tmp_path, 'a.json')),
+        Mailbox('b@example.com', token_file=os.path.join(tmp_path, 'b.json')),
+    ])
+
+    with pytest.raises(RuntimeError, match='single mailbox'):
+        AsyncSignalEngine(db_path=os.path.join(tmp_path, 'state.db'), registry=registry)
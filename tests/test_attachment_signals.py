@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from attachment_signals import AttachmentSignalReader
+
+ORDERS = [{'ticker': f"T{index}", 'action': 'BUY', 'quantity': str(index)} for index in range(200)]
+
+
+def chunked(text, size):
+    return (text[start:start + size] for start in range(0, len(text), size))
+
+
+@pytest.mark.parametrize('newline', ['\n', '\r', '\r\n'])
+@pytest.mark.parametrize('chunk_size', [1, 2, 7, 4096])
+def test_csv_line_endings(newline, chunk_size):
+    text = newline.join(['ticker,action,quantity'] + [
+        f"{order['ticker']},{order['action']},{order['quantity']}" for order in ORDERS
+    ])
+
+    assert list(AttachmentSignalReader().csv_rows(chunked(text, chunk_size))) == ORDERS
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_csv_quoted_field_keeps_line_breaks(chunk_size):
+    text = 'ticker,note\r\nAAPL,"line 1\r\nline 2"\r\nMSFT,x\r\n'
+
+    assert list(AttachmentSignalReader().csv_rows(chunked(text, chunk_size))) == [
+        {'ticker': 'AAPL', 'note': 'line 1\r\nline 2'},
+        {'ticker': 'MSFT', 'note': 'x'},
+    ]
+
+
+@pytest.mark.parametrize('text', ['a' * 5000, 'ticker\r' + 'a' * 5000])
+def test_csv_line_over_limit_is_rejected(monkeypatch, text):
+    monkeypatch.setattr(AttachmentSignalReader, 'MAX_VALUE_CHARS', 1000)
+
+    with pytest.raises(ValueError, match='CSV line'):
+        list(AttachmentSignalReader().csv_rows(chunked(text, 100)))
+
+
+@pytest.mark.parametrize('key', AttachmentSignalReader.WRAPPER_KEYS)
+def test_json_wrapper_over_limit_is_streamed(monkeypatch, key):
+    monkeypatch.setattr(AttachmentSignalReader, 'MAX_VALUE_CHARS', 1000)
+    text = json.dumps({'meta': {'source': 'desk'}, key: ORDERS, 'count': len(ORDERS)}) + '\n{"ticker": "LAST"}'
+
+    assert list(AttachmentSignalReader().json_rows(chunked(text, 100))) == ORDERS + [{'ticker': 'LAST'}]
+
+
+def test_json_wrapper_in_array_over_limit_is_streamed(monkeypatch):
+    monkeypatch.setattr(AttachmentSignalReader, 'MAX_VALUE_CHARS', 1000)
+    text = json.dumps([{'orders': ORDERS}, {'ticker': 'LAST'}])
+
+    assert list(AttachmentSignalReader().json_rows(chunked(text, 100))) == ORDERS + [{'ticker': 'LAST'}]
+
+
+@pytest.mark.parametrize('value', [
+    {'note': 'x' * 5000},
+    {'orders': [{'note': 'x' * 5000}]},
+])
+def test_json_value_over_limit_is_rejected(monkeypatch, value):
+    monkeypatch.setattr(AttachmentSignalReader, 'MAX_VALUE_CHARS', 1000)
+
+    with pytest.raises(ValueError, match='over 1000 characters'):
+        list(AttachmentSignalReader().json_rows(chunked(json.dumps(value), 100)))
+
+
+@pytest.mark.parametrize('text', [
+    json.dumps(ORDERS),
+    '\n'.join(json.dumps(order) for order in ORDERS),
+    json.dumps({'signals': ORDERS}),
+])
+def test_json_layouts(text):
+    assert list(AttachmentSignalReader().json_rows(chunked(text, 7))) == ORDERS
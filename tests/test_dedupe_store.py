@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import dedupe_store
+from dedupe_store import DedupeStore
+from signal_spool import SignalSpool
+
+
+class Clock:
+    """Stand-in for the time module whose time() only moves when told to"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedupe_store, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return os.path.join(tmp_path, 'state.db')
+
+
+def make_payload(signal_id):
+    return {'strategy_name': 'test', 'signal_sent_EPOCH': 0, 'signalID': signal_id,
+            'passphrase': 'secret', 'signal': {'ticker': 'AAPL', 'action': 'BUY'}}
+
+
+def test_message_is_claimed_once_across_instances(db_path):
+    store = DedupeStore(db_path)
+
+    assert store.claim('msg-1') is True
+    assert store.claim('msg-1') is False
+    assert store.is_forwarded('msg-1')
+
+    # Another process shares the database but not the in-memory front
+    other = DedupeStore(db_path)
+    assert other.is_forwarded('msg-1')
+    assert other.claim('msg-1') is False
+    assert other.claim('msg-2') is True
+
+
+def test_same_content_is_claimed_once_within_content_ttl(db_path):
+    content_hash = DedupeStore.content_hash(['test', {'ticker': 'AAPL', 'action': 'BUY'}])
+
+    assert DedupeStore.content_hash(['test', {'action': 'BUY', 'ticker': 'AAPL'}]) == content_hash
+    assert DedupeStore(db_path, content_ttl=60).claim('msg-1', content_hash) is True
+    assert DedupeStore(db_path, content_ttl=60).claim('msg-2', content_hash) is False
+    assert DedupeStore(db_path, content_ttl=0).claim('msg-3', content_hash) is True
+
+
+def test_claim_and_spool_insert_commit_together(db_path):
+    store = DedupeStore(db_path)
+    spool = SignalSpool(db_path)
+
+    spool_id = store.claim('msg-1', record=lambda conn: spool.insert(conn, make_payload('msg-1')))
+
+    assert [entry['id'] for entry in spool.entries()] == [spool_id]
+    assert DedupeStore(db_path).is_forwarded('msg-1')
+
+    # A duplicate claim writes nothing
+    assert store.claim('msg-1', record=lambda conn: spool.insert(conn, make_payload('other'))) is False
+    assert [entry['signal_id'] for entry in spool.entries()] == ['msg-1']
+
+
+def test_failed_record_rolls_back_the_claim(db_path):
+    store = DedupeStore(db_path)
+    spool = SignalSpool(db_path)
+
+    def insert_then_fail(conn):
+        spool.insert(conn, make_payload('msg-1'))
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        store.claim('msg-1', record=insert_then_fail)
+
+    assert spool.entries() == []
+    assert not DedupeStore(db_path).is_forwarded('msg-1')
+    assert store.claim('msg-1') is True
+
+
+def test_claims_expire_after_their_ttl(db_path, clock):
+    content_hash = DedupeStore.content_hash(['test', {'ticker': 'AAPL'}])
+    store = DedupeStore(db_path, message_ttl=3600, content_ttl=60)
+
+    assert store.claim('msg-1', content_hash) is True
+
+    clock.now += 61
+    assert store.is_forwarded('msg-1')
+    assert store.claim('msg-2', content_hash) is True
+
+    clock.now += 3600
+    assert not store.is_forwarded('msg-1')
+    assert not DedupeStore(db_path).is_forwarded('msg-1')
+    assert store.claim('msg-1') is True
+
+
+def test_release_forgets_a_claim(db_path):
+    content_hash = DedupeStore.content_hash(['test', {'ticker': 'AAPL'}])
+    store = DedupeStore(db_path, content_ttl=60)
+    store.claim('msg-1', content_hash)
+
+    store.release('msg-1', content_hash)
+
+    assert not store.is_forwarded('msg-1')
+    assert store.claim('msg-1', content_hash) is True
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import history_cursor
+from history_cursor import HistoryCursor
+
+# Holds a cursor's catch-up rights in another process until stdin closes
+HOLDER = """
+import sys
+from history_cursor import HistoryCursor
+
+cursor = HistoryCursor('me', sys.argv[1])
+with cursor.hold():
+    print('held', flush=True)
+    sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return os.path.join(tmp_path, 'state.db')
+
+
+def test_advance_only_moves_forward(db_path):
+    cursor = HistoryCursor('me', db_path)
+
+    assert cursor.get() is None
+    assert cursor.advance(1000) is True
+    assert cursor.advance(999) is False
+    assert cursor.advance('1000') is False
+    assert cursor.advance(1001) is True
+    assert HistoryCursor('me', db_path).get() == 1001
+    assert HistoryCursor('other', db_path).get() is None
+
+
+def test_concurrent_advances_keep_the_highest(db_path):
+    cursors = [HistoryCursor('me', db_path) for _ in range(4)]
+    history_ids = list(range(1, 401))
+
+    def advance(cursor, start):
+        for history_id in history_ids[start::len(cursors)][::-1]:
+            cursor.advance(history_id)
+
+    threads = [threading.Thread(target=advance, args=(cursor, index)) for index, cursor in enumerate(cursors)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert HistoryCursor('me', db_path).get() == 400
+
+
+def test_hold_yields_the_cursor_and_excludes_other_threads(db_path):
+    cursor = HistoryCursor('me', db_path)
+    cursor.advance(1000)
+
+    with cursor.hold() as history_id:
+        assert history_id == 1000
+        results = []
+        thread = threading.Thread(target=lambda: results.append(cursor.acquire(blocking=False)))
+        thread.start()
+        thread.join()
+        assert results == [False]
+
+    assert cursor.acquire(blocking=False) is True
+    cursor.release()
+
+
+@pytest.mark.skipif(history_cursor.fcntl is None, reason='no flock on this platform')
+def test_hold_excludes_other_processes_until_released(db_path):
+    cursor = HistoryCursor('me', db_path)
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    holder = subprocess.Popen([sys.executable, '-c', HOLDER, db_path], cwd=repo,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+
+    try:
+        assert holder.stdout.readline().strip() == 'held'
+        assert cursor.acquire(blocking=False) is False
+        # Other cursors of the database are not affected
+        other = HistoryCursor('other', db_path)
+        assert other.acquire(blocking=False) is True
+        other.release()
+    finally:
+        holder.stdin.close()
+        holder.wait(timeout=10)
+
+    assert cursor.acquire(blocking=False) is True
+    cursor.release()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from benchmarks import make_mailbox, stub_credentials
+from config import Config
+from history_cursor import HistoryCursor
+from signal_pipeline import SignalPipeline
+from stub_servers import StubGmailServer, StubMathematricksServer
+
+
+# One Gmail request in five fails; seed 1 fails the first history page, seed 5
+# single messages of the window
+@pytest.fixture(params=[1, 5])
+def servers(request, monkeypatch):
+    with StubGmailServer(make_mailbox(40), error_rate=0.2, seed=request.param) as gmail_server, \
+            StubMathematricksServer() as api_server:
+        monkeypatch.setattr(Config, 'GMAIL_API_URL', gmail_server.url)
+        monkeypatch.setattr(Config, 'MATHEMATRICKS_API_URL', api_server.url)
+        monkeypatch.setattr(Config, 'WATCH_RENEW_ENABLED', False)
+        monkeypatch.setattr(Config, 'HISTORY_RETRY_ATTEMPTS', 20)
+        monkeypatch.setattr(Config, 'HISTORY_RETRY_BASE', 0.01)
+        monkeypatch.setattr(Config, 'HISTORY_RETRY_MAX', 0.05)
+        yield gmail_server, api_server
+
+
+def caught_up(gmail_server, api_server, db_path):
+    return len(api_server.signals) == 20 and HistoryCursor('me', db_path).get() == gmail_server.history_id
+
+
+def test_threaded_pipeline_retries_windows_until_every_signal_is_forwarded(servers, tmp_path):
+    gmail_server, api_server = servers
+    db_path = os.path.join(tmp_path, 'state.db')
+    pipeline = SignalPipeline(stub_credentials(gmail_server, tmp_path), db_path)
+    pipeline.history_cursor.advance(1000)
+
+    pipeline.start()
+    try:
+        pipeline.submit({'historyId': gmail_server.history_id})
+        deadline = time.monotonic() + 30
+        while not caught_up(gmail_server, api_server, db_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        pipeline.stop()
+
+    assert gmail_server.errors > 0
+    assert pipeline.stats.snapshot()['counters']['history_windows_retried'] > 0
+    assert sorted(signal['signalID'] for signal in api_server.signals) == [
+        f"msg{index:05d}" for index in range(0, 40, 2)
+    ]
+    assert HistoryCursor('me', db_path).get() == gmail_server.history_id
+
+
+def test_async_engine_retries_windows_until_every_signal_is_forwarded(servers, tmp_path):
+    pytest.importorskip('aiohttp')
+    from async_engine import AsyncSignalEngine
+
+    gmail_server, api_server = servers
+    db_path = os.path.join(tmp_path, 'state.db')
+    engine = AsyncSignalEngine(stub_credentials(gmail_server, tmp_path), db_path)
+    engine.history_cursor.advance(1000)
+
+    async def run():
+        await engine.start()
+        try:
+            engine.submit({'historyId': gmail_server.history_id})
+            deadline = time.monotonic() + 30
+            while not caught_up(gmail_server, api_server, db_path) and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            await engine.close()
+
+    asyncio.run(run())
+
+    assert gmail_server.errors > 0
+    assert engine.stats.snapshot()['counters']['history_windows_retried'] > 0
+    assert sorted(signal['signalID'] for signal in api_server.signals) == [
+        f"msg{index:05d}" for index in range(0, 40, 2)
+    ]
+    assert HistoryCursor('me', db_path).get() == gmail_server.history_id
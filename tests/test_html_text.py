@@ -0,0 +1,69 @@
+import pytest
+
+from html_text import html_to_text
+from signal_extractor import TextSignalParser
+
+
+@pytest.mark.parametrize('html, text', [
+    ('<p>Buy&nbsp;<b>AAPL</b> &amp; hold</p><p>now</p>', 'Buy AAPL & hold\nnow'),
+    ('<style>.c { color: red; }</style><script>var a = {};</script><div>Signal</div>', 'Signal'),
+    ('Line 1<br>Line 2<br/>Line 3', 'Line 1\nLine 2\nLine 3'),
+    ('<span>a</span>   \n  <span>b</span>', 'a b'),
+    ('<pre>Ticker: AAPL\nAction: BUY</pre>', 'Ticker: AAPL\nAction: BUY'),
+], ids=['inline and entities', 'skipped elements', 'line breaks', 'whitespace', 'pre'])
+def test_text_and_lines(html, text):
+    assert html_to_text(html) == (text, False)
+
+
+def test_two_cell_rows_become_fields():
+    html = ('<table><tr><td>Ticker:</td><td><b>AAPL</b></td></tr>'
+            '<tr><td>Action</td><td>BUY</td></tr>'
+            '<tr><td>A label far too long to be the name of a signal field</td><td>x</td></tr></table>')
+
+    assert html_to_text(html)[0] == ('Ticker: AAPL\nAction: BUY\n'
+                                     'A label far too long to be the name of a signal field x')
+
+
+def test_header_row_labels_every_following_row():
+    html = ('<table><tr><th>Ticker</th><th>Action</th><th>Qty</th></tr>'
+            '<tr><td>AAPL</td><td>BUY</td><td>100</td></tr></table>'
+            '<table><tr><th>Only</th><th>headers</th></tr></table>')
+
+    assert html_to_text(html)[0] == 'Ticker: AAPL\nAction: BUY\nQty: 100\nOnly headers'
+
+
+def test_nested_tables_and_breaks_inside_cells():
+    html = ('<table><tr><td>Order</td><td>'
+            '<table><tr><td>Ticker</td><td>MSFT</td></tr></table>'
+            '</td></tr><tr><td>Note</td><td>first<br>second</td></tr></table>')
+
+    assert html_to_text(html)[0] == 'Ticker: MSFT\nOrder\nNote: first second'
+
+
+def test_output_stops_at_max_chars():
+    html = '<p>Ticker: AAPL</p>' + '<p>filler text</p>' * 10000
+
+    text, truncated = html_to_text(html, max_chars=100, chunk_size=64)
+
+    assert truncated
+    assert len(text) <= 100
+    assert text.startswith('Ticker: AAPL\nfiller text')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_chunked_parse_matches_whole(chunk_size):
+    html = ('<div>Signal <b>alert</b></div><table><tr><td>Ticker</td><td>AAPL</td></tr>'
+            '<tr><td>Action</td><td>SELL</td></tr></table><p>Price:&#160;12.5</p>')
+
+    assert html_to_text(html, chunk_size=chunk_size) == html_to_text(html)
+
+
+def test_fields_reach_the_text_parser():
+    html = ('<html><head><style>td { padding: 0 }</style></head><body>'
+            '<table><tr><td>Ticker</td><td>AAPL</td></tr><tr><td>Action</td><td>BUY</td></tr></table>'
+            '</body></html>')
+
+    parsed = TextSignalParser().parse(html_to_text(html)[0])
+
+    assert parsed['ticker'] == 'AAPL'
+    assert parsed['action'] == 'BUY'
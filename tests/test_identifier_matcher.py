@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from identifier_matcher import IdentifierMatcher, get_matcher, parse_identifiers
+
+
+@pytest.fixture(params=['direct', 'automaton'])
+def search(request, monkeypatch):
+    """Build matchers that use one search strategy"""
+    if request.param == 'automaton':
+        monkeypatch.setattr(IdentifierMatcher, 'DIRECT_SEARCH_LIMIT', 0)
+    return request.param
+
+
+def find_by_str_find(identifiers, text):
+    """First occurrence of every identifier, ordered by offset"""
+    hits = [(identifier, text.find(identifier)) for identifier in identifiers]
+    return sorted([hit for hit in hits if hit[1] != -1], key=lambda hit: hit[1])
+
+
+def test_parse_identifiers():
+    assert parse_identifiers(' SIGNAL, ALERT ,,SIGNAL') == ('SIGNAL', 'ALERT')
+    assert parse_identifiers(['A', ' B ', '', 'A']) == ('A', 'B')
+    assert parse_identifiers(None) == ()
+
+
+def test_no_identifiers_is_an_error():
+    with pytest.raises(ValueError):
+        IdentifierMatcher(' , ')
+
+
+def test_overlapping_and_nested_identifiers(search):
+    matcher = IdentifierMatcher(['he', 'she', 'his', 'hers'])
+
+    hits = matcher.find('ushers and his')
+    assert hits[0] == ('she', 1)
+    assert sorted(hits[1:3]) == [('he', 2), ('hers', 2)]
+    assert hits[3] == ('his', 11)
+    assert matcher.matches('a hershey bar')
+    assert not matcher.matches('nothing to see, just h')
+    assert not matcher.matches('')
+
+
+def test_matches_str_find_on_random_text(search):
+    rng = random.Random(23)
+
+    for _ in range(300):
+        identifiers = parse_identifiers([''.join(rng.choice('ab') for _ in range(rng.randint(1, 4)))
+                                         for _ in range(rng.randint(1, 6))])
+        text = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 30)))
+        matcher = IdentifierMatcher(identifiers)
+
+        expected = find_by_str_find(identifiers, text)
+        # Identifiers found at the same offset may come in either order
+        assert sorted(matcher.find(text), key=lambda hit: (hit[1], hit[0])) == \
+            sorted(expected, key=lambda hit: (hit[1], hit[0])), (identifiers, text)
+        assert matcher.matches(text) == bool(expected)
+
+
+def test_ignore_case(search):
+    matcher = IdentifierMatcher(['TRADE ALERT', 'Signal'], ignore_case=True)
+
+    assert matcher.find('New trade alert: SIGNAL') == [('TRADE ALERT', 4), ('Signal', 17)]
+    assert not IdentifierMatcher(['Signal']).matches('SIGNAL')
+
+
+def test_get_matcher_shares_one_instance_per_identifier_set():
+    assert get_matcher('A, B', ignore_case=False) is get_matcher(['A', 'B'], ignore_case=False)
+    assert get_matcher('A, B', ignore_case=False) is not get_matcher('A, B', ignore_case=True)
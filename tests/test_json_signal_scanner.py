@@ -0,0 +1,89 @@
+import json
+import random
+
+import pytest
+
+from signal_extractor import JSONSignalScanner
+
+SIGNAL = '{"ticker": "AAPL", "action": "BUY"}'
+
+
+def find_by_decoding_every_span(scanner, content):
+    """Every signal a decode of any brace span would find"""
+    found = []
+    for start, char in enumerate(content):
+        if char != '{':
+            continue
+        for end in range(start + 1, len(content) + 1):
+            try:
+                data = json.loads(content[start:end])
+            except ValueError:
+                continue
+            if isinstance(data, dict) and scanner._find_signal(data) is not None:
+                found.append(scanner._find_signal(data))
+    return found
+
+
+class CountingDecoder(json.JSONDecoder):
+    """Records the offset of every raw_decode call"""
+
+    def __init__(self):
+        super().__init__()
+        self.starts = []
+
+    def raw_decode(self, s, idx=0):
+        self.starts.append(idx)
+        return super().raw_decode(s, idx)
+
+
+@pytest.mark.parametrize('content', [
+    'Signal: ' + SIGNAL,
+    '.c { color: red; } ' * 50 + SIGNAL,
+    '{"meta": {"id": 1}} ' + SIGNAL,
+    '{"payload": {"order": ' + SIGNAL + '}}',
+    '{ not json {"a": 1} ' + SIGNAL + ' }',
+    '{"text": "a } brace \\" and { more"} ' + SIGNAL,
+    '{"a":' * 2000 + SIGNAL,
+    '{"a":[' * 3000 + SIGNAL + ']}' * 3000,
+], ids=['plain', 'after css', 'after other object', 'nested', 'inside non-json',
+        'after braces in strings', 'after unclosed nesting', 'deeply nested'])
+def test_finds_signal(content):
+    assert JSONSignalScanner().find(content) == {'ticker': 'AAPL', 'action': 'BUY'}
+
+
+@pytest.mark.parametrize('content', [
+    '{"a":' * 2000,
+    '{"a":' * 2000 + '1' + '}' * 2000,
+    '[' * 5000 + '{"a": 1}',
+    '{' * 50000 + '}' * 50000,
+    '{"a":{x ' * 5000,
+], ids=['unclosed keys', 'nested keys', 'arrays', 'bare braces', 'unclosed mixed'])
+def test_deep_nesting_is_not_an_error(content):
+    assert JSONSignalScanner().find(content) is None
+
+
+def test_matches_decoding_every_span_on_random_text():
+    scanner = JSONSignalScanner()
+    pieces = ['{', '}', '[', ']', ',', ':', ' ', 'x', '\n', '"k": 1', '{"a": ', SIGNAL, '{"s": "\\"}{["}']
+    rng = random.Random(20241018)
+
+    for _ in range(3000):
+        content = ''.join(rng.choice(pieces) for _ in range(rng.randint(1, 12)))
+        found = find_by_decoding_every_span(scanner, content)
+        result = scanner.find(content)
+        assert (result is None) == (not found), content
+        assert result is None or result in found, content
+
+
+@pytest.mark.parametrize('content', [
+    '{"a":{x ' * 2000,
+    '{"a":' * 2000 + '1' + '}' * 2000,
+    '{"a": [' * 1000 + 'x' + ']}' * 1000,
+    '{"k": 1} ' * 2000,
+], ids=['unclosed mixed', 'nested keys', 'nested arrays', 'small objects'])
+def test_no_offset_is_decoded_twice(content):
+    scanner = JSONSignalScanner()
+    scanner._decoder = CountingDecoder()
+
+    assert scanner.find(content) is None
+    assert len(scanner._decoder.starts) == len(set(scanner._decoder.starts))
@@ -0,0 +1,90 @@
+import json
+import os
+
+import pytest
+
+from config import Config
+from mailbox_registry import Mailbox, MailboxRegistry
+from signal_pipeline import SignalPipeline
+
+
+def write_mailboxes(tmp_path, entries):
+    path = os.path.join(tmp_path, 'mailboxes.json')
+    with open(path, 'w') as f:
+        json.dump(entries, f)
+    return path
+
+
+def test_file_mailboxes_are_routed_by_address(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'STRATEGY_NAME', 'Default_Strategy')
+    monkeypatch.setattr(Config, 'MAILBOXES_FILE', write_mailboxes(tmp_path, [
+        {'email': 'Desk-A@Example.com', 'token_file': 'a.json', 'strategy_name': 'Desk_A',
+         'signal_identifier': ['ALERT', 'SIGNAL'], 'max_workers': 2},
+        {'email': 'desk-b@example.com', 'token_file': 'b.json'},
+    ]))
+
+    registry = MailboxRegistry.from_config()
+    desk_a, desk_b = registry
+
+    assert len(registry) == 2
+    assert registry.default is desk_a
+    assert registry.get(' DESK-A@example.com ') is desk_a
+    assert registry.get('desk-b@example.com') is desk_b
+    assert registry.get('desk-c@example.com') is None
+    assert registry.get(None) is None
+    assert (desk_a.cursor_name, desk_a.strategy_name, desk_a.max_workers) == ('desk-a@example.com', 'Desk_A', 2)
+    assert desk_b.strategy_name == 'Default_Strategy'
+
+
+def test_single_environment_mailbox_takes_every_notification(monkeypatch):
+    monkeypatch.setattr(Config, 'MAILBOXES_FILE', None)
+
+    registry = MailboxRegistry.from_config()
+
+    assert len(registry) == 1
+    assert registry.default.cursor_name == 'me'
+    assert registry.get('anyone@example.com') is registry.default
+    assert registry.get(None) is registry.default
+
+
+@pytest.mark.parametrize('entries, error', [
+    ([], 'non-empty JSON list'),
+    ([{'email': 'a@example.com'}], 'needs an email and a token_file'),
+    ([{'email': 'a@example.com', 'token_file': 'a.json', 'colour': 'red'}], 'Unknown mailbox settings'),
+    ([{'email': 'a@example.com', 'token_file': 'a.json'},
+      {'email': 'A@example.com', 'token_file': 'b.json'}], 'configured twice'),
+])
+def test_invalid_mailbox_files_are_rejected(tmp_path, entries, error):
+    with pytest.raises(ValueError, match=error):
+        MailboxRegistry.from_file(write_mailboxes(tmp_path, entries))
+
+
+def test_several_mailboxes_all_need_an_address():
+    with pytest.raises(ValueError, match='needs an email address'):
+        MailboxRegistry([Mailbox('a@example.com'), Mailbox()])
+
+
+def test_pipeline_keeps_state_per_mailbox_and_parks_over_its_worker_share(tmp_path):
+    registry = MailboxRegistry([Mailbox('a@example.com', 'a.json', max_workers=1),
+                                Mailbox('b@example.com', 'b.json', strategy_name='Desk_B')])
+    pipeline = SignalPipeline(db_path=os.path.join(tmp_path, 'state.db'), registry=registry,
+                              auth_factory=lambda mailbox: mailbox.token_file)
+
+    desk_a = pipeline.route('A@example.com')
+    desk_b = pipeline.route('b@example.com')
+
+    assert pipeline.route('c@example.com') is None
+    assert pipeline.route('a@example.com') is desk_a
+    assert (desk_a.gmail_auth, desk_b.gmail_auth) == ('a.json', 'b.json')
+    assert desk_a.history_cursor.name != desk_b.history_cursor.name
+    assert desk_b.signal_extractor.strategy_name == 'Desk_B'
+
+    # One worker may catch up desk A; later notifications are merged while it runs
+    assert desk_a.acquire({'historyId': 10, 'received_at': 1.0})
+    assert not desk_a.acquire({'historyId': 12, 'received_at': 2.0})
+    assert not desk_a.acquire({'historyId': 11, 'received_at': 3.0})
+    assert desk_b.acquire({'historyId': 5})
+
+    parked = desk_a.release()
+    assert (parked['historyId'], parked['received_at']) == (12, 2.0)
+    assert desk_a.release() is None
@@ -0,0 +1,143 @@
+import json
+import os
+import random
+from types import SimpleNamespace
+
+import pytest
+
+import routing_rules
+from routing_rules import RoutingRule, RoutingRules, RuleSet
+
+RULES = [
+    {'name': 'desk a', 'sender': ['alerts@desk-a.com', '@desk-a.net'], 'strategy_name': 'DeskA'},
+    {'name': 'crypto', 'subject': '^crypto', 'strategy_name': 'Crypto'},
+    {'name': 'desk a msft', 'sender': 'alerts@desk-a.com', 'ticker': 'MSFT', 'strategy_name': 'Unreachable'},
+    {'name': 'msft', 'ticker': ['msft', 'AAPL'], 'api_url': 'http://equities.example/api'},
+    {'name': 'mailbox b', 'mailbox': 'B@example.com', 'strategy_name': 'MailboxB'},
+]
+
+
+class Clock:
+    """Stand-in for the time module whose monotonic() only moves when told to"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def write_rules(path, rules, mtime):
+    with open(path, 'w') as f:
+        json.dump({'rules': rules}, f)
+    os.utime(path, (mtime, mtime))
+
+
+def linear_match(rule_set, sender, subject, ticker, mailbox):
+    """First matching rule found by checking every rule in order"""
+    sender = sender.lower()
+    domain = '@' + sender.rpartition('@')[2]
+    for rule in rule_set.rules:
+        if rule.matches(sender, domain, subject, ticker.upper() if ticker else None, mailbox):
+            return rule
+    return None
+
+
+@pytest.mark.parametrize('sender, subject, ticker, mailbox, expected', [
+    ('Alerts <ALERTS@desk-a.com>', 'x', 'MSFT', None, 'desk a'),
+    ('bob@desk-a.net', 'x', None, None, 'desk a'),
+    ('bob@desk-a.com', 'Crypto buy', 'MSFT', None, 'crypto'),
+    ('bob@other.com', 'x', ' msft ', None, 'msft'),
+    ('bob@other.com', 'x', 'TSLA', 'b@example.com', 'mailbox b'),
+    ('bob@other.com', 'x', 'TSLA', 'c@example.com', None),
+])
+def test_first_matching_rule_in_file_order(sender, subject, ticker, mailbox, expected):
+    rule = RuleSet(RoutingRule(**rule) for rule in RULES).match(sender, subject, ticker, mailbox)
+
+    assert (rule.name if rule else None) == expected
+
+
+def test_indexes_match_a_linear_scan():
+    rng = random.Random(22)
+    senders = ['a@x.com', 'b@x.com', '@x.com', 'c@y.com', '@y.com']
+    tickers = ['AAPL', 'MSFT', 'TSLA']
+    mailboxes = ['m1@z.com', 'm2@z.com']
+
+    for _ in range(200):
+        rules = []
+        for position in range(rng.randint(0, 8)):
+            rule = {'strategy_name': f"S{position}"}
+            if rng.random() < 0.5:
+                rule['sender'] = rng.sample(senders, rng.randint(1, 2))
+            if rng.random() < 0.5:
+                rule['ticker'] = rng.sample(tickers, rng.randint(1, 2))
+            if rng.random() < 0.3:
+                rule['mailbox'] = rng.choice(mailboxes)
+            if rng.random() < 0.3:
+                rule['subject'] = rng.choice(['^buy', 'sell'])
+            rules.append(RoutingRule(**rule))
+        rule_set = RuleSet(rules)
+
+        for _ in range(20):
+            message = (rng.choice(['a@x.com', 'b@x.com', 'd@x.com', 'c@y.com', 'e@w.com']),
+                       rng.choice(['buy now', 'sell', 'hold']),
+                       rng.choice(tickers + [None]),
+                       rng.choice(mailboxes + [None]))
+            assert rule_set.match(*message) is linear_match(rule_set, *message)
+
+
+@pytest.mark.parametrize('rules, error', [
+    ([{'sender': 'a@x.com'}], 'needs a strategy_name or an api_url'),
+    ([{'strategy_name': 'S', 'colour': 'red'}], 'Unknown routing rule keys'),
+    ([{'subject': '(', 'strategy_name': 'S'}], 'Invalid subject pattern'),
+    ([{'sender': 1, 'strategy_name': 'S'}], 'must be strings'),
+    ({'rules': 'none'}, 'must contain a list'),
+])
+def test_invalid_rule_files_are_rejected(tmp_path, rules, error):
+    path = os.path.join(tmp_path, 'rules.json')
+    with open(path, 'w') as f:
+        json.dump(rules, f)
+
+    with pytest.raises(ValueError, match=error):
+        RuleSet.from_file(path)
+
+
+def test_changed_file_is_reloaded_and_broken_file_keeps_old_rules(monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(routing_rules, 'time', clock)
+    path = os.path.join(tmp_path, 'rules.json')
+    write_rules(path, [{'ticker': 'AAPL', 'strategy_name': 'Old'}], mtime=1000)
+    rules = RoutingRules(path, reload_interval=5)
+
+    write_rules(path, [{'ticker': 'AAPL', 'strategy_name': 'New'}], mtime=2000)
+    assert rules.route(ticker='AAPL').strategy_name == 'Old'
+
+    # Picked up once the reload interval has passed
+    clock.now += 5
+    assert rules.route(ticker='AAPL').strategy_name == 'New'
+
+    with open(path, 'w') as f:
+        f.write('{"rules": [')
+    os.utime(path, (3000, 3000))
+    clock.now += 5
+    assert rules.route(ticker='AAPL').strategy_name == 'New'
+
+    write_rules(path, [{'ticker': 'AAPL', 'strategy_name': 'Fixed'}], mtime=4000)
+    clock.now += 5
+    assert rules.route(ticker='AAPL').strategy_name == 'Fixed'
+
+
+def test_apply_sets_strategy_and_returns_endpoint(tmp_path):
+    path = os.path.join(tmp_path, 'rules.json')
+    write_rules(path, RULES, mtime=1000)
+    parsed = SimpleNamespace(headers={'From': 'bob@other.com'}, subject='Signal')
+    payload = {'strategy_name': 'Default', 'signal': {'symbol': 'AAPL'}}
+
+    rule = RoutingRules(path, reload_interval=0).apply(payload, parsed)
+
+    assert rule.api_url == 'http://equities.example/api'
+    assert payload['strategy_name'] == 'Default'
+
+    payload = {'strategy_name': 'Default', 'signal': {'ticker': 'TSLA'}}
+    RoutingRules(path, reload_interval=0).apply(payload, parsed, mailbox='b@example.com')
+    assert payload['strategy_name'] == 'MailboxB'
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from api_forwarder import APIForwarder
+from config import Config
+from dedupe_store import DedupeStore
+from forward_ledger import ForwardLedger
+from signal_spool import SignalSpool, SpoolDrainer
+from stub_servers import StubMathematricksServer
+
+
+def make_payload(signal_id):
+    return {'strategy_name': 'test', 'signal_sent_EPOCH': 0, 'signalID': signal_id,
+            'passphrase': 'secret', 'signal': {'ticker': signal_id, 'action': 'BUY'}}
+
+
+@pytest.fixture
+def db_path(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'API_MAX_RETRIES', 0)
+    return os.path.join(tmp_path, 'state.db')
+
+
+def test_drainer_dead_letters_rejected_signal_and_delivers_the_rest(db_path):
+    with StubMathematricksServer(fail_first=1, status_code=400) as server:
+        spool = SignalSpool(db_path)
+        for signal_id in ['rejected', 'second', 'third']:
+            spool.add(make_payload(signal_id), api_url=server.url)
+
+        assert SpoolDrainer(spool, APIForwarder()).drain() == 2
+
+    assert [signal['signalID'] for signal in server.signals] == ['second', 'third']
+    assert [entry['signal_id'] for entry in spool.entries(SignalSpool.DEAD)] == ['rejected']
+    assert spool.entries(SignalSpool.PENDING) == []
+
+
+def test_drainer_keeps_retryable_failure_at_the_head(db_path):
+    with StubMathematricksServer(fail_first=1, status_code=503) as server:
+        spool = SignalSpool(db_path)
+        for signal_id in ['failed', 'second']:
+            spool.add(make_payload(signal_id), api_url=server.url)
+
+        assert SpoolDrainer(spool, APIForwarder()).drain() == 0
+
+    assert server.signals == []
+    assert [entry['signal_id'] for entry in spool.entries(SignalSpool.PENDING)] == ['failed', 'second']
+
+
+@pytest.mark.parametrize('status_code, status', [(400, SignalSpool.DEAD), (429, SignalSpool.PENDING)])
+def test_direct_send_dead_letters_only_permanent_failures(db_path, status_code, status):
+    spool = SignalSpool(db_path)
+    forwarder = APIForwarder()
+    ledger = ForwardLedger(DedupeStore(db_path), spool, SpoolDrainer(spool, forwarder), forwarder.max_send_time())
+
+    with StubMathematricksServer(fail_first=1, status_code=status_code) as server:
+        payload = make_payload('signal')
+        spool_id = ledger.claim(payload, 'message')
+        success, response = forwarder.send_signal(payload, api_url=server.url)
+        ledger.finish(spool_id, payload, success, response)
+
+    assert response['retryable'] == (status_code == 429)
+    assert [entry['signal_id'] for entry in spool.entries(status)] == ['signal']
+
+
+def test_invalid_payload_is_not_retryable():
+    success, response = APIForwarder().send_signal({'signalID': 'x'})
+
+    assert not success
+    assert response['retryable'] is False
@@ -0,0 +1,76 @@
+import os
+import threading
+
+from api_forwarder import APIForwarder
+from config import Config
+from main import manage_spool
+from signal_spool import SignalSpool, SpoolDrainer
+from stub_servers import StubMathematricksServer
+
+
+def make_payload(signal_id):
+    return {'strategy_name': 'test', 'signal_sent_EPOCH': 0, 'signalID': signal_id,
+            'passphrase': 'secret', 'signal': {'ticker': 'AAPL', 'action': 'BUY'}}
+
+
+class DrainerForwarder:
+    """Forwarder of a drainer that must not get to send anything"""
+
+    def send_signal(self, payload, api_url=None):
+        return True, {}
+
+
+def test_replay_sends_to_routed_endpoint_while_holding_drain_lock(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'STATE_DB_PATH', os.path.join(tmp_path, 'state.db'))
+
+    with StubMathematricksServer() as default_server, StubMathematricksServer() as routed_server:
+        monkeypatch.setattr(Config, 'MATHEMATRICKS_API_URL', default_server.url)
+        spool = SignalSpool()
+        spool.add(make_payload('default-1'))
+        spool.add(make_payload('routed-1'), api_url=routed_server.url)
+
+        # A running server's drainer tries a pass before every replayed send
+        drainer = SpoolDrainer(SignalSpool(), DrainerForwarder())
+        passes = []
+        send_signal = APIForwarder.send_signal
+
+        def try_a_pass_then_send(self, *args, **kwargs):
+            thread = threading.Thread(target=lambda: passes.append(drainer.drain()))
+            thread.start()
+            thread.join()
+            return send_signal(self, *args, **kwargs)
+
+        monkeypatch.setattr(APIForwarder, 'send_signal', try_a_pass_then_send)
+        manage_spool('replay')
+
+    assert [signal['signalID'] for signal in default_server.signals] == ['default-1']
+    assert [signal['signalID'] for signal in routed_server.signals] == ['routed-1']
+    assert passes == [0, 0]
+    assert spool.entries(SignalSpool.PENDING) == []
+
+
+def test_replay_skips_leased_and_dead_entries_unless_asked(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, 'STATE_DB_PATH', os.path.join(tmp_path, 'state.db'))
+
+    with StubMathematricksServer() as server:
+        monkeypatch.setattr(Config, 'MATHEMATRICKS_API_URL', server.url)
+        spool = SignalSpool()
+        spool.add(make_payload('pending'))
+        leased = spool.add(make_payload('in-flight'), lease=60)
+        dead = spool.add(make_payload('dead'))
+        spool.dead_letter(dead, 'rejected')
+        backing_off = spool.add(make_payload('backing-off'), lease=60)
+        spool.mark_failed(backing_off, 'timed out')
+
+        manage_spool('replay')
+        assert [signal['signalID'] for signal in server.signals] == ['pending', 'backing-off']
+
+        manage_spool('replay', status=SignalSpool.DEAD)
+        assert server.signals[-1]['signalID'] == 'dead'
+
+        manage_spool('replay', entry_ids=[leased])
+        assert server.signals[-1]['signalID'] == 'in-flight'
+
+    assert len(server.signals) == 4
+    assert spool.entries(SignalSpool.PENDING) == []
+    assert spool.entries(SignalSpool.DEAD) == []
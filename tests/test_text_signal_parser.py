@@ -0,0 +1,78 @@
+import random
+import re
+
+import pytest
+
+from signal_extractor import DEFAULT_SIGNAL_FIELDS, TextSignalParser
+
+
+def search_each_field(fields, content):
+    """The parser before the fields were combined: one re.search per field"""
+    signal_data = {}
+    for field, pattern in fields.items():
+        match = re.search(pattern, content, re.IGNORECASE)
+        if match:
+            signal_data[field] = match.group(1).strip()
+    return signal_data
+
+
+SAMPLES = [
+    "SIGNAL\nTicker: AAPL\nAction: BUY\nPrice: $150.25\nQuantity: 100\nStop Loss: 145\nTake Profit: 160\nType: LIMIT",
+    "SIGNAL symbol TSLA side sell qty 5 sl 190 tp 230 order type market",
+    "Order type: target 150",
+    "Action: size 100 shares 20",
+    "entry price: 101.5 price 99",
+    "stock: msft stop-loss 300 take-profit 350 target 400",
+    "direction long ticker: qqq size: 7",
+    "nothing to see here",
+    "",
+    "<td>Ticker</td><td>: NVDA</td><td>Side</td><td>: Buy</td>",
+    "SL: 1.5\nTP: 2.5\nsize 3 sl 4",
+]
+
+TOKENS = [
+    'ticker', 'Ticker:', 'symbol', 'stock', 'action', 'side', 'direction', 'price', 'entry',
+    'quantity', 'qty', 'shares', 'size', 'stop loss', 'stop-loss', 'sl', 'take profit', 'tp',
+    'target', 'type', 'order type', 'order-type', 'AAPL', 'buy', 'SELL', '$12.5', '100', '7',
+    ':', ' ', '  ', '\n', '-', 'x', 'ST', 'stops',
+]
+
+
+@pytest.mark.parametrize('content', SAMPLES)
+def test_default_fields_match_separate_searches(content):
+    assert TextSignalParser().parse(content) == search_each_field(DEFAULT_SIGNAL_FIELDS, content)
+
+
+def test_default_fields_match_separate_searches_on_random_text():
+    parser = TextSignalParser()
+    rng = random.Random(20241018)
+
+    for _ in range(3000):
+        content = ''.join(rng.choice(TOKENS) + rng.choice(['', ' ', ': ']) for _ in range(rng.randint(1, 25)))
+        assert parser.parse(content) == search_each_field(DEFAULT_SIGNAL_FIELDS, content), content
+
+
+def test_overlapping_fields_are_all_found():
+    # 'target 150' sits inside the value of the type field
+    assert TextSignalParser().parse("Order type: target 150") == {'take_profit': '150', 'type': 'target'}
+
+
+@pytest.mark.parametrize('fields, content', [
+    # Optional leading group: must not be skipped when only 'Loss' is present
+    ({'stop_loss': r'(?:Stop )?Loss[\s:]+(\d+)', 'ticker': r'ticker[\s:]+(\w+)'}, "Loss: 5 ticker: X"),
+    # Backreference: group numbers shift inside a combined pattern
+    ({'pair': r'(\w)\1', 'ticker': r'ticker[\s:]+(\w+)'}, "ticker: AAPL"),
+    # Named group, which could clash with another field's
+    ({'side': r'(?P<side>buy|sell)', 'ticker': r'ticker[\s:]+(\w+)'}, "sell ticker: X"),
+    # Prefixes that can start at the same position
+    ({'short': r'tick[\s:]+(\w+)', 'long': r'ticker[\s:]+(\w+)'}, "tick: A ticker: B"),
+    # Inline flags are only valid at the start of a whole pattern
+    ({'ticker': r'(?x) ticker [\s:]+ (\w+)', 'side': r'side[\s:]+(\w+)'}, "ticker: A side: B"),
+])
+def test_patterns_the_combiner_cannot_vouch_for(fields, content):
+    assert TextSignalParser(fields).parse(content) == search_each_field(fields, content)
+
+
+def test_pattern_without_group_is_rejected():
+    with pytest.raises(ValueError):
+        TextSignalParser({'ticker': r'ticker:\s+\w+'})
@@ -0,0 +1,233 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from state_store import connect_state_db
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; only one process renews there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class WatchRenewer:
+    """
+    Keeps the Gmail push watch registered
+
+    Gmail stops sending push notifications when a watch expires (after
+    about 7 days). The expiration returned by users.watch is stored in the
+    state database, and a background thread renews the watch
+    Config.WATCH_RENEW_BEFORE_HOURS before it runs out, retrying failures
+    with jittered exponential backoff. Only one process renews at a time.
+    """
+
+    def __init__(self, gmail_auth=None, topic_name=None, db_path=None, stats=None, mailbox=None):
+        """
+        Args:
+            gmail_auth: CredentialsManager providing the Gmail service (only
+                needed to renew; recording a watch works without it)
+            topic_name: Pub/Sub topic (default: Config.PUBSUB_TOPIC_NAME)
+            db_path: State database path (default: Config.STATE_DB_PATH)
+            stats: Optional PipelineStats for renewal counters
+            mailbox: Address of the watched account when several mailboxes
+                share the topic (None for the single default mailbox)
+        """
+        self.gmail_auth = gmail_auth
+        self.topic_name = topic_name or Config.PUBSUB_TOPIC_NAME
+        self.mailbox = mailbox
+
+        # Watches of several mailboxes on one topic are stored under "topic mailbox"
+        self._key = f"{self.topic_name} {mailbox}" if mailbox and self.topic_name else self.topic_name
+        self.db_path = db_path or Config.STATE_DB_PATH
+        self.stats = stats
+        self.renew_before = Config.WATCH_RENEW_BEFORE_HOURS * 3600
+        self.failures = 0
+        self.last_error = None
+        self._conn = connect_state_db(self.db_path)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS gmail_watch ('
+                'topic TEXT PRIMARY KEY, '
+                'history_id INTEGER, '
+                'expiration REAL NOT NULL, '
+                'renewed_at REAL NOT NULL)'
+            )
+
+    def expiration(self):
+        """
+        Get when the current watch expires
+
+        Returns:
+            float: Expiry as a Unix timestamp, or None if no watch was recorded
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT expiration FROM gmail_watch WHERE topic = ?', (self._key,)
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def record(self, watch_response):
+        """
+        Store the result of a users.watch call
+
+        Args:
+            watch_response: Response with 'historyId' and 'expiration' (epoch milliseconds)
+        """
+        expiration = int(watch_response['expiration']) / 1000
+
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO gmail_watch (topic, history_id, expiration, renewed_at) '
+                'VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(topic) DO UPDATE SET history_id = excluded.history_id, '
+                'expiration = excluded.expiration, renewed_at = excluded.renewed_at',
+                (self._key, int(watch_response.get('historyId', 0)), expiration, time.time())
+            )
+
+    def seconds_until_renewal(self):
+        """
+        Seconds until the watch should be renewed
+
+        Returns:
+            float: Delay (0 if no watch is recorded or it is due now)
+        """
+        expiration = self.expiration()
+        if expiration is None:
+            return 0.0
+        return max(0.0, expiration - self.renew_before - time.time())
+
+    def forget(self):
+        """Drop the recorded watch (after push notifications were stopped)"""
+        with self._lock:
+            self._conn.execute('DELETE FROM gmail_watch WHERE topic = ?', (self._key,))
+
+    def renew(self):
+        """
+        Register the watch again and record its new expiration
+
+        Returns:
+            dict: users.watch response
+        """
+        label_id = Config.HISTORY_LABEL_ID
+        request_body = {
+            'labelIds': [label_id] if label_id else [],
+            'topicName': self.topic_name
+        }
+
+        watch_response = self.gmail_auth.get_service().users().watch(
+            userId='me',
+            body=request_body
+        ).execute()
+
+        self.record(watch_response)
+        logger.info("Gmail watch of %s renewed, expires %s", self.mailbox or 'me',
+                    datetime.fromtimestamp(int(watch_response['expiration']) / 1000).isoformat(timespec='seconds'))
+        return watch_response
+
+    def renew_if_due(self):
+        """
+        Renew the watch unless it is not due or another process is renewing it
+
+        Returns:
+            bool: True if this call renewed the watch
+        """
+        with self._renew_lock() as acquired:
+            # Re-check under the lock: another process may have just renewed
+            if not acquired or self.seconds_until_renewal() > 0:
+                return False
+
+            self.renew()
+            return True
+
+    def start(self):
+        """Start the renewal thread (safe to call more than once)"""
+        with self._lock:
+            if self._thread:
+                return
+
+            self._thread = threading.Thread(target=self._run, name='watch-renewer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the renewal thread"""
+        self._stop.set()
+
+    @property
+    def healthy(self):
+        """False once a renewal attempt has failed, until one succeeds"""
+        return self.failures == 0
+
+    def status(self):
+        """
+        Get the watch state for health checks
+
+        Returns:
+            dict: healthy flag, expiry, failure count and last error
+        """
+        expiration = self.expiration()
+        return {
+            'healthy': self.healthy,
+            'topic': self.topic_name,
+            'mailbox': self.mailbox,
+            'expiration': datetime.fromtimestamp(expiration).isoformat(timespec='seconds') if expiration else None,
+            'expired': expiration is not None and expiration <= time.time(),
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+    @contextmanager
+    def _renew_lock(self):
+        """Try to take the cross-process renewal lock; yields whether it was taken"""
+        if fcntl is None:
+            yield True
+            return
+
+        suffix = f".{self.mailbox}" if self.mailbox else ''
+        with open(f"{self.db_path}.watch{suffix}.lock", 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _run(self):
+        """Renewal loop: sleep until due, renew, back off on failure"""
+        delay = self.seconds_until_renewal()
+
+        while not self._stop.wait(delay):
+            try:
+                if self.renew_if_due():
+                    self._increment('watch_renewed')
+                    delay = self.seconds_until_renewal()
+                else:
+                    # Not due, or another process holds the lock and is renewing
+                    delay = self.seconds_until_renewal() or Config.WATCH_RETRY_BASE
+                self.failures = 0
+                self.last_error = None
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                self._increment('watch_renewal_failed')
+                logger.error("Error renewing Gmail watch (attempt %d): %s", self.failures, e)
+                ceiling = min(Config.WATCH_RETRY_MAX, Config.WATCH_RETRY_BASE * (2 ** (self.failures - 1)))
+                delay = random.uniform(ceiling / 2, ceiling)
+
+    def _increment(self, name):
+        """Increment a stats counter if stats are attached"""
+        if self.stats is not None:
+            self.stats.increment(name)
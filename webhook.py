@@ -1,24 +1,51 @@
 import json
 import base64
-from flask import Flask, request, jsonify
-from gmail_auth import GmailAuthenticator
-from email_processor import EmailProcessor
-from signal_extractor import SignalExtractor
-from api_forwarder import APIForwarder
+import logging
+import time
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
+from signal_pipeline import SignalPipeline
+from metrics import CONTENT_TYPE, render_metrics
+from structured_logging import dropped_records, log_context, setup_logging
 from config import Config
 
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-# Initialize components
-gmail_auth = GmailAuthenticator()
-signal_extractor = SignalExtractor()
-api_forwarder = APIForwarder()
+routes = Blueprint('webhook', __name__)
 
-# Global state to track history ID
-last_history_id = None
 
+def create_app(pipeline=None, start=True):
+    """
+    Create the webhook Flask app with its own pipeline state
+
+    Every server process calls this once, so each worker gets its own Gmail
+    client, forwarder, state connections and background threads.
+
+    Args:
+        pipeline: SignalPipeline to serve (default: a new one)
+        start: Start the pipeline's background threads
+
+    Returns:
+        Flask: WSGI application
+    """
+    # Every worker process needs its own log writer thread
+    setup_logging()
+
+    app = Flask(__name__)
+    app.extensions['signal_pipeline'] = pipeline or SignalPipeline()
+    app.register_blueprint(routes)
+
+    if start:
+        app.extensions['signal_pipeline'].start()
+
+    return app
 
-@app.route('/webhook', methods=['POST'])
+
+def get_pipeline():
+    """SignalPipeline of the app handling the current request"""
+    return current_app.extensions['signal_pipeline']
+
+
+@routes.route('/webhook', methods=['POST'])
 def webhook():
     """
     Handle incoming Gmail push notifications from Cloud Pub/Sub
@@ -31,9 +58,10 @@ def webhook():
             "publishTime": "..."
         }
     }
-    """
-    global last_history_id
 
+    The notification is only decoded and queued here; the worker pool
+    fetches and forwards the messages so Pub/Sub gets an immediate ack.
+    """
     try:
         # Parse Pub/Sub message
         envelope = request.get_json()
@@ -53,102 +81,72 @@ def webhook():
         else:
             notification = {}
 
-        print(f"Received notification: {notification}")
+        notification['received_at'] = time.perf_counter()
+        notification['pubsub_message_id'] = pubsub_message.get('messageId')
+        pipeline = get_pipeline()
+        pipeline.stats.increment('notifications_received')
 
-        # Get Gmail service
-        gmail_service = gmail_auth.get_service()
-        email_processor = EmailProcessor(gmail_service)
+        with log_context(pubsub_message_id=notification['pubsub_message_id'],
+                         history_id=notification.get('historyId')):
+            logger.info("Received notification for %s", notification.get('emailAddress'))
 
-        # Get email address from notification
-        email_address = notification.get('emailAddress', 'me')
-        history_id = notification.get('historyId')
+            if not notification.get('historyId'):
+                return jsonify({'status': 'ignored'}), 200
 
-        # Process new messages
-        if history_id:
-            if last_history_id:
-                # Get history since last notification
-                history = email_processor.get_history(last_history_id)
+            # Queue the notification for the worker pool
+            if not pipeline.submit(notification):
+                # Let Pub/Sub redeliver once the workers have caught up
+                logger.warning("Work queue full, rejecting notification")
+                return jsonify({'error': 'Work queue full'}), 503
 
-                for history_record in history:
-                    if 'messagesAdded' in history_record:
-                        for message_info in history_record['messagesAdded']:
-                            message_id = message_info['message']['id']
-                            process_message(message_id, email_processor)
-            else:
-                # First notification - just update history ID
-                print(f"Initialized with history ID: {history_id}")
-
-            last_history_id = history_id
-
-        return jsonify({'status': 'success'}), 200
+        return jsonify({'status': 'queued', 'queue_depth': pipeline.work_queue.depth()}), 200
 
     except Exception as e:
-        print(f"Error processing webhook: {str(e)}")
+        logger.exception("Error processing webhook: %s", e)
         return jsonify({'error': str(e)}), 500
 
 
-def process_message(message_id, email_processor):
-    """
-    Process a single email message
-
-    Args:
-        message_id: Gmail message ID
-        email_processor: EmailProcessor instance
-    """
-    try:
-        print(f"Processing message: {message_id}")
-
-        # Fetch the message
-        message = email_processor.get_message(message_id)
-
-        if not message:
-            print(f"Could not fetch message {message_id}")
-            return
-
-        # Check if it's a signal email
-        if not email_processor.is_signal_email(message):
-            print(f"Message {message_id} is not a signal email")
-            return
-
-        print(f"Signal email detected: {message_id}")
-
-        # Get message details
-        headers = email_processor.get_message_headers(message)
-        subject = headers.get('Subject', '')
-        body = email_processor.get_message_body(message)
-
-        # Extract and format signal
-        payload = signal_extractor.extract_and_format(body, subject, message_id)
-
-        if not payload:
-            print(f"Could not extract signal from message {message_id}")
-            return
+@routes.route('/health', methods=['GET'])
+def health():
+    """Health check endpoint; degraded while a Gmail watch is failing to renew or has expired"""
+    pipeline = get_pipeline()
+    watches = pipeline.watch_statuses()
+    body = {
+        'status': 'healthy' if all(w['healthy'] and not w['expired'] for w in watches.values()) else 'degraded',
+        'service': 'Gmail Signal Integration',
+        'watch': watches[pipeline.registry.default.cursor_name]
+    }
 
-        print(f"Extracted signal: {payload['signalID']}")
-        print(f"Signal data: {json.dumps(payload['signal'], indent=2)}")
+    if len(watches) > 1:
+        body['mailboxes'] = watches
 
-        # Forward to API
-        success, response = api_forwarder.send_signal(payload)
+    return jsonify(body), 200
 
-        if success:
-            print(f"Successfully forwarded signal {payload['signalID']}")
-        else:
-            print(f"Failed to forward signal: {response}")
 
-    except Exception as e:
-        print(f"Error processing message {message_id}: {str(e)}")
+@routes.route('/stats', methods=['GET'])
+def stats():
+    """Queue depth and per-stage pipeline latency"""
+    return jsonify(get_pipeline().work_queue.status()), 200
 
 
-@app.route('/health', methods=['GET'])
-def health():
-    """Health check endpoint"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'Gmail Signal Integration'
-    }), 200
+@routes.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline counters and latency histograms in the Prometheus text format (this process only)"""
+    pipeline = get_pipeline()
+    work_queue = pipeline.work_queue
+    gauges = {
+        'queue_depth': (work_queue.depth(), 'Notifications waiting for a worker'),
+        'busy_workers': (work_queue.busy_workers(), 'Workers currently processing a notification'),
+        'watch_renewal_healthy': (
+            all(pipeline.mailbox_state(mailbox).watch_renewer.healthy for mailbox in pipeline.registry),
+            '0 while Gmail watch renewal is failing for any mailbox'
+        ),
+        'log_records_dropped': (dropped_records(), 'Log records dropped because the log queue was full')
+    }
+    return Response(render_metrics(pipeline.stats, gauges), content_type=CONTENT_TYPE)
 
 
-@app.route('/test', methods=['POST'])
+@routes.route('/test', methods=['POST'])
 def test():
     """
     Test endpoint to manually trigger signal processing
@@ -165,10 +163,8 @@ def test():
         if not message_id:
             return jsonify({'error': 'message_id required'}), 400
 
-        gmail_service = gmail_auth.get_service()
-        email_processor = EmailProcessor(gmail_service)
-
-        process_message(message_id, email_processor)
+        pipeline = get_pipeline()
+        pipeline.process_message(message_id, pipeline.get_email_processor())
 
         return jsonify({'status': 'processed', 'message_id': message_id}), 200
 
@@ -177,8 +173,9 @@ def test():
 
 
 def run_webhook_server():
-    """Start the Flask webhook server"""
-    print(f"Starting webhook server on {Config.FLASK_HOST}:{Config.FLASK_PORT}")
+    """Start the webhook on Flask's single-process development server"""
+    app = create_app()
+    logger.info("Starting webhook server on %s:%s", Config.FLASK_HOST, Config.FLASK_PORT)
     app.run(host=Config.FLASK_HOST, port=Config.FLASK_PORT, debug=False)
 
 
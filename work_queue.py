@@ -0,0 +1,261 @@
+import logging
+import queue
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStats:
+    """Thread-safe counters and per-stage latency totals and histograms for the processing pipeline"""
+
+    # Latest samples per stage kept for percentiles
+    SAMPLE_SIZE = 1000
+
+    # Histogram bucket upper bounds in seconds (Prometheus `le`)
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    # Stages measured in minutes rather than milliseconds get wider buckets
+    STAGE_BUCKETS = {
+        'email_to_forward': (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._stages = {}
+
+    def increment(self, name, amount=1):
+        """
+        Increment a named counter
+
+        Args:
+            name: Counter name
+            amount: Amount to add (default: 1)
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record(self, stage, seconds):
+        """
+        Record the latency of one run of a pipeline stage
+
+        Args:
+            stage: Stage name (e.g. 'history', 'fetch', 'extract', 'forward')
+            seconds: Elapsed time in seconds
+        """
+        # Find the bucket outside the lock; the critical section only adds
+        bucket = bisect_left(self.STAGE_BUCKETS.get(stage, self.LATENCY_BUCKETS), seconds)
+
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = self._new_stage(stage)
+            entry['count'] += 1
+            entry['samples'].append(seconds)
+            entry['total'] += seconds
+            entry['last'] = seconds
+            entry['buckets'][bucket] += 1
+            if seconds > entry['max']:
+                entry['max'] = seconds
+
+    def _new_stage(self, stage):
+        """Empty latency entry; buckets has one slot per bound plus +Inf"""
+        return {
+            'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0,
+            'samples': deque(maxlen=self.SAMPLE_SIZE),
+            'buckets': [0] * (len(self.STAGE_BUCKETS.get(stage, self.LATENCY_BUCKETS)) + 1)
+        }
+
+    @contextmanager
+    def time(self, stage):
+        """Context manager that records the elapsed time of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+        Get a point-in-time copy of all counters and stage latencies
+
+        Returns:
+            dict: Counters and per-stage latency in milliseconds, with
+                p50/p90/p99 over the latest SAMPLE_SIZE samples
+        """
+        with self._lock:
+            stages = {}
+            for stage, entry in self._stages.items():
+                count = entry['count']
+                samples = sorted(entry['samples'])
+                stages[stage] = {
+                    'count': count,
+                    'avg_ms': round(entry['total'] / count * 1000, 3) if count else 0.0,
+                    'max_ms': round(entry['max'] * 1000, 3),
+                    'last_ms': round(entry['last'] * 1000, 3),
+                    'p50_ms': self._percentile(samples, 50),
+                    'p90_ms': self._percentile(samples, 90),
+                    'p99_ms': self._percentile(samples, 99)
+                }
+            return {
+                'counters': dict(self._counters),
+                'stages': stages
+            }
+
+    def histograms(self):
+        """
+        Get cumulative latency histograms of every stage
+
+        Cheaper than snapshot(): nothing is sorted, only counts are copied.
+
+        Returns:
+            dict: stage -> {'buckets': [(upper bound in seconds, cumulative
+                count), ...] ending with +Inf, 'sum': seconds, 'count': int}
+        """
+        with self._lock:
+            copies = {
+                stage: (list(entry['buckets']), entry['total'], entry['count'])
+                for stage, entry in self._stages.items()
+            }
+
+        histograms = {}
+        for stage, (buckets, total, count) in copies.items():
+            bounds = self.STAGE_BUCKETS.get(stage, self.LATENCY_BUCKETS) + (float('inf'),)
+            cumulative = 0
+            pairs = []
+            for bound, bucket_count in zip(bounds, buckets):
+                cumulative += bucket_count
+                pairs.append((bound, cumulative))
+            histograms[stage] = {'buckets': pairs, 'sum': total, 'count': count}
+        return histograms
+
+    def counters(self):
+        """
+        Get a copy of all counters
+
+        Returns:
+            dict: Counter name -> value
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    @staticmethod
+    def _percentile(samples, percent):
+        """Nearest-rank percentile of sorted samples, in milliseconds"""
+        if not samples:
+            return 0.0
+        index = max(0, -(-len(samples) * percent // 100) - 1)
+        return round(samples[index] * 1000, 3)
+
+
+class WorkQueue:
+    """Bounded queue of notifications drained by a pool of worker threads"""
+
+    def __init__(self, handler, worker_count=4, max_size=0, stats=None, name='worker'):
+        """
+        Args:
+            handler: Callable invoked with each queued item
+            worker_count: Number of worker threads
+            max_size: Maximum queued items (0 means unbounded)
+            stats: PipelineStats instance for queue counters and latency
+            name: Prefix for worker thread names
+        """
+        self.handler = handler
+        self.worker_count = max(1, int(worker_count))
+        self.stats = stats or PipelineStats()
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_size)
+        self._workers = []
+        self._busy = 0
+        self._busy_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (safe to call more than once)"""
+        with self._start_lock:
+            if self._workers:
+                return
+
+            for index in range(self.worker_count):
+                worker = threading.Thread(
+                    target=self._run,
+                    name=f"{self.name}-{index}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+            logger.info("Started %d %s threads", self.worker_count, self.name)
+
+    def submit(self, item):
+        """
+        Enqueue an item for background processing
+
+        Args:
+            item: Work item passed to the handler
+
+        Returns:
+            bool: True if queued, False if the queue is full
+        """
+        self.start()
+
+        try:
+            self._queue.put_nowait((time.perf_counter(), item))
+        except queue.Full:
+            self.stats.increment('queue_rejected')
+            return False
+
+        self.stats.increment('queue_submitted')
+        return True
+
+    def depth(self):
+        """Number of items waiting to be processed"""
+        return self._queue.qsize()
+
+    def busy_workers(self):
+        """Number of workers currently running the handler"""
+        with self._busy_lock:
+            return self._busy
+
+    def join(self):
+        """Block until every queued item has been processed"""
+        self._queue.join()
+
+    def status(self):
+        """
+        Get queue depth, worker utilisation and pipeline statistics
+
+        Returns:
+            dict: Queue status
+        """
+        status = self.stats.snapshot()
+        status['queue'] = {
+            'depth': self.depth(),
+            'workers': self.worker_count,
+            'busy_workers': self.busy_workers()
+        }
+        return status
+
+    def _run(self):
+        """Worker loop: take items off the queue and run the handler"""
+        while True:
+            enqueued_at, item = self._queue.get()
+            self.stats.record('queue_wait', time.perf_counter() - enqueued_at)
+
+            with self._busy_lock:
+                self._busy += 1
+
+            try:
+                self.handler(item)
+                self.stats.increment('queue_processed')
+            except Exception as e:
+                self.stats.increment('queue_failed')
+                logger.exception("Error in %s handling %s: %s", self.name, item, e)
+            finally:
+                with self._busy_lock:
+                    self._busy -= 1
+                self._queue.task_done()
@@ -0,0 +1,55 @@
+import logging
+from webhook import create_app
+from config import Config
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is only needed for `main.py serve`
+    BaseApplication = None
+
+logger = logging.getLogger(__name__)
+
+
+def run_production_server(workers=None, threads=None, app_factory=create_app):
+    """
+    Serve the webhook under gunicorn with several worker processes
+
+    The app is not preloaded: every worker process calls app_factory after
+    the fork, so each one builds its own pipeline state and threads.
+
+    Args:
+        workers: Worker processes (default: Config.SERVER_WORKERS)
+        threads: Request threads per worker (default: Config.SERVER_THREADS)
+        app_factory: Callable returning the WSGI app (default: webhook.create_app)
+    """
+    if BaseApplication is None:
+        raise RuntimeError("gunicorn is not installed; run `pip install gunicorn` or use `main.py start`")
+
+    options = {
+        'bind': f"{Config.FLASK_HOST}:{Config.FLASK_PORT}",
+        'workers': workers or Config.SERVER_WORKERS,
+        'threads': threads or Config.SERVER_THREADS,
+        'timeout': Config.SERVER_TIMEOUT,
+        'preload_app': False,
+    }
+
+    logger.info("Starting webhook server on %s (%d workers x %d threads)",
+                options['bind'], options['workers'], options['threads'])
+    _GunicornApplication(app_factory, options).run()
+
+
+if BaseApplication is not None:
+    class _GunicornApplication(BaseApplication):
+        """Embedded gunicorn application configured from a dict"""
+
+        def __init__(self, app_factory, options):
+            self.app_factory = app_factory
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.app_factory()